@@ -1,101 +1,567 @@
+import asyncio
+import json
 import logging
-from typing import Any, Dict, Generator
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-import pika
-from fastapi import Depends, FastAPI, HTTPException
+import redis.asyncio
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from opentelemetry import metrics
 from opentelemetry.propagate import inject
-from sqlmodel import Session, select
+from pydantic import ValidationError
+from pydantic_core import from_json
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from core.cache import redis_client
-from core.database import engine
-from core.messaging import RabbitMQConnector
-from core.security import verify_signature
-from core.telemetry import instrument_app, setup_telemetry
-from domains.payment.model import PaymentEvent
-from domains.payment.schemas import WebhookPayload
+from core.admission import make_admission_controller
+from core.async_messaging import AsyncPublisher
+from core.config import (
+    MESSAGE_CONTENT_TYPE,
+    ORDER_STREAM_HEARTBEAT_SECONDS,
+    ORDER_STREAM_MAX_IDS,
+    ORDER_STREAM_MAX_SECONDS,
+    PUBLISHER_POOL_SIZE,
+    REDIS_URL,
+    STARTUP_DB_CONNECTIONS,
+    WEBHOOK_BATCH_MAX_ITEMS,
+)
+from core.database import async_engine, warm_up_async_pool
+from core.health import Readiness
+from core.messaging import payment_routing_key
+from core.security import SignedRoute
+from core.telemetry import (
+    instrument_app,
+    instrument_fastapi,
+    render_metrics,
+    setup_telemetry,
+    timed,
+)
+from domains.payment.codec import encode_payment, message_headers
+from domains.payment.dedupe import WebhookDeduplicator
+from domains.payment.model import PaymentEvent, created_at_of, order_keys_statement
+from domains.payment.schemas import OrderStatusQuery, WebhookPayload
+from domains.payment.status_cache import (
+    FINAL_STATUSES,
+    PENDING_OR_NOT_FOUND,
+    AsyncOrderStatusCache,
+    status_rank,
+)
+from domains.payment.status_stream import OrderStatusHub
 
-setup_telemetry("flowpay-api")
-app = FastAPI()
+meter = metrics.get_meter(__name__)
+webhook_duration = meter.create_histogram(
+    "flowpay.webhook.duration",
+    unit="ms",
+    description="Webhook handling time including the broker confirm",
+)
 
-instrument_app(app, engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # import 時不連任何服務、不初始化 Telemetry，都在這裡做
+    setup_telemetry("flowpay-api")
+    instrument_app(None, async_engine.sync_engine)
 
-# Dependency Injection
-def get_mq_channel() -> Generator[Any, None, None]:
-    # 每次 Request 進來，實例化一個 Connector
-    connector = RabbitMQConnector()
-    connection, channel = connector.connect()
+    # App 啟動時建立一次長連線 Publisher，所有 Request 共用
+    # 整個 API 的 I/O (Broker / Redis / DB) 都在 event loop 上等，不佔 thread
+    publisher = AsyncPublisher(channels=PUBLISHER_POOL_SIZE)
+    app.state.publisher = publisher
+
+    # 暖機在背景跑 (失敗就退避重試)：process 馬上就能回 /healthz，
+    # Broker channel / Redis 好了 /readyz 才回 200
+    readiness = Readiness()
+    readiness.add("broker", publisher.start)
+    readiness.add("redis", redis_client.ping)
+    # 查單用的 DB 連線先開好幾條；DB 掛掉時 Webhook 照收，所以不擋 ready
+    readiness.add(
+        "database",
+        lambda: warm_up_async_pool(async_engine, STARTUP_DB_CONNECTIONS),
+        required=False,
+    )
+    app.state.readiness = readiness
+    warm_up = asyncio.create_task(readiness.run(), name="startup-warm-up")
+    admission.start()
     try:
-        yield channel
+        yield
     finally:
-        # Request 結束後，優雅關閉連線
-        connector.close()
+        warm_up.cancel()
+        try:
+            await warm_up
+        except asyncio.CancelledError:
+            pass
+        admission.stop()
+        await status_hub.close()
+        await publisher.close()
+        await redis_client.aclose()
+        await async_engine.dispose()
 
 
-@app.post("/webhook", tags=["webhook"], dependencies=[Depends(verify_signature)])  # type: ignore
-async def webhook(
-    payload: WebhookPayload,
-    channel: Any = Depends(get_mq_channel),  # noqa: B008
-) -> Dict[str, str]:
-    try:
-        # 1. 序列化訊息
-        message = payload.json()
+app = FastAPI(lifespan=lifespan)
+# redis.asyncio 的連線池：快取、去重、推播共用 (第一個指令進來才連)
+redis_client = redis.asyncio.from_url(REDIS_URL, decode_responses=True)
+status_cache = AsyncOrderStatusCache(redis_client)
+deduplicator = WebhookDeduplicator(redis_client)
+admission = make_admission_controller()
+# 訂單狀態推播：整個 process 共用一條 pub/sub 連線 (第一個訂閱者進來才連)
+status_hub = OrderStatusHub(redis_client)
 
-        headers: Dict[str, Any] = {}
-        inject(headers)
-        properties = pika.BasicProperties(
-            delivery_mode=2,
-            headers=headers,
+# 一定要在 app 收到第一個 ASGI 呼叫之前掛上 (其他 instrumentation 在 lifespan)
+instrument_fastapi(app)
+
+# 上游用來標示商家的 header (優先商家在積壓時照常放行)
+MERCHANT_ID_HEADER = "X-Merchant-Id"
+
+
+def check_admission(request: Request) -> None:
+    """Worker 跟不上時回 429 / 503 + Retry-After，讓上游退避"""
+    decision = admission.check(request.headers.get(MERCHANT_ID_HEADER))
+    if not decision.admitted:
+        logging.warning(
+            f" 🚦 Shedding webhook ({decision.reason}), "
+            f"retry after {decision.retry_after}s"
         )
-        channel.basic_publish(
-            exchange="",
-            routing_key="payment_vents",
-            body=message,
-            properties=properties,
+        raise HTTPException(
+            status_code=decision.status_code,
+            detail="Payment queue is overloaded, retry later",
+            headers={"Retry-After": str(decision.retry_after)},
         )
 
-        # 2. 丟進 Queue
-        channel.basic_publish(
-            exchange="",
-            routing_key="payment_events",
-            body=message,
-            properties=pika.BasicProperties(
-                delivery_mode=2  # 訊息持久化，RabbitMQ重啟不會消失
-            ),
+
+# 需要驗簽的路由 (Webhook)，積壓太多時先擋掉
+signed_router = APIRouter(
+    route_class=SignedRoute,
+    dependencies=[Depends(check_admission)],
+)
+
+
+# Dependency Injection
+def get_publisher(request: Request) -> AsyncPublisher:
+    publisher: AsyncPublisher = request.app.state.publisher
+    if not publisher.ready:
+        # 還在暖機 / Broker 斷線重連中：上游照 Retry-After 重送
+        raise HTTPException(
+            status_code=503,
+            detail="Broker connection is not ready, retry later",
+            headers={"Retry-After": "1"},
         )
+    return publisher
+
+
+def parse_webhook(raw_body: bytes) -> WebhookPayload:
+    """JSON 直接交給 pydantic 解析驗證 (只解析一次)"""
+    try:
+        return WebhookPayload.model_validate_json(raw_body)
+    except ValidationError as err:
+        raise RequestValidationError(err.errors(include_url=False)) from err
+
+
+# body 不走 FastAPI 的參數解析，文件上的 schema 手動補上
+WEBHOOK_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": WebhookPayload.model_json_schema()}},
+    }
+}
+
+
+@signed_router.post("/webhook", tags=["webhook"], openapi_extra=WEBHOOK_OPENAPI)  # type: ignore
+async def webhook(
+    request: Request,
+    publisher: AsyncPublisher = Depends(get_publisher),  # noqa: B008
+) -> Dict[str, str]:
+    with timed(webhook_duration, {"endpoint": "/webhook"}):
+        # SignedRoute 已經讀過 body 並驗完簽，這裡拿到的是同一份 bytes
+        raw_body = await request.body()
+        payload = parse_webhook(raw_body)
+
+        # 0. 重複的 Webhook 直接回目前狀態，不進 Queue
+        #    Redis 出錯時照樣收單 (fail open)：重複的訊息 Worker 端還有冪等保護
+        claimed = True
+        try:
+            known_status = await deduplicator.claim(payload.order_id)
+        except Exception as err:
+            logging.warning(f"⚠️ Dedupe claim failed for {payload.order_id}: {err}")
+            known_status = None
+            claimed = False
+        if known_status is not None:
+            return {"status": "duplicate", "order_status": known_status}
+
+        published = False
+        try:
+            # 1. 編碼訊息 (JSON 時直接沿用驗過簽的原始 bytes，不再重新序列化)
+            message = encode_payment(payload, MESSAGE_CONTENT_TYPE, raw_json=raw_body)
+
+            # 2. 帶上 trace context，依 order_id 丟進對應的 partition
+            #    (等 Broker 確認才回 200)
+            headers = message_headers()
+            inject(headers)
+            await publisher.publish(
+                message,
+                headers,
+                routing_key=payment_routing_key(payload.order_id),
+                content_type=MESSAGE_CONTENT_TYPE,
+            )
+            published = True
+        except Exception as err:
+            logging.error(f"Error: {err}")
+            raise HTTPException(
+                status_code=500, detail="Internal Server Error"
+            ) from err
+        finally:
+            # 沒送進 Queue (出錯或請求被取消)，讓上游重送時可以再進來
+            # release 失敗不能蓋掉原本的例外 (pending key 很快會自己過期)
+            if claimed and not published:
+                try:
+                    await deduplicator.release(payload.order_id)
+                except Exception as err:
+                    logging.warning(
+                        f"⚠️ Dedupe release failed for {payload.order_id}: {err}"
+                    )
+
+        # 3. Broker 已經收下了：標記失敗只記 log，照樣回 received
+        #    (不放掉 claim，上游不會因為我們回 500 又送一次)
+        if claimed:
+            try:
+                await deduplicator.confirm(payload.order_id)
+            except Exception as err:
+                logging.warning(
+                    f"⚠️ Dedupe confirm failed for {payload.order_id}: {err}"
+                )
 
         # logger
-        logging.info(f" [x] Sent {message}")
+        logging.info(f" [x] Sent {payload.order_id}")
         return {"status": "received"}
-    except Exception as err:
-        logging.error(f"Error: {err}")
-        raise HTTPException(status_code=500, detail="Internal Server Error") from err
+
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson")
+
+
+def split_webhook_batch(raw_body: bytes, content_type: str) -> List[Any]:
+    """
+    批次 body -> 每一筆的原始內容
+    NDJSON: 每一行的 bytes (之後可以原封不動送進 Queue)
+    JSON array: 已經解析好的物件
+    """
+    if content_type.split(";", 1)[0].strip() in NDJSON_CONTENT_TYPES:
+        items: List[Any] = [line for line in raw_body.splitlines() if line.strip()]
+    else:
+        try:
+            items = from_json(raw_body)
+        except ValueError as err:
+            raise RequestValidationError(
+                [{"type": "json_invalid", "loc": ("body",), "msg": str(err)}]
+            ) from err
+        if not isinstance(items, list):
+            raise RequestValidationError(
+                [{"type": "list_type", "loc": ("body",), "msg": "Expected an array"}]
+            )
+    if not items or len(items) > WEBHOOK_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch holds between 1 and {WEBHOOK_BATCH_MAX_ITEMS} items",
+        )
+    return items
+
+
+def validate_batch_item(item: Any) -> Tuple[Optional[WebhookPayload], Optional[str]]:
+    try:
+        if isinstance(item, bytes):
+            return WebhookPayload.model_validate_json(item), None
+        return WebhookPayload.model_validate(item), None
+    except ValidationError as err:
+        return None, "; ".join(
+            f"{'.'.join(map(str, e['loc'])) or 'item'}: {e['msg']}"
+            for e in err.errors(include_url=False)
+        )
+
+
+@signed_router.post("/webhook/batch", tags=["webhook"])  # type: ignore
+async def webhook_batch(
+    request: Request,
+    publisher: AsyncPublisher = Depends(get_publisher),  # noqa: B008
+) -> Dict[str, Any]:
+    """
+    批次 Webhook：JSON array 或 NDJSON，整包一個簽名
+    每一筆各自驗證 / 去重 / publish，回傳每一筆的結果 (順序跟請求一樣)
+    """
+    with timed(webhook_duration, {"endpoint": "/webhook/batch"}):
+        raw_body = await request.body()
+        items = split_webhook_batch(raw_body, request.headers.get("content-type", ""))
+        results: List[Dict[str, Any]] = [{"index": i} for i in range(len(items))]
+
+        # 1. 逐筆驗證欄位，壞掉的只影響自己
+        valid: List[Tuple[int, WebhookPayload, Optional[bytes]]] = []
+        for index, item in enumerate(items):
+            payload, error = validate_batch_item(item)
+            if payload is None:
+                results[index].update(status="invalid", error=error)
+                continue
+            raw_json = item if isinstance(item, bytes) else None
+            valid.append((index, payload, raw_json))
+            results[index]["order_id"] = payload.order_id
+
+        # 2. 一個 pipeline 去重 (Redis 出錯時照樣收單，跟單筆 Webhook 一樣)
+        known: List[Optional[str]]
+        try:
+            known = await deduplicator.claim_many(
+                [payload.order_id for _, payload, _ in valid]
+            )
+        except Exception as err:
+            logging.warning(f"⚠️ Dedupe claim failed for batch: {err}")
+            known = [None] * len(valid)
+            valid_claimed = False
+        else:
+            valid_claimed = True
+        fresh = []
+        for (index, payload, raw_json), known_status in zip(valid, known, strict=True):
+            if known_status is None:
+                fresh.append((index, payload, raw_json))
+            else:
+                results[index].update(status="duplicate", order_status=known_status)
+
+        # 3. 全部同時送出，一起等 Broker 確認
+        #    (某一筆失敗，例如在途訊息太多 PublisherBusy，只算那一筆)
+        headers = message_headers()
+        inject(headers)
+        claimed = [payload.order_id for _, payload, _ in fresh] if valid_claimed else []
+        published: List[str] = []
+
+        async def publish_one(
+            payload: WebhookPayload, raw_json: Optional[bytes]
+        ) -> None:
+            message = encode_payment(payload, MESSAGE_CONTENT_TYPE, raw_json=raw_json)
+            await publisher.publish(
+                message,
+                headers,
+                routing_key=payment_routing_key(payload.order_id),
+                content_type=MESSAGE_CONTENT_TYPE,
+            )
+
+        try:
+            outcomes = await asyncio.gather(
+                *(publish_one(payload, raw_json) for _, payload, raw_json in fresh),
+                return_exceptions=True,
+            )
+
+            for (index, payload, _), outcome in zip(fresh, outcomes, strict=True):
+                if isinstance(outcome, BaseException):
+                    logging.error(f"Error: {outcome}")
+                    results[index].update(
+                        status="failed", error="Internal Server Error"
+                    )
+                else:
+                    results[index]["status"] = "received"
+                    published.append(payload.order_id)
+        finally:
+            # 沒送進 Queue 的 (publish 失敗、請求被取消) 放掉去重 key，
+            # 讓上游重送時可以再進來
+            done = set(published)
+            try:
+                await deduplicator.release_many([o for o in claimed if o not in done])
+            except Exception as err:
+                logging.warning(f"⚠️ Dedupe release failed for batch: {err}")
+
+        # 已經送進 Queue 的才標記；失敗只記 log，不影響回給上游的結果
+        if claimed:
+            try:
+                await deduplicator.confirm_many(published)
+            except Exception as err:
+                logging.warning(f"⚠️ Dedupe confirm failed for batch: {err}")
+
+        logging.info(f" [x] Sent batch of {len(published)}/{len(items)}")
+        duplicates = len(valid) - len(fresh)
+        return {
+            "received": len(published),
+            "duplicates": duplicates,
+            "rejected": len(items) - len(published) - duplicates,
+            "results": results,
+        }
+
+
+@app.get("/metrics", include_in_schema=False)  # type: ignore
+def prometheus_metrics() -> Response:
+    """Prometheus scrape endpoint (每個 API process 各自的數字)"""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz", include_in_schema=False)  # type: ignore
+async def healthz() -> Dict[str, str]:
+    """
+    Liveness：event loop 還能回應就好
+    不檢查 Broker / Redis / DB (外部服務掛掉時重啟 API 也沒用)
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz", include_in_schema=False)  # type: ignore
+async def readyz(request: Request, response: Response) -> Dict[str, Any]:
+    """
+    Readiness：啟動暖機做完 (Broker channel、Redis)，而且 Broker 連線還在
+    才回 200；否則 503，load balancer 先不要送流量進來
+    """
+    readiness: Optional[Readiness] = getattr(request.app.state, "readiness", None)
+    publisher: Optional[AsyncPublisher] = getattr(request.app.state, "publisher", None)
+    checks = readiness.status() if readiness is not None else {}
+    ready = readiness is not None and readiness.ready
+    if ready and (publisher is None or not publisher.ready):
+        checks["broker"] = "reconnecting"
+        ready = False
+    if not ready:
+        response.status_code = 503
+    return {"status": "ready" if ready else "starting", "checks": checks}
+
+
+async def find_order_statuses(order_ids: List[str]) -> Dict[str, Dict[str, str]]:
+    """
+    一次 Redis MGET，沒命中的再用一個 IN (...) 查 DB
+    回傳 order_id -> {"order_id", "status", "source"}
+    """
+    results: Dict[str, Dict[str, str]] = {}
+
+    # 1. 先查 Redis
+    cached = await status_cache.get_many(order_ids)
+    for order_id, cached_status in cached.items():
+        if cached_status:
+            results[order_id] = {
+                "order_id": order_id,
+                "status": cached_status,
+                "source": "redis",
+            }
+
+    # 2. 沒命中的一次查 DB：先查 payment_order_keys 拿到 created_at，
+    #    再只掃那些 partition (走 ix_payment_events_order_id)
+    misses = [order_id for order_id in order_ids if order_id not in results]
+    if misses:
+        async with AsyncSession(async_engine) as session:
+            keys = dict((await session.exec(order_keys_statement(misses))).all())
+            found: Dict[str, str] = {}
+            if keys:
+                statement = select(PaymentEvent.order_id, PaymentEvent.status).where(
+                    col(PaymentEvent.order_id).in_(list(keys)),
+                    col(PaymentEvent.created_at).in_(set(keys.values())),
+                )
+                found = dict((await session.exec(statement)).all())
+
+        backfill = []
+        for order_id in misses:
+            status = found.get(order_id, PENDING_OR_NOT_FOUND)
+            results[order_id] = {"order_id": order_id, "status": status, "source": "db"}
+            backfill.append((order_id, status))
+        await status_cache.backfill_many(backfill)
+    return results
+
+
+def sse_event(data: Dict[str, str]) -> str:
+    return f"event: status\ndata: {json.dumps(data)}\n\n"
+
+
+async def order_status_events(order_ids: List[str]) -> AsyncIterator[str]:
+    """
+    先送每筆訂單目前的狀態，之後 Worker 每次狀態變更就推一次
+    全部訂單都到最終狀態 (或連太久) 就結束
+    """
+    async with status_hub.subscribe(order_ids) as updates:
+        # 先訂閱再查現況，中間發生的變更不會漏掉
+        current = await find_order_statuses(order_ids)
+        # 客戶端斷線重連的間隔 (毫秒)
+        yield "retry: 3000\n\n"
+        sent: Dict[str, str] = {}
+        for order_id in order_ids:
+            sent[order_id] = current[order_id]["status"]
+            yield sse_event(current[order_id])
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ORDER_STREAM_MAX_SECONDS
+        while not all(sent[oid] in FINAL_STATUSES for oid in order_ids):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                order_id, status = await asyncio.wait_for(
+                    updates.get(), min(ORDER_STREAM_HEARTBEAT_SECONDS, remaining)
+                )
+            except TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            # 查現況之前就收到的舊狀態不要再送 (狀態只會往前走)
+            if status_rank(status) <= status_rank(sent[order_id]):
+                continue
+            sent[order_id] = status
+            yield sse_event({"order_id": order_id, "status": status, "source": "push"})
+
+
+# 要排在 /orders/{order_id} 前面，不然 "stream" 會被當成 order_id
+@app.get("/orders/stream")  # type: ignore
+async def stream_order_statuses(
+    order_id: List[str] = Query(  # noqa: B008
+        min_length=1, max_length=ORDER_STREAM_MAX_IDS
+    ),
+) -> StreamingResponse:
+    """
+    Server-Sent Events：訂閱一筆或多筆訂單 (?order_id=A&order_id=B)，
+    狀態變更時由 Worker 經 Redis pub/sub 推過來，不用再輪詢
+    """
+    return StreamingResponse(
+        order_status_events(list(dict.fromkeys(order_id))),
+        media_type="text/event-stream",
+        # 不要被 proxy 快取 / 緩衝住
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/orders/{order_id}")  # type: ignore
 async def get_order_status(order_id: str) -> Dict[str, str]:
     """
-    讓使用者輪詢 (Poll) 訂單狀態
+    查詢單筆訂單狀態
+    要持續追蹤狀態的客戶端請改用 GET /orders/stream (SSE 推播)，不要輪詢
     """
     # 1. 先看 Redis 有沒有 Cache (減輕 DB 負擔)
-    # 假設我們在 Worker 成功後有寫入 key: "order_status:{order_id}"
-    # (你需要回去 Worker 補上這個邏輯，或者直接查 Redis 既有的 key)
-    cached_status = redis_client.get(f"order_status:{order_id}")
+    # Worker 每次狀態變更都會寫入 key: "order_status:{order_id}"
+    cached_status = await status_cache.get(order_id)
     if cached_status:
         return {"order_id": order_id, "status": cached_status, "source": "redis"}
 
     # 2. Redis 沒有，才查 DB
-    with Session(engine) as session:
-        statement = select(PaymentEvent).where(PaymentEvent.order_id == order_id)
-        order = session.exec(statement).first()
-
-        if not order:
-            # 可能是還在 Queue 裡排隊，還沒處理到
-            # 或者是根本沒這筆單
-            return {
-                "order_id": order_id,
-                "status": "PENDING_OR_NOT_FOUND",
-                "source": "db",
-            }
+    async with AsyncSession(async_engine) as session:
+        # 先用 payment_order_keys 找到 created_at，只掃那一個 partition
+        statement = select(PaymentEvent.status).where(
+            PaymentEvent.order_id == order_id,
+            PaymentEvent.created_at == created_at_of(order_id),
+        )
+        status = (await session.exec(statement)).first()
+
+    if not status:
+        # 可能是還在 Queue 裡排隊，還沒處理到
+        # 或者是根本沒這筆單 -> 短暫快取，避免一直輪詢打到 DB
+        await status_cache.backfill(order_id, PENDING_OR_NOT_FOUND)
+        return {"order_id": order_id, "status": PENDING_OR_NOT_FOUND, "source": "db"}
+
+    # 回填快取 (版本比 Worker 寫入的舊，不會蓋掉更新的狀態)
+    await status_cache.backfill(order_id, status)
+    return {"order_id": order_id, "status": status, "source": "db"}
+
+
+@app.post("/orders/lookup")  # type: ignore
+async def lookup_order_statuses(
+    query: OrderStatusQuery,
+) -> Dict[str, List[Dict[str, str]]]:
+    """
+    批次查詢訂單狀態 (對帳用)，回傳格式跟 GET /orders/{order_id} 一樣
+    """
+    # 去掉重複的 id，但保留原本順序
+    order_ids = list(dict.fromkeys(query.order_ids))
+    results = await find_order_statuses(order_ids)
+    return {"orders": [results[order_id] for order_id in order_ids]}
+
 
-        return {"order_id": order_id, "status": order.status, "source": "db"}
+app.include_router(signed_router)
@@ -0,0 +1,84 @@
+# apps/bank_sim/main.py
+"""
+本機用的模擬銀行 (測試 / 壓測用)
+啟動: uvicorn apps.bank_sim.main:app --port 8001
+延遲與錯誤率可以用環境變數設定，也可以在執行中用 PUT /admin/config 調整
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+from typing import Dict, Optional
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatorConfig(BaseModel):
+    # 每筆扣款的基本延遲與隨機抖動 (毫秒)
+    latency_ms: float = float(os.getenv("BANK_SIM_LATENCY_MS", "500"))
+    jitter_ms: float = float(os.getenv("BANK_SIM_JITTER_MS", "0"))
+    # 回 503 的機率
+    error_rate: float = float(os.getenv("BANK_SIM_ERROR_RATE", "0.1"))
+    # 卡住不回應的機率 (測 client deadline)
+    hang_rate: float = float(os.getenv("BANK_SIM_HANG_RATE", "0"))
+    hang_seconds: float = float(os.getenv("BANK_SIM_HANG_SECONDS", "30"))
+    # 金額超過這個值就回「餘額不足」(0 = 不限制)
+    funds_limit: int = int(os.getenv("BANK_SIM_FUNDS_LIMIT", "0"))
+
+
+class ChargeRequest(BaseModel):
+    order_id: str
+    amount: int
+
+
+class ConfigUpdate(BaseModel):
+    latency_ms: Optional[float] = None
+    jitter_ms: Optional[float] = None
+    error_rate: Optional[float] = None
+    hang_rate: Optional[float] = None
+    hang_seconds: Optional[float] = None
+    funds_limit: Optional[int] = None
+
+
+config = SimulatorConfig()
+app = FastAPI(title="FlowPay Bank Simulator")
+
+
+def _chance(rate: float) -> bool:
+    return secrets.randbelow(10_000) < rate * 10_000
+
+
+@app.post("/charge")  # type: ignore
+async def charge(request: ChargeRequest) -> Dict[str, str]:
+    jitter = secrets.randbelow(int(config.jitter_ms) + 1)
+    await asyncio.sleep((config.latency_ms + jitter) / 1000)
+
+    if _chance(config.hang_rate):
+        await asyncio.sleep(config.hang_seconds)
+    if _chance(config.error_rate):
+        raise HTTPException(status_code=503, detail="Bank API Timeout")
+    if request.amount < 0:
+        raise HTTPException(status_code=422, detail="Invalid Amount")
+    if config.funds_limit and request.amount > config.funds_limit:
+        raise HTTPException(status_code=402, detail="Insufficient funds")
+
+    logger.info(f"💰 [BankSim] Deducted {request.amount} for {request.order_id}")
+    return {"order_id": request.order_id, "status": "DEDUCTED"}
+
+
+@app.get("/admin/config")  # type: ignore
+async def get_config() -> SimulatorConfig:
+    return config
+
+
+@app.put("/admin/config")  # type: ignore
+async def update_config(update: ConfigUpdate) -> SimulatorConfig:
+    """執行中調整延遲 / 錯誤率，例如模擬銀行當機: {"error_rate": 1.0}"""
+    global config
+    config = config.model_copy(update=update.model_dump(exclude_none=True))
+    logger.warning(f"🏦 [BankSim] Config updated: {config}")
+    return config
@@ -0,0 +1,181 @@
+# apps/callback/main.py
+import logging
+import signal
+import sys
+from concurrent.futures import Future
+from typing import Any, Set
+
+import pika
+from opentelemetry import trace
+from opentelemetry.propagate import extract
+
+from core.aio import BackgroundEventLoop
+from core.config import (
+    CALLBACK_PREFETCH,
+    CALLBACK_QUEUE,
+    METRICS_PORT,
+    RETRY_DELAYS_MS,
+)
+from core.messaging import (
+    RETRY_COUNT_HEADER,
+    BrokerUnavailable,
+    RabbitMQConnector,
+    ThreadSafeChannel,
+    retry_delay_ms,
+    retry_queue_name,
+)
+from core.telemetry import instrument_app, setup_telemetry, start_metrics_server
+from domains.payment.callbacks import (
+    DEFERRED,
+    DELIVERED,
+    RETRY,
+    CallbackDispatcher,
+    decode_callback_task,
+)
+
+tracer = trace.get_tracer(__name__)
+
+# 所有 HTTP 都在這個背景 event loop 上跑，pika 的 I/O 留在主 thread
+event_loop = BackgroundEventLoop(name="callback-loop")
+dispatcher: CallbackDispatcher
+
+
+async def handle_callback(
+    ch: Any, method: Any, properties: Any, body: bytes, queue_name: str
+) -> None:
+    headers = properties.headers or {}
+    ctx = extract(headers)
+    with tracer.start_as_current_span("deliver_callback", context=ctx):
+        try:
+            task = decode_callback_task(body)
+        except Exception as e:
+            logging.error(f" ❌ Malformed callback task: {e}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        outcome = await dispatcher.deliver(
+            task["url"], {"order_id": task["order_id"], "status": task["status"]}
+        )
+
+        if outcome == DELIVERED:
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        elif outcome == DEFERRED:
+            # 丟回 Queue 尾端，把位置讓給其他商家
+            ch.basic_publish(
+                exchange="", routing_key=queue_name, body=body, properties=properties
+            )
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        elif outcome == RETRY and retry_later(ch, method, properties, body, queue_name):
+            return
+        else:
+            logging.warning(" 💀 Moving callback to DLQ...")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+
+def retry_later(
+    ch: Any, method: Any, properties: Any, body: bytes, queue_name: str
+) -> bool:
+    """
+    商家一直失敗：丟進延遲重試佇列 (TTL 到期後 dead-letter 回 callback queue)，
+    等待期間不佔 prefetch；重試佇列每一層都走過了就回傳 False (進 DLQ)
+    """
+    headers = dict(properties.headers or {})
+    attempt = int(headers.get(RETRY_COUNT_HEADER, 0)) + 1
+    if attempt > len(RETRY_DELAYS_MS):
+        return False
+    tier, expiration = retry_delay_ms(attempt)
+    headers[RETRY_COUNT_HEADER] = attempt
+    retry_queue = retry_queue_name(queue_name, tier)
+    logging.warning(
+        f" ⏳ Callback retry #{attempt} in ~{expiration}ms via {retry_queue}"
+    )
+    ch.basic_publish(
+        exchange="",
+        routing_key=retry_queue,
+        body=body,
+        properties=pika.BasicProperties(
+            delivery_mode=2,
+            headers=headers,
+            content_type=properties.content_type,
+            expiration=str(expiration),
+        ),
+    )
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+    return True
+
+
+# 全域變數，控制是否繼續執行
+should_run = True
+
+
+def signal_handler(sig: int, frame: Any) -> None:
+    global should_run
+    logging.warning(
+        f" 🛑 Received shutdown signal ({sig}). Stopping dispatcher gracefully..."
+    )
+    should_run = False
+
+
+def main() -> None:
+    global dispatcher
+
+    # Telemetry 在 main() 才初始化，import 這個模組不會有副作用
+    setup_telemetry("flowpay-callback")
+    instrument_app(None)
+    start_metrics_server(METRICS_PORT)
+    connector = RabbitMQConnector(queue_name=CALLBACK_QUEUE)
+    try:
+        connection, channel = connector.connect()
+    except BrokerUnavailable as e:
+        logging.error(f" ❌ {e}. Exiting.")
+        sys.exit(1)
+    channel.basic_qos(prefetch_count=CALLBACK_PREFETCH)
+    safe_channel = ThreadSafeChannel(connection, channel)
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    event_loop.start()
+    # AsyncClient 要在 event loop 裡建立
+    dispatcher = event_loop.run(_create_dispatcher())
+
+    logging.info(" [*] Callback dispatcher started. Press CTRL+C to exit.")
+
+    in_flight: Set[Future[None]] = set()
+    for method, properties, body in channel.consume(
+        queue=connector.queue_name, inactivity_timeout=1
+    ):
+        if not should_run:
+            break
+        if method is None:
+            continue
+
+        future = event_loop.submit(
+            handle_callback(
+                safe_channel, method, properties, body, connector.queue_name
+            )
+        )
+        in_flight.add(future)
+        future.add_done_callback(in_flight.discard)
+
+    # Graceful drain：停止收新訊息，等手上的 callback 送完 (或放棄)
+    if channel.is_open:
+        channel.cancel()
+    while in_flight:
+        logging.info(f" ⏳ Draining {len(in_flight)} in-flight callbacks...")
+        connection.process_data_events(time_limit=1)
+    connection.process_data_events(time_limit=0)
+
+    logging.info(" 🧹 Closing connections...")
+    event_loop.run(dispatcher.aclose())
+    event_loop.stop()
+    connector.close()
+    logging.info(" 👋 Bye.")
+
+
+async def _create_dispatcher() -> CallbackDispatcher:
+    return CallbackDispatcher()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import logging
+
+# 確保 python path 抓得到 core
+import os
+import sys
+from datetime import datetime, timezone
+from typing import List, Optional
+
+sys.path.insert(0, os.getcwd())
+
+from core.config import (  # noqa: E402
+    PAYMENT_ARCHIVE_DIR,
+    PAYMENT_PARTITION_MONTHS_AHEAD,
+    PAYMENT_RETENTION_MONTHS,
+)
+from core.database import engine  # noqa: E402
+from domains.payment.partitioning import (  # noqa: E402
+    archive_partition,
+    ensure_partitions,
+    is_archived,
+    list_partitions,
+    partitions_to_archive,
+)
+
+# 設定 Log
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Manage monthly payment_events partitions."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ensure = commands.add_parser("ensure", help="預先建好未來幾個月的 partition")
+    ensure.add_argument(
+        "--months-ahead", type=int, default=PAYMENT_PARTITION_MONTHS_AHEAD
+    )
+
+    archive = commands.add_parser(
+        "archive", help="把超過保留期限的月份 detach、匯出成 .csv.gz 再刪掉"
+    )
+    archive.add_argument(
+        "--retention-months",
+        type=int,
+        default=PAYMENT_RETENTION_MONTHS,
+        help="保留這個月跟前幾個月",
+    )
+    archive.add_argument("--output-dir", default=PAYMENT_ARCHIVE_DIR)
+    archive.add_argument("--dry-run", action="store_true", help="只列出會歸檔的月份")
+    archive.add_argument(
+        "--keep-table", action="store_true", help="detach 之後保留 table 不 DROP"
+    )
+    return parser.parse_args(argv)
+
+
+def ensure(args: argparse.Namespace) -> None:
+    created = ensure_partitions(engine, args.months_ahead)
+    logger.info(f" 📅 Created {created} partitions ({args.months_ahead} months ahead)")
+
+
+def archive(args: argparse.Namespace) -> None:
+    today = datetime.now(timezone.utc).date()
+    candidates = partitions_to_archive(
+        list_partitions(engine), today, args.retention_months
+    )
+    if args.keep_table:
+        # --keep-table 留下來的 table 已經歸檔過，不要每次都重新匯出
+        candidates = [p for p in candidates if not is_archived(p, args.output_dir)]
+    if not candidates:
+        logger.info(" ✅ Nothing to archive.")
+        return
+
+    for partition in candidates:
+        if partition.detach_pending:
+            state = "detach pending"
+        else:
+            state = "attached" if partition.attached else "detached"
+        logger.info(f" 🔍 {partition.name} ({state})")
+    if args.dry_run:
+        logger.info(f" 🧪 Dry run: {len(candidates)} partitions would be archived.")
+        return
+
+    for partition in candidates:
+        try:
+            result = archive_partition(
+                engine, partition, args.output_dir, keep_table=args.keep_table
+            )
+        except Exception as e:
+            # 停在這裡，下次重跑會從這個 partition 接著做
+            logger.error(f" ❌ Error archiving {partition.name}: {e}")
+            return
+        logger.info(
+            f" 🎉 Archived {result.rows} rows from {result.name} -> {result.path}"
+        )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "ensure":
+        ensure(args)
+    else:
+        archive(args)
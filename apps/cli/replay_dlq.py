@@ -1,12 +1,27 @@
+import argparse
+import fnmatch
+import json
 import logging
 
 # 確保 python path 抓得到 core
 import os
 import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 sys.path.insert(0, os.getcwd())
 
-from core.messaging import RabbitMQConnector  # noqa: E402
+import pika  # noqa: E402
+
+from core.messaging import (  # noqa: E402
+    REPLAY_HEADER,
+    RETRY_COUNT_HEADER,
+    RabbitMQConnector,
+    payment_routing_key,
+)
+from domains.payment.codec import MessageDecodeError, decode_payment  # noqa: E402
 
 # 設定 Log
 logging.basicConfig(
@@ -14,8 +29,337 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 回放時要拿掉的 dead-letter / 重試標記，讓訊息像新的一樣重新走流程
+_DEATH_HEADERS = (
+    "x-death",
+    "x-first-death-exchange",
+    "x-first-death-queue",
+    "x-first-death-reason",
+    "x-last-death-exchange",
+    "x-last-death-queue",
+    "x-last-death-reason",
+    RETRY_COUNT_HEADER,
+)
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value: str) -> float:
+    """'90s' / '15m' / '2h' / '3d' -> 秒數"""
+    unit = value[-1].lower()
+    if unit in _DURATION_UNITS:
+        return float(value[:-1]) * _DURATION_UNITS[unit]
+    return float(value)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay messages from the DLQ.")
+    parser.add_argument("--prefetch", type=int, default=500)
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="每幾筆等一次 confirm + ACK"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="每秒最多回放幾筆 (0 = 不限)"
+    )
+    parser.add_argument("--limit", type=int, default=0, help="最多回放幾筆")
+    parser.add_argument("--order-pattern", help="order_id 的 glob，例如 'FLASH_*'")
+    parser.add_argument(
+        "--reason",
+        help="進 DLQ 的死因 (rejected / ...) 或 x-last-error 裡的字，例如 Timeout",
+    )
+    parser.add_argument("--older-than", type=parse_duration, help="例如 30m")
+    parser.add_argument("--newer-than", type=parse_duration, help="例如 2h")
+    parser.add_argument("--dry-run", action="store_true", help="只統計，依錯誤原因分組")
+    parser.add_argument("--checkpoint", help="進度檔，中斷後用同一個檔案續跑")
+    return parser.parse_args(argv)
+
+
+# ---------- 訊息解析 / 過濾 ----------
+
+
+def order_id_of(
+    body: bytes,
+    content_type: Optional[str] = None,
+    headers: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
+    try:
+        return decode_payment(body, content_type, headers).order_id
+    except MessageDecodeError:
+        return None
+
+
+def death_time(headers: Dict[str, Any]) -> Optional[datetime]:
+    """訊息第一次死掉的時間 (x-death 由 RabbitMQ 加上，最新的在最前面)"""
+    deaths = headers.get("x-death") or []
+    times = [
+        d["time"]
+        for d in deaths
+        if isinstance(d, dict) and isinstance(d.get("time"), datetime)
+    ]
+    if not times:
+        return None
+    oldest: datetime = min(times)
+    return oldest if oldest.tzinfo else oldest.replace(tzinfo=timezone.utc)
+
+
+def death_reason(headers: Dict[str, Any]) -> str:
+    """
+    訊息被送進 DLQ 那一次的死因 (rejected / ...)
+    走過重試佇列的訊息 x-first-death-reason 是重試佇列 TTL 到期的 expired，
+    所以看 x-death 裡最新一筆不是重試佇列的 (最新的在最前面)
+    """
+    for death in headers.get("x-death") or []:
+        if isinstance(death, dict) and ".retry." not in str(death.get("queue", "")):
+            return str(death.get("reason", "unknown"))
+    return str(
+        headers.get("x-last-death-reason")
+        or headers.get("x-first-death-reason")
+        or "unknown"
+    )
+
+
+def error_reason(headers: Dict[str, Any]) -> str:
+    reason = death_reason(headers)
+    last_error = headers.get("x-last-error")
+    if last_error:
+        reason += f" / {str(last_error)[:80]}"
+    return reason
+
+
+def reason_matches(reason: str, headers: Dict[str, Any]) -> bool:
+    """進 DLQ 的死因完全一樣，或 Worker 記下的錯誤 (x-last-error) 裡有這段字"""
+    if death_reason(headers) == reason:
+        return True
+    return reason in str(headers.get("x-last-error") or "")
+
+
+class ReplayFilter:
+    def __init__(
+        self,
+        order_pattern: Optional[str] = None,
+        reason: Optional[str] = None,
+        older_than: Optional[float] = None,
+        newer_than: Optional[float] = None,
+    ) -> None:
+        self.order_pattern = order_pattern
+        self.reason = reason
+        self.older_than = older_than
+        self.newer_than = newer_than
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+    def matches(
+        self, body: bytes, headers: Dict[str, Any], content_type: Optional[str] = None
+    ) -> bool:
+        if self.order_pattern:
+            order_id = order_id_of(body, content_type, headers)
+            if order_id is None or not fnmatch.fnmatchcase(
+                order_id, self.order_pattern
+            ):
+                return False
+        if self.reason and not reason_matches(self.reason, headers):
+            return False
+        if self.older_than is not None or self.newer_than is not None:
+            died_at = death_time(headers)
+            if died_at is None:
+                return False
+            age = (datetime.now(timezone.utc) - died_at).total_seconds()
+            if self.older_than is not None and age < self.older_than:
+                return False
+            if self.newer_than is not None and age > self.newer_than:
+                return False
+        return True
+
+
+# ---------- Checkpoint ----------
+
+
+class Checkpoint:
+    """
+    回放進度檔：記錄過濾條件與已經處理的數量
+    每個批次等 Broker confirm 完才 ACK 原訊息再存檔，中斷時沒 ACK 的會回到 DLQ，
+    所以續跑不會掉訊息 (confirm 完、ACK 前剛好中斷的那一批會再送一次，
+    Worker 端是冪等的)
+    """
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+        self.state: Dict[str, Any] = {"scanned": 0, "replayed": 0, "skipped": 0}
+
+    def load(self) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            self.state.update(json.load(f))
+        return True
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# ---------- Publisher Confirms ----------
+
+
+class BatchConfirms:
+    """
+    回放用的 publisher confirms：整批 publish 完只等一次
+    pika 的 BlockingChannel.confirm_delivery() 會讓每一次 basic_publish 都停下來
+    等那一筆的 ack；這裡改成在底層 channel 開 confirm mode、自己記 delivery tag，
+    batch 送完再 process_data_events 等到全部 confirm (Broker 會用 multiple=True
+    一次 ack 一串)
+    """
+
+    def __init__(self, channel: Any, timeout: float = 30.0) -> None:
+        self.channel = channel
+        self.timeout = timeout
+        self._next_tag = 0
+        self._unconfirmed: Set[int] = set()
+        self._nacked = 0
+        selected: List[bool] = []
+        channel._impl.confirm_delivery(
+            ack_nack_callback=self._on_confirm,
+            callback=lambda _frame: selected.append(True),
+        )
+        self._wait_until(lambda: bool(selected))
+
+    def publish(self, **kwargs: Any) -> None:
+        self.channel.basic_publish(**kwargs)
+        self._next_tag += 1
+        self._unconfirmed.add(self._next_tag)
+
+    def wait(self) -> None:
+        """等送出去的全部 confirm；有被 Nack 或等太久就拋例外 (呼叫端不要 ACK)"""
+        self._wait_until(lambda: not self._unconfirmed)
+        if self._nacked:
+            nacked, self._nacked = self._nacked, 0
+            raise RuntimeError(f"Broker nacked {nacked} replayed message(s)")
+
+    def _on_confirm(self, frame: Any) -> None:
+        method = frame.method
+        if isinstance(method, pika.spec.Basic.Nack):
+            self._nacked += 1
+        if method.multiple:
+            self._unconfirmed = {
+                tag for tag in self._unconfirmed if tag > method.delivery_tag
+            }
+        else:
+            self._unconfirmed.discard(method.delivery_tag)
+
+    def _wait_until(self, done: Callable[[], bool]) -> None:
+        deadline = time.monotonic() + self.timeout
+        while not done():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Timed out waiting for publisher confirms")
+            self.channel.connection.process_data_events(time_limit=min(remaining, 1))
+
+
+# ---------- Dry Run ----------
+
+
+def dry_run(
+    channel: Any,
+    confirms: BatchConfirms,
+    dlq_name: str,
+    total: int,
+    flt: ReplayFilter,
+    batch_size: int,
+) -> None:
+    """
+    只統計：全部讀一遍、依錯誤原因分組，內容不動
+    在途的訊息受 prefetch 限制，看過的原封不動搬到 DLQ 尾端 (confirm 後才 ACK)，
+    看完一輪順序跟原本一樣；直接 nack(requeue=True) 會放回 Queue 最前面，
+    下一筆又會讀到同一則
+    """
+    groups: Counter[str] = Counter()
+    oldest: Optional[datetime] = None
+    newest: Optional[datetime] = None
+    scanned = 0
+    unacked = 0
+
+    for method, properties, body in channel.consume(dlq_name, inactivity_timeout=2):
+        if method is None:
+            break
+        scanned += 1
+        headers = properties.headers or {}
+        if flt.matches(body, headers, properties.content_type):
+            groups[error_reason(headers)] += 1
+            died_at = death_time(headers)
+            if died_at:
+                oldest = min(oldest or died_at, died_at)
+                newest = max(newest or died_at, died_at)
+        confirms.publish(
+            exchange="", routing_key=dlq_name, body=body, properties=properties
+        )
+        unacked += 1
+        if unacked >= batch_size or scanned >= total:
+            confirms.wait()
+            channel.basic_ack(delivery_tag=method.delivery_tag, multiple=True)
+            unacked = 0
+        if scanned >= total:
+            break
+
+    # 取消 consumer，還沒搬的 (中途沒有新訊息) 會回到 DLQ
+    channel.cancel()
+
+    print("\n📊 DLQ Report")
+    print(f"   Scanned:  {scanned}")
+    print(f"   Matching: {sum(groups.values())}")
+    if oldest and newest:
+        print(f"   Died between {oldest.isoformat()} and {newest.isoformat()}")
+    for reason, count in groups.most_common():
+        print(f"   {count:>8}  {reason}")
+
+
+# ---------- Replay ----------
+
+
+def clean_properties(properties: Any) -> Any:
+    headers = dict(properties.headers or {})
+    for key in _DEATH_HEADERS:
+        headers.pop(key, None)
+    # 讓 Worker 知道這是回放的訊息 (去重鎖是之前自己拿的)
+    headers[REPLAY_HEADER] = True
+    return pika.BasicProperties(
+        delivery_mode=2,
+        headers=headers,
+        content_type=properties.content_type,
+        timestamp=properties.timestamp,
+    )
+
+
+def replay_routing_key(body: bytes, properties: Any, dlq_name: str) -> str:
+    """
+    回放到 order_id 現在對應的 partition (跟 API publish 用同一個 key)
+    解析不出 order_id 的就回到原本的 Queue
+    """
+    order_id = order_id_of(body, properties.content_type, properties.headers)
+    if order_id is None:
+        return dlq_name.removesuffix(".dlq")
+    return payment_routing_key(order_id)
+
+
+def replay(args: argparse.Namespace) -> None:
+    checkpoint = Checkpoint(args.checkpoint)
+    flt = ReplayFilter(
+        args.order_pattern, args.reason, args.older_than, args.newer_than
+    )
+    if checkpoint.load():
+        # 續跑時沿用第一次的過濾條件
+        flt = ReplayFilter(**checkpoint.state["filter"])
+        logger.info(f" ⏯️ Resuming from checkpoint: {checkpoint.state}")
+    checkpoint.state["filter"] = flt.as_dict()
 
-def replay() -> None:
     connector = RabbitMQConnector()
     try:
         connection, channel = connector.connect()
@@ -23,59 +367,131 @@ def replay() -> None:
         logger.error(f"Cannot connect to RabbitMQ: {e}")
         return
 
-    dlq_name = connector.dlq_name  # payment_events.dlq
-    main_queue = connector.queue_name  # payment_events
-
-    # 檢查 DLQ 有多少訊息
-    queue_state = channel.queue_declare(queue=dlq_name, durable=True, passive=True)
-    message_count = queue_state.method.message_count
+    # 檢查每個 DLQ 有多少訊息 (有 partition 時每個 partition 各有一個 DLQ)
+    pending: Dict[str, int] = {}
+    for queue_name in connector.queue_names:
+        dlq_name = f"{queue_name}.dlq"  # payment_events.dlq / payment_events.p3.dlq
+        queue_state = channel.queue_declare(queue=dlq_name, durable=True, passive=True)
+        if queue_state.method.message_count:
+            pending[dlq_name] = queue_state.method.message_count
+    message_count = sum(pending.values())
 
     if message_count == 0:
         logger.info(" ✅ DLQ is empty. Nothing to replay.")
+        checkpoint.clear()
         connector.close()
         return
 
-    logger.info(f" ♻️ Found {message_count} messages in {dlq_name}. Starting replay...")
+    # prefetch 批次讀取；一批 publish 完只等一次 confirm，再一次 ACK 到最後一筆
+    channel.basic_qos(prefetch_count=max(args.prefetch, args.batch_size))
+    confirms = BatchConfirms(channel)
 
-    replayed_count = 0
+    if args.dry_run:
+        try:
+            for dlq_name, count in pending.items():
+                print(f"\n📥 {dlq_name}")
+                dry_run(channel, confirms, dlq_name, count, flt, args.batch_size)
+        except Exception as e:
+            # 沒 ACK 的關掉連線後會回到 DLQ
+            logger.error(f" ❌ Error scanning the DLQ: {e}")
+        connector.close()
+        return
 
-    # 這裡我們用 basic_get 一筆一筆抓，比較安全
-    while True:
-        method, properties, body = channel.basic_get(queue=dlq_name)
+    logger.info(
+        f" ♻️ Found {message_count} messages in {len(pending)} DLQ(s). "
+        "Starting replay..."
+    )
 
-        if method is None:
-            break
+    batch: List[Tuple[int, bool]] = []
+    started = time.monotonic()
+    replayed_this_run = 0
 
-        try:
-            # 1. 重新發送到主 Queue
-            if properties.headers:
-                properties.headers.pop("x-death", None)
-                properties.headers.pop("x-first-death-exchange", None)
-                properties.headers.pop("x-first-death-queue", None)
-                properties.headers.pop("x-first-death-reason", None)
-
-            channel.basic_publish(
-                exchange="", routing_key=main_queue, body=body, properties=properties
-            )
-
-            # 2. 只有發送成功後，才刪除 DLQ 裡的舊資料 (ACK)
-            channel.basic_ack(delivery_tag=method.delivery_tag)
-            replayed_count += 1
-            print(
-                f"\r 🔄 Replayed: {replayed_count}/{message_count}",
-                end="",
-                flush=True,  # noqa: E501
-            )
+    def commit() -> None:
+        """Broker 收下整批之後才 ACK 原訊息 (multiple=True) 並存 checkpoint"""
+        nonlocal batch
+        if not batch:
+            return
+        confirms.wait()
+        channel.basic_ack(delivery_tag=batch[-1][0], multiple=True)
+        checkpoint.state["scanned"] += len(batch)
+        checkpoint.state["replayed"] += sum(1 for _, hit in batch if hit)
+        checkpoint.state["skipped"] += sum(1 for _, hit in batch if not hit)
+        checkpoint.save()
+        batch = []
+        print(
+            f"\r 🔄 Replayed: {checkpoint.state['replayed']} "
+            f"(skipped {checkpoint.state['skipped']}, scanned "
+            f"{checkpoint.state['scanned']})",
+            end="",
+            flush=True,
+        )
 
-        except Exception as e:
-            logger.error(f" ❌ Error replaying message: {e}")
-            # 如果發送失敗，就不要 ACK，讓它留在 DLQ
-            break
+    try:
+        # 續跑時，前一次已經看過的訊息 (不符合條件的被移到 DLQ 尾端) 不算在這次
+        for dlq_name, to_scan in pending.items():
+            if args.limit and replayed_this_run >= args.limit:
+                break
+            scanned = 0
+            for method, properties, body in channel.consume(
+                dlq_name, inactivity_timeout=2
+            ):
+                if method is None:
+                    break
+                scanned += 1
+
+                headers = properties.headers or {}
+                hit = flt.matches(body, headers, properties.content_type)
+                if hit:
+                    # 1. 依 order_id 重新發送到它的 partition
+                    confirms.publish(
+                        exchange="",
+                        routing_key=replay_routing_key(body, properties, dlq_name),
+                        body=body,
+                        properties=clean_properties(properties),
+                    )
+                    replayed_this_run += 1
+                else:
+                    # 不符合條件的移到 DLQ 尾端，保持原本的 headers
+                    confirms.publish(
+                        exchange="",
+                        routing_key=dlq_name,
+                        body=body,
+                        properties=properties,
+                    )
+                batch.append((method.delivery_tag, hit))
+
+                # 2. 一批滿了 (或這個 DLQ 看完了) 才等 confirm + ACK
+                limit_reached = args.limit and replayed_this_run >= args.limit
+                if len(batch) >= args.batch_size or scanned >= to_scan or limit_reached:
+                    commit()
+
+                if scanned >= to_scan or limit_reached:
+                    break
+
+                # 3. 限速，避免一口氣把 Worker 打爆
+                if args.rate and hit:
+                    ahead = replayed_this_run / args.rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+            commit()
+            # 換下一個 DLQ 之前先停掉這個 consumer (還沒讀的 prefetch 會回到 DLQ)
+            channel.cancel()
+
+    except Exception as e:
+        # 沒 ACK 的這一批關掉連線後會回到 DLQ
+        logger.error(f" ❌ Error replaying messages: {e}")
+        connector.close()
+        return
 
     print("\n")
-    logger.info(f" 🎉 Successfully replayed {replayed_count} messages.")
+    logger.info(
+        f" 🎉 Successfully replayed {checkpoint.state['replayed']} messages "
+        f"({checkpoint.state['skipped']} skipped by filters)."
+    )
+    checkpoint.clear()
     connector.close()
 
 
 if __name__ == "__main__":
-    replay()
+    replay(parse_args())
@@ -0,0 +1,128 @@
+import argparse
+import logging
+
+# 確保 python path 抓得到 core
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Sequence
+
+sys.path.insert(0, os.getcwd())
+
+from sqlmodel import Session  # noqa: E402
+
+from core.config import EXPORT_FETCH_SIZE  # noqa: E402
+from core.database import engine  # noqa: E402
+from domains.payment.reporting import (  # noqa: E402
+    daily_summaries,
+    refresh_changed_summaries,
+    refresh_daily_summaries,
+    stream_events,
+    write_csv,
+    write_parquet,
+)
+
+# 設定 Log (輸出到 stderr，export 寫 stdout 時不會混在一起)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Settlement export and reports.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser(
+        "export", help="串流匯出 payment_events (CSV / Parquet)"
+    )
+    export.add_argument("--from", dest="start", type=date.fromisoformat, required=True)
+    export.add_argument(
+        "--to", dest="end", type=date.fromisoformat, help="不含這一天 (預設今天)"
+    )
+    export.add_argument("--status", help="只匯出這個狀態，例如 SUCCESS")
+    export.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    export.add_argument(
+        "--output", default="-", help="輸出檔案 (CSV 可用 - 寫到 stdout)"
+    )
+    export.add_argument("--fetch-size", type=int, default=EXPORT_FETCH_SIZE)
+
+    summarize = commands.add_parser("summarize", help="重算每日彙總")
+    summarize.add_argument(
+        "--since",
+        type=date.fromisoformat,
+        help="從這一天開始整段重算 (預設只重算有變動的日子)",
+    )
+
+    report = commands.add_parser("report", help="從每日彙總表印出對帳報表")
+    report.add_argument("--from", dest="start", type=date.fromisoformat, required=True)
+    report.add_argument("--to", dest="end", type=date.fromisoformat)
+    report.add_argument("--status")
+    return parser.parse_args(argv)
+
+
+def export(args: argparse.Namespace) -> None:
+    end = args.end or today()
+    counted = 0
+
+    def batches() -> Iterator[Sequence[object]]:
+        nonlocal counted
+        for batch in stream_events(
+            engine, args.start, end, args.status, args.fetch_size
+        ):
+            counted += len(batch)
+            yield batch
+        logger.info(f" 📤 Streamed {counted} rows")
+
+    if args.format == "parquet":
+        if args.output == "-":
+            raise SystemExit("Parquet export needs --output <file>")
+        rows = write_parquet(batches(), args.output)
+    elif args.output == "-":
+        rows = write_csv(batches(), sys.stdout)
+    else:
+        with open(args.output, "w", newline="") as f:
+            rows = write_csv(batches(), f)
+    logger.info(f" 🎉 Exported {rows} rows ({args.start} ~ {end}) -> {args.output}")
+
+
+def summarize(args: argparse.Namespace) -> None:
+    if args.since is None:
+        days = refresh_changed_summaries(engine)
+        if days is None:
+            logger.warning(" ⏭️ Another process is refreshing the summaries, skipped.")
+        elif days:
+            logger.info(f" 📊 Refreshed summaries for {len(days)} changed day(s)")
+        else:
+            logger.info(" 📊 No changed days to refresh")
+        return
+    written = refresh_daily_summaries(engine, args.since)
+    if written is None:
+        logger.warning(" ⏭️ Another process is refreshing the summaries, skipped.")
+        return
+    logger.info(f" 📊 Refreshed {written} summary rows since {args.since}")
+
+
+def report(args: argparse.Namespace) -> None:
+    end = args.end or today() + timedelta(days=1)
+    with Session(engine) as session:
+        summaries = daily_summaries(session, args.start, end, args.status)
+    print(f"{'day':<12}{'status':<12}{'count':>12}{'amount':>16}")
+    for row in summaries:
+        print(
+            f"{row.day.isoformat():<12}{row.status:<12}"
+            f"{row.event_count:>12}{row.amount_total:>16}"
+        )
+    print(
+        f"{'total':<24}{sum(r.event_count for r in summaries):>12}"
+        f"{sum(r.amount_total for r in summaries):>16}"
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    {"export": export, "summarize": summarize, "report": report}[args.command](args)
@@ -1,43 +1,167 @@
 # apss/worker/main.py
-import json
 import logging
 import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import timedelta
-from typing import Any
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from opentelemetry import trace
+import pika
+from opentelemetry import metrics, trace
 from opentelemetry.propagate import extract
+from opentelemetry.trace import Link
 
+from apps.worker.partitions import PartitionLeases
 from core.cache import redis_client
-from core.database import engine
-from core.messaging import RabbitMQConnector
-from core.telemetry import instrument_app, setup_telemetry
+from core.config import (
+    CALLBACK_QUEUE,
+    METRICS_PORT,
+    PARTITION_REBALANCE_INTERVAL_SECONDS,
+    PAYMENT_PARTITION_ENSURE_INTERVAL_SECONDS,
+    PAYMENT_SUMMARY_REFRESH_SECONDS,
+    RETRY_DELAYS_MS,
+    STARTUP_DB_CONNECTIONS,
+    WORKER_BATCH_SIZE,
+    WORKER_BATCH_WAIT_MS,
+    WORKER_CONCURRENCY,
+    WORKER_HEALTH_FILE,
+    WORKER_PREFETCH,
+)
+from core.database import engine, warm_up_pool
+from core.health import HealthFile
+from core.messaging import (
+    PAYMENT_EVENTS_QUEUE,
+    REPLAY_HEADER,
+    RETRY_COUNT_HEADER,
+    BrokerUnavailable,
+    PublisherPool,
+    RabbitMQConnector,
+    ThreadSafeChannel,
+    partition_of,
+    payment_queue_names,
+    retry_delay_ms,
+    retry_queue_name,
+)
+from core.profiling import profile_message, stage
+from core.telemetry import (
+    instrument_app,
+    setup_telemetry,
+    start_metrics_server,
+)
+from domains.payment.codec import decode_properties
+from domains.payment.partitioning import ensure_partitions
+from domains.payment.reporting import refresh_changed_summaries
 from domains.payment.service import PaymentService
+from domains.payment.status_cache import OrderStatusCache
 
 # 實例化 Service (Singleton)
-payment_service = PaymentService()
+# Callback 只丟進 Queue (第一次 publish 才連線)，不在支付流程裡等商家回應
+callback_publisher = PublisherPool(size=1, queue_name=CALLBACK_QUEUE)
+payment_service = PaymentService(
+    status_cache=OrderStatusCache(redis_client),
+    callback_publisher=callback_publisher,
+)
 
-# 1. 初始化 Worker 的 Telemetry
-setup_telemetry("flowpay-worker")
-# Worker 沒有 FastAPI app，所以傳 None，但要監控 DB/Redis/MQ
-instrument_app(None, engine)
+# 開始消費後每秒更新，k8s 用 exec probe 檢查 (Worker 沒有 HTTP API)
+health_file = HealthFile(WORKER_HEALTH_FILE)
 
 tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+
+retried_counter = meter.create_counter(
+    "flowpay.worker.retried", description="Messages sent to a delayed retry queue"
+)
+dead_lettered_counter = meter.create_counter(
+    "flowpay.worker.dead_lettered", description="Messages moved to the DLQ"
+)
+
+
+def is_permanent_error(error: BaseException) -> bool:
+    """格式錯誤 / 資料不合法：重試幾次都一樣，直接進 DLQ"""
+    return isinstance(error, (ValueError, KeyError, TypeError))
+
+
+def retry_count(properties: Any) -> int:
+    headers = (properties.headers if properties else None) or {}
+    return int(headers.get(RETRY_COUNT_HEADER, 0))
+
+
+def is_final_attempt(properties: Any) -> bool:
+    """重試次數已經用完，這次再失敗就進 DLQ"""
+    return retry_count(properties) >= len(RETRY_DELAYS_MS)
+
+
+def is_redelivery(properties: Any) -> bool:
+    """重試 / 從 DLQ 回放的訊息：Redis 去重鎖是自己之前拿的，不能當成重複"""
+    headers = (properties.headers if properties else None) or {}
+    return retry_count(properties) > 0 or bool(headers.get(REPLAY_HEADER))
+
+
+def retry_or_dead_letter(
+    ch: Any, method: Any, properties: Any, body: bytes, error: BaseException
+) -> None:
+    """
+    暫時性錯誤 -> 丟進延遲重試佇列 (exponential backoff + jitter)，之後自動回主 Queue
+    永久性錯誤 / 重試次數用完 -> NACK 進 DLQ
+    """
+    attempt = retry_count(properties) + 1
+    if is_permanent_error(error) or attempt > len(RETRY_DELAYS_MS):
+        logging.warning(" 💀 Moving message to DLQ...")
+        reason = "permanent" if is_permanent_error(error) else "exhausted"
+        dead_lettered_counter.add(1, {"reason": reason})
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return
+
+    tier, expiration = retry_delay_ms(attempt)
+    headers = dict((properties.headers if properties else None) or {})
+    headers[RETRY_COUNT_HEADER] = attempt
+    headers["x-last-error"] = repr(error)[:200]
+    # 訊息回到它原本的 Queue (直接發到 Queue 時 routing_key 就是 Queue 名稱)
+    home_queue = method.routing_key or PAYMENT_EVENTS_QUEUE
+    retry_queue = retry_queue_name(home_queue, tier)
+    logging.warning(f" ⏳ Retry #{attempt} in ~{expiration}ms via {retry_queue}")
+    ch.basic_publish(
+        exchange="",
+        routing_key=retry_queue,
+        body=body,
+        properties=pika.BasicProperties(
+            delivery_mode=2,
+            headers=headers,
+            content_type=properties.content_type if properties else None,
+            expiration=str(expiration),
+        ),
+    )
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+    retried_counter.add(1, {"tier": str(tier)})
 
 
 def process_message(ch: Any, method: Any, properties: Any, body: bytes) -> None:
     # 從 RabbitMQ 的 headers 裡把 trace_id 拿出來
     headers = properties.headers or {}
     ctx = extract(headers)
-    with tracer.start_as_current_span("process_payment_task", context=ctx):
+    with (
+        tracer.start_as_current_span("process_payment_task", context=ctx),
+        profile_message() as profile,
+    ):
         try:
-            data = json.loads(body)
-            order_id = data.get("order_id")
+            # 欄位缺少 / 型別錯誤會拋 MessageDecodeError -> 直接進 DLQ
+            with stage("decode"):
+                payload = decode_properties(body, properties)
+            order_id = payload.order_id
+            profile.label = order_id
             lock_key = f"processed:{order_id}"
+            redelivered = is_redelivery(properties)
 
             # 如果 key 不存在 -> 寫入成功，回傳 True -> 代表我是第一個，繼續執行
             # 如果 key 已存在 -> 寫入失敗，回傳 None -> 代表有人搶先了，直接 ACK
-            is_first = redis_client.set(lock_key, "1", nx=True, ex=timedelta(hours=24))
+            # (重試的訊息鎖本來就是自己的，不用再搶)
+            with stage("dedupe"):
+                is_first = redelivered or redis_client.set(
+                    lock_key, "1", nx=True, ex=timedelta(hours=24)
+                )
 
             if not is_first:
                 logging.info(f" ♻️ [Redis] Order {order_id} locked/processed. Skipping.")
@@ -47,12 +171,15 @@ def process_message(ch: Any, method: Any, properties: Any, body: bytes) -> None:
             # [核心] 呼叫業務邏輯層
             # Worker 不應該知道 DB 怎麼連，也不應該知道怎麼扣款
             # 它只管 Service 執行成不成功
-            success = payment_service.process_payment(
-                order_id=order_id,
-                amount=data.get("amount"),
-                status=data.get("status"),
-                callback_url=data.get("callback_url"),
-            )
+            with stage("process"):
+                success = payment_service.process_payment(
+                    order_id=order_id,
+                    amount=payload.amount,
+                    status=payload.status,
+                    callback_url=payload.callback_url,
+                    resume=redelivered,
+                    final_attempt=is_final_attempt(properties),
+                )
 
             # 業務邏輯成功 (包含扣款成功 或 扣款失敗但已紀錄)
             if success:
@@ -61,12 +188,97 @@ def process_message(ch: Any, method: Any, properties: Any, body: bytes) -> None:
 
         except Exception as e:
             logging.error(f" ❌ System Error: {e}")
-            # 決定重試策略：
-            # 如果是 ConnectionError，也許可以 NACK requeue=True (這需要更細的判斷)
-            # 這裡我們先統一進 DLQ
-            logging.warning(" 💀 Moving message to DLQ...")
             trace.get_current_span().record_exception(e)
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            retry_or_dead_letter(ch, method, properties, body, e)
+
+
+# 一筆從 MQ 收到的訊息: (method, properties, body)
+Delivery = Tuple[Any, Any, bytes]
+
+
+def process_batch(ch: Any, deliveries: List[Delivery]) -> None:
+    """
+    批次處理多筆訊息
+    - Redis pipeline 一次做完所有 SETNX 去重
+    - PaymentService 用 bulk INSERT / UPDATE 寫 DB
+    - 成功的用一個 basic_ack(multiple=True) 確認整批
+    """
+    links = [
+        Link(trace.get_current_span(extract(p.headers or {})).get_span_context())
+        for _, p, _ in deliveries
+        if p is not None
+    ]
+    with (
+        tracer.start_as_current_span("process_payment_batch", links=links) as span,
+        profile_message(f"batch-{len(deliveries)}", mode="batch"),
+    ):
+        span.set_attribute("flowpay.batch.size", len(deliveries))
+        failed: Dict[int, BaseException] = {}
+        payments: Dict[str, Dict[str, Any]] = {}
+        tags: Dict[str, List[int]] = {}
+        redelivered: Set[str] = set()
+
+        # 1. 解析訊息，格式錯誤的直接進 DLQ
+        with stage("decode"):
+            for method, properties, body in deliveries:
+                try:
+                    data = decode_properties(body, properties).model_dump()
+                    order_id = data["order_id"]
+                except Exception as e:
+                    logging.error(f" ❌ Malformed message: {e}")
+                    failed[method.delivery_tag] = e
+                    continue
+                tags.setdefault(order_id, []).append(method.delivery_tag)
+                if order_id not in payments:
+                    data["resume"] = is_redelivery(properties)
+                    data["final_attempt"] = is_final_attempt(properties)
+                    payments[order_id] = data
+                if payments[order_id]["resume"]:
+                    redelivered.add(order_id)
+
+        try:
+            # 2. 去重：一次 round-trip 送出所有 SETNX (重試的訊息不用)
+            fresh = [order_id for order_id in payments if order_id not in redelivered]
+            pipe = redis_client.pipeline(transaction=False)
+            for order_id in fresh:
+                pipe.set(f"processed:{order_id}", "1", nx=True, ex=timedelta(hours=24))
+            with stage("dedupe"):
+                first_flags = pipe.execute()
+            for order_id, is_first in zip(fresh, first_flags, strict=True):
+                if not is_first:
+                    logging.info(
+                        f" ♻️ [Redis] Order {order_id} locked/processed. Skipping."
+                    )
+                    del payments[order_id]
+
+            # 3. 批次支付
+            with stage("process"):
+                results = payment_service.process_payments_batch(
+                    list(payments.values())
+                )
+            for order_id, error in results.items():
+                if error is not None:
+                    trace.get_current_span().record_exception(error)
+                    failed.update(dict.fromkeys(tags[order_id], error))
+
+        except Exception as e:
+            logging.error(f" ❌ System Error: {e}")
+            trace.get_current_span().record_exception(e)
+            # 整批沒辦法確定結果，全部走重試
+            failed = {method.delivery_tag: e for method, _, _ in deliveries}
+
+        # 4. 失敗的逐筆重試 / 進 DLQ，其餘用一個 multiple ack 確認
+        with stage("ack"):
+            succeeded_tags = []
+            for method, properties, body in deliveries:
+                if method.delivery_tag in failed:
+                    failure = failed[method.delivery_tag]
+                    retry_or_dead_letter(ch, method, properties, body, failure)
+                else:
+                    succeeded_tags.append(method.delivery_tag)
+            if succeeded_tags:
+                # 已經 ack / nack 過的 tag 不會被重複確認
+                ch.basic_ack(delivery_tag=max(succeeded_tags), multiple=True)
 
 
 # -------------------------------------------------------------
@@ -86,26 +298,24 @@ def signal_handler(sig: int, frame: Any) -> None:
     # 我們透過 flag 控制
 
 
-def main() -> None:
-    connector = RabbitMQConnector()
-    connection, channel = connector.connect()
-    channel.basic_qos(prefetch_count=1)
-
-    # 註冊信號監聽
-    signal.signal(signal.SIGINT, signal_handler)  # Ctrl+C
-    signal.signal(signal.SIGTERM, signal_handler)  # Docker stop
+def stopping(stop: Optional[threading.Event] = None) -> bool:
+    """整個 worker 要關機，或這個 partition 要交給別的 worker"""
+    return not should_run or (stop is not None and stop.is_set())
 
-    logging.info(" [*] Worker started. Press CTRL+C to exit.")
 
+def consume_serially(
+    channel: Any, queue_name: str, stop: Optional[threading.Event] = None
+) -> None:
     # 使用 generator 或是手動迴圈來消費，這樣才能控制停止
     # 注意：pika 的 start_consuming 是阻塞的，要做到 Graceful Shutdown
     # 最好改用 consume generator
 
     for method, properties, body in channel.consume(
-        queue=connector.queue_name, inactivity_timeout=1
+        queue=queue_name, inactivity_timeout=1
     ):
-        if not should_run:
+        if stopping(stop):
             break
+        health_file.beat()
 
         if method is None:
             # timeout，沒訊息，繼續迴圈檢查 should_run
@@ -114,14 +324,350 @@ def main() -> None:
         # 呼叫你的處理邏輯
         process_message(channel, method, properties, body)
 
-    # 迴圈結束，開始清理資源
-    logging.info(" 🧹 Closing connections...")
+
+def order_lane(body: bytes, properties: Any, lanes: int) -> int:
+    """
+    同一筆訂單永遠分到同一條 lane (解析不出 order_id 的用 body，反正會進 DLQ)
+    key 加上前綴再算：partition 本身也是用 order_id 的 crc32 分的，
+    不加的話 lane 數跟 partition 數有公因數時，一個 partition 只會用到幾條 lane
+    """
+    try:
+        order_id = decode_properties(body, properties).order_id
+    except Exception:
+        order_id = body.hex()
+    return partition_of(f"lane:{order_id}", lanes)
+
+
+def consume_concurrently(
+    connection: Any,
+    channel: Any,
+    queue_name: str,
+    concurrency: int,
+    stop: Optional[threading.Event] = None,
+    ordered: bool = False,
+) -> None:
+    """
+    同時處理多筆訊息 (Thread Pool)
+    - I/O (收訊息、ack/nack、heartbeat) 都留在目前這個 thread
+    - process_message 在 Thread Pool 執行，ack/nack 透過 ThreadSafeChannel 排回來
+    - ordered=True (partition 模式)：開 concurrency 條單 thread 的 lane，
+      依 order_id 分配，同一筆訂單的事件照收到的順序一筆一筆處理，
+      不同訂單之間還是並行 (代價是同一條 lane 上慢的訂單會擋住後面的)
+    """
+    safe_channel = ThreadSafeChannel(connection, channel)
+    in_flight: Set[Future[None]] = set()
+
+    with ExitStack() as stack:
+        if ordered:
+            lanes = [
+                stack.enter_context(
+                    ThreadPoolExecutor(
+                        max_workers=1, thread_name_prefix=f"payment-lane-{i}"
+                    )
+                )
+                for i in range(concurrency)
+            ]
+        else:
+            lanes = [
+                stack.enter_context(
+                    ThreadPoolExecutor(
+                        max_workers=concurrency, thread_name_prefix="payment-worker"
+                    )
+                )
+            ]
+
+        for method, properties, body in channel.consume(
+            queue=queue_name, inactivity_timeout=1
+        ):
+            if stopping(stop):
+                break
+            health_file.beat()
+
+            if method is None:
+                continue
+
+            executor = (
+                lanes[order_lane(body, properties, concurrency)]
+                if ordered
+                else lanes[0]
+            )
+            future = executor.submit(
+                process_message, safe_channel, method, properties, body
+            )
+            in_flight.add(future)
+            future.add_done_callback(in_flight.discard)
+
+        # Graceful drain：先停止收新訊息 (還沒交給我們的會被 requeue)
+        if channel.is_open:
+            requeued = channel.cancel()
+            logging.info(f" ⏸️ Stopped consuming ({requeued} prefetched requeued).")
+
+        # 等手上的交易處理完；期間持續跑 I/O，ack 才送得出去
+        while in_flight:
+            logging.info(f" ⏳ Draining {len(in_flight)} in-flight payments...")
+            connection.process_data_events(time_limit=1)
+
+    # 把最後一批 ack 送出去
+    connection.process_data_events(time_limit=0)
+
+
+def consume_in_batches(
+    channel: Any,
+    queue_name: str,
+    batch_size: int,
+    wait_ms: float,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """
+    Batch consume：湊滿 batch_size 筆，或第一筆等超過 wait_ms 就整批處理
+    """
+    batch: List[Delivery] = []
+    deadline = 0.0
+
+    for method, properties, body in channel.consume(
+        queue=queue_name, inactivity_timeout=min(wait_ms / 1000, 1)
+    ):
+        health_file.beat()
+        if method is not None:
+            if not batch:
+                deadline = time.monotonic() + wait_ms / 1000
+            batch.append((method, properties, body))
+
+        if batch and (len(batch) >= batch_size or time.monotonic() >= deadline):
+            process_batch(channel, batch)
+            batch = []
+
+        if stopping(stop) and not batch:
+            break
+
+    # 還沒處理的訊息不 ACK，關閉連線後會自動 requeue
+
+
+def consume(
+    connection: Any,
+    channel: Any,
+    queue_name: str,
+    stop: Optional[threading.Event] = None,
+    ordered: bool = False,
+) -> None:
+    """ordered=True：同一筆訂單的事件要照順序處理 (partition 模式)"""
+    if WORKER_BATCH_SIZE > 1:
+        consume_in_batches(
+            channel, queue_name, WORKER_BATCH_SIZE, WORKER_BATCH_WAIT_MS, stop
+        )
+    elif WORKER_CONCURRENCY > 1:
+        consume_concurrently(
+            connection, channel, queue_name, WORKER_CONCURRENCY, stop, ordered
+        )
+    else:
+        consume_serially(channel, queue_name, stop)
+
+
+def open_consumer(queue_name: str) -> Tuple[RabbitMQConnector, Any, Any]:
+    connector = RabbitMQConnector(queue_name=queue_name)
+    connection, channel = connector.connect()
+    channel.basic_qos(
+        prefetch_count=max(WORKER_PREFETCH, WORKER_CONCURRENCY, WORKER_BATCH_SIZE)
+    )
+    return connector, connection, channel
+
+
+def close_consumer(connector: RabbitMQConnector, channel: Any) -> None:
     try:
         if channel.is_open:
             channel.cancel()  # 告訴 MQ 我不收了
         connector.close()
     except Exception:
         logging.info(" 🧹 Connection already closed.")
+
+
+def consume_partition(queue_name: str, stop: threading.Event) -> None:
+    """
+    一個 partition 一條連線 / 一個 thread，消費模式跟單一 Queue 一樣；
+    WORKER_CONCURRENCY > 1 時依 order_id 分 lane，同一筆訂單還是照順序
+    """
+    connector, connection, channel = open_consumer(queue_name)
+    logging.info(f" 📦 Consuming partition {queue_name}")
+    try:
+        consume(connection, channel, queue_name, stop, ordered=True)
+    finally:
+        close_consumer(connector, channel)
+        logging.info(f" 📦 Released partition {queue_name}")
+
+
+def consume_partitions(queue_names: List[str]) -> None:
+    """
+    Partition 模式：用 Redis lease 認領一部分 partition，每個 partition 一個 consumer
+    定期續約 / 重新平衡：worker 加入或掛掉時，partition 會在 worker 之間移動
+    """
+    leases = PartitionLeases(redis_client, queue_names)
+    consumers: Dict[str, Tuple[threading.Thread, threading.Event]] = {}
+
+    def stop_consumer(queue_name: str) -> None:
+        thread, stop = consumers.pop(queue_name)
+        stop.set()
+        thread.join()
+        # consumer 停了 (手上的訊息都 ack / requeue 了) 才放掉 lease
+        try:
+            leases.release(queue_name)
+        except Exception as e:
+            logging.warning(f" ⚠️ Cannot release partition lease {queue_name}: {e}")
+
+    while should_run:
+        try:
+            wanted = leases.rebalance()
+            # 認領不到 partition (worker 比 partition 多) 也算健康
+            health_file.beat()
+        except Exception as e:
+            # Redis 暫時連不上：先照舊消費 (single-active-consumer 保證不會重疊)
+            logging.warning(f" ⚠️ Partition rebalance failed: {e}")
+            wanted = set(consumers)
+
+        # 連線斷掉而結束的 consumer，下一輪重新啟動
+        for queue_name, (thread, _) in list(consumers.items()):
+            if not thread.is_alive():
+                consumers.pop(queue_name)
+        for queue_name in sorted(set(consumers) - wanted):
+            stop_consumer(queue_name)
+        for queue_name in sorted(wanted - set(consumers)):
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=consume_partition,
+                args=(queue_name, stop),
+                name=f"consumer-{queue_name}",
+                daemon=True,
+            )
+            thread.start()
+            consumers[queue_name] = (thread, stop)
+
+        deadline = time.monotonic() + PARTITION_REBALANCE_INTERVAL_SECONDS
+        while should_run and time.monotonic() < deadline:
+            time.sleep(0.2)
+
+    for queue_name in list(consumers):
+        stop_consumer(queue_name)
+    try:
+        leases.release_all()
+    except Exception as e:
+        logging.warning(f" ⚠️ Cannot release partition leases: {e}")
+
+
+def wait_while_running(seconds: float) -> bool:
+    """睡 seconds 秒 (收到關機信號就提早醒來)，回傳 worker 是否還在跑"""
+    deadline = time.monotonic() + seconds
+    while should_run and time.monotonic() < deadline:
+        time.sleep(0.2)
+    return should_run
+
+
+def ensure_payment_partitions() -> None:
+    """補建接下來幾個月的 partition (沒建到只是少了預建，這個月的早就存在)"""
+    try:
+        created = ensure_partitions(engine)
+        if created:
+            logging.info(f" 📅 Created {created} payment_events partitions")
+    except Exception as e:
+        logging.warning(f" ⚠️ Could not ensure payment_events partitions: {e}")
+
+
+def ensure_partitions_periodically() -> None:
+    """
+    payment_events 沒有 DEFAULT partition：跑超過 PAYMENT_PARTITION_MONTHS_AHEAD
+    個月不重啟的 worker 也要繼續預建，不然 INSERT 會找不到 partition
+    """
+    while wait_while_running(PAYMENT_PARTITION_ENSURE_INTERVAL_SECONDS):
+        ensure_payment_partitions()
+
+
+# 整個 cluster 每個間隔只讓一個 worker 重算彙總
+SUMMARY_REFRESH_KEY = "payment_summaries:refresh"
+
+
+def refresh_summaries_once() -> None:
+    """
+    重算有變動的日子的每日彙總 (payment_daily_summaries)
+    先搶 Redis 上的節流 key，這個間隔已經有別的 worker 算過就跳過，
+    不會每個 worker 每一輪都去掃 payment_events
+    """
+    try:
+        if not redis_client.set(
+            SUMMARY_REFRESH_KEY,
+            "1",
+            nx=True,
+            px=int(PAYMENT_SUMMARY_REFRESH_SECONDS * 1000),
+        ):
+            return
+        days = refresh_changed_summaries(engine)
+        if days:
+            logging.info(
+                f" 📊 Refreshed daily summaries for {len(days)} day(s) "
+                f"({days[0]} ~ {days[-1]})"
+            )
+    except Exception as e:
+        logging.warning(f" ⚠️ Daily summary refresh failed: {e}")
+
+
+def refresh_summaries_periodically() -> None:
+    while wait_while_running(PAYMENT_SUMMARY_REFRESH_SECONDS):
+        refresh_summaries_once()
+
+
+def main() -> None:
+    # 1. 初始化 Worker 的 Telemetry (在 main() 才做，import 這個模組沒有副作用)
+    setup_telemetry("flowpay-worker")
+    # Worker 沒有 FastAPI app，所以傳 None，但要監控 DB/Redis/MQ
+    instrument_app(None, engine)
+    # Prometheus 從這個 port 拉 metrics
+    start_metrics_server(METRICS_PORT)
+
+    # 註冊信號監聽
+    signal.signal(signal.SIGINT, signal_handler)  # Ctrl+C
+    signal.signal(signal.SIGTERM, signal_handler)  # Docker stop
+
+    # 先開好 DB 連線放進 pool，第一批訊息不用等連線 (連不上就等訊息來了再連)
+    try:
+        warm_up_pool(engine, max(STARTUP_DB_CONNECTIONS, WORKER_CONCURRENCY))
+    except Exception as e:
+        logging.warning(f" ⚠️ Could not pre-open DB connections: {e}")
+
+    # 先把接下來幾個月的 partition 建好，之後定期補建
+    ensure_payment_partitions()
+    if PAYMENT_PARTITION_ENSURE_INTERVAL_SECONDS > 0:
+        threading.Thread(
+            target=ensure_partitions_periodically, name="partitions", daemon=True
+        ).start()
+
+    if PAYMENT_SUMMARY_REFRESH_SECONDS > 0:
+        threading.Thread(
+            target=refresh_summaries_periodically, name="daily-summaries", daemon=True
+        ).start()
+
+    queue_names = payment_queue_names()
+    logging.info(
+        f" [*] Worker started (concurrency={WORKER_CONCURRENCY}, "
+        f"batch={WORKER_BATCH_SIZE}, partitions={len(queue_names)}). "
+        "Press CTRL+C to exit."
+    )
+
+    try:
+        if len(queue_names) > 1:
+            consume_partitions(queue_names)
+        else:
+            connector, connection, channel = open_consumer(PAYMENT_EVENTS_QUEUE)
+            consume(connection, channel, connector.queue_name)
+            # 迴圈結束，開始清理資源
+            logging.info(" 🧹 Closing connections...")
+            close_consumer(connector, channel)
+    except BrokerUnavailable as e:
+        logging.error(f" ❌ {e}. Exiting.")
+        sys.exit(1)
+    finally:
+        health_file.clear()
+
+    try:
+        callback_publisher.close()
+    except Exception:
+        logging.info(" 🧹 Connection already closed.")
     logging.info(" 👋 Bye.")
 
 
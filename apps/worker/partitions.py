@@ -0,0 +1,120 @@
+# apps/worker/partitions.py
+import logging
+import math
+import os
+import secrets
+import socket
+import time
+from typing import Any, List, Optional, Set
+
+from core.config import PARTITION_LEASE_TTL_SECONDS
+from core.messaging import PAYMENT_EVENTS_QUEUE, partition_of
+
+logger = logging.getLogger(__name__)
+
+# 是自己的 lease 才續約 / 才刪掉 (過期後被別人拿走的不能動)
+_RENEW = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def partition_lease_key(queue_name: str) -> str:
+    return f"partition_lease:{queue_name}"
+
+
+def partition_workers_key(queue_name: str = PAYMENT_EVENTS_QUEUE) -> str:
+    return f"partition_workers:{queue_name}"
+
+
+class PartitionLeases:
+    """
+    Worker 用 Redis lease 認領 partition (partition_lease:{queue} = worker_id)
+    - 每個 worker 定期在 partition_workers 登記心跳，
+      份額 = ceil(partition 數 / 活著的 worker 數)
+    - 手上的 lease 續約；不夠份額就去搶沒人拿的，超過份額的交給 caller 放掉
+    - worker 掛掉沒續約，lease 過期後由其他 worker 接手
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        queue_names: List[str],
+        worker_id: Optional[str] = None,
+        ttl_seconds: float = PARTITION_LEASE_TTL_SECONDS,
+    ) -> None:
+        self.client = client
+        self.queue_names = queue_names
+        self.worker_id = (
+            worker_id or f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(3)}"
+        )
+        self.ttl_ms = int(ttl_seconds * 1000)
+        self.owned: Set[str] = set()
+        self._members_key = partition_workers_key()
+        self._renew = client.register_script(_RENEW)
+        self._release = client.register_script(_RELEASE)
+
+    def live_workers(self) -> int:
+        """登記自己的心跳，順便清掉太久沒心跳的 worker"""
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(self._members_key, {self.worker_id: now})
+        pipe.zremrangebyscore(self._members_key, "-inf", now - self.ttl_ms / 1000)
+        pipe.zcard(self._members_key)
+        return max(int(pipe.execute()[-1]), 1)
+
+    def rebalance(self) -> Set[str]:
+        """
+        續約 + 認領，回傳這個 worker 現在應該消費的 partition
+        超過份額的 lease 還留著 (繼續續約)，等 caller 停掉 consumer 再 release，
+        交接時才不會有兩個 worker 同時處理同一個 partition
+        """
+        share = math.ceil(len(self.queue_names) / self.live_workers())
+
+        # 1. 續約手上的 (已經過期被別人拿走的就不是自己的了)
+        for queue_name in sorted(self.owned):
+            renewed = self._renew(
+                keys=[partition_lease_key(queue_name)],
+                args=[self.worker_id, self.ttl_ms],
+            )
+            if not renewed:
+                logger.warning(f" ⚠️ Lost partition lease {queue_name}")
+                self.owned.discard(queue_name)
+
+        # 2. 不夠份額就去搶沒人拿的 (從自己的位置開始找，避免大家搶同一個)
+        count = len(self.queue_names)
+        start = partition_of(self.worker_id, count)
+        for i in range(count):
+            if len(self.owned) >= share:
+                break
+            queue_name = self.queue_names[(start + i) % count]
+            if queue_name in self.owned:
+                continue
+            claimed = self.client.set(
+                partition_lease_key(queue_name),
+                self.worker_id,
+                nx=True,
+                px=self.ttl_ms,
+            )
+            if claimed:
+                self.owned.add(queue_name)
+
+        # 3. 超過份額的 (例如有新 worker 加入) 讓出來
+        return set(sorted(self.owned)[:share])
+
+    def release(self, queue_name: str) -> None:
+        self._release(keys=[partition_lease_key(queue_name)], args=[self.worker_id])
+        self.owned.discard(queue_name)
+
+    def release_all(self) -> None:
+        for queue_name in list(self.owned):
+            self.release(queue_name)
+        self.client.zrem(self._members_key, self.worker_id)
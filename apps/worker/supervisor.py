@@ -0,0 +1,220 @@
+# apps/worker/supervisor.py
+import logging
+import math
+import multiprocessing
+import signal
+import time
+from typing import Any, Dict, List, Optional
+
+from core.backoff import backoff_delay
+from core.config import (
+    PAYMENT_PARTITIONS,
+    SUPERVISOR_MAX_WORKERS,
+    SUPERVISOR_MESSAGES_PER_WORKER,
+    SUPERVISOR_MIN_WORKERS,
+    SUPERVISOR_POLL_INTERVAL,
+    SUPERVISOR_SCALE_DOWN_COOLDOWN,
+    SUPERVISOR_SHUTDOWN_TIMEOUT,
+)
+from core.messaging import RabbitMQConnector
+
+logger = logging.getLogger(__name__)
+
+# 用 spawn 而不是 fork：每個 worker 自己建立 Redis / DB / MQ 連線，
+# 不會跟 supervisor 共用 socket
+mp = multiprocessing.get_context("spawn")
+
+
+def _run_worker() -> None:
+    # 在子進程裡才 import，supervisor 本身不需要初始化 Telemetry / Redis
+    from apps.worker.main import main
+
+    main()
+
+
+def desired_workers(backlog: int, minimum: int, maximum: int, per_worker: int) -> int:
+    """依 Queue 積壓量算出需要幾個 worker (夾在 min / max 之間)"""
+    wanted = math.ceil(backlog / max(per_worker, 1))
+    return max(minimum, min(maximum, wanted))
+
+
+class WorkerSupervisor:
+    """
+    多進程 Worker 管理者
+    - 啟動 / 重啟掛掉的 worker process
+    - 轉送 SIGTERM，讓 worker 走原本的 should_run graceful shutdown
+    - 定期查 payment_events 積壓量，在 min ~ max 之間擴縮
+    """
+
+    def __init__(
+        self,
+        min_workers: int = SUPERVISOR_MIN_WORKERS,
+        max_workers: int = SUPERVISOR_MAX_WORKERS,
+        messages_per_worker: int = SUPERVISOR_MESSAGES_PER_WORKER,
+        poll_interval: float = SUPERVISOR_POLL_INTERVAL,
+        scale_down_cooldown: float = SUPERVISOR_SCALE_DOWN_COOLDOWN,
+    ) -> None:
+        self.min_workers = min_workers
+        # 一個 partition 同時只有一個 worker 在收，多開的 worker 只是備援
+        if PAYMENT_PARTITIONS > 1:
+            max_workers = min(max_workers, PAYMENT_PARTITIONS)
+        self.max_workers = max(max_workers, min_workers)
+        self.messages_per_worker = messages_per_worker
+        self.poll_interval = poll_interval
+        self.scale_down_cooldown = scale_down_cooldown
+
+        self.target = min_workers
+        self.should_run = True
+
+        self._workers: List[Any] = []
+        # 被我們要求結束的 worker，它們退出時不用重啟
+        self._retiring: List[Any] = []
+        self._started_at: Dict[Any, float] = {}
+        self._crash_streak = 0
+        self._next_restart_at = 0.0
+        self._last_scale_up = 0.0
+
+        # 只用來查 Queue 深度，第一次查的時候才連線
+        self._connector = RabbitMQConnector()
+        self._channel: Optional[Any] = None
+
+    # ---------- Process 管理 ----------
+
+    def _spawn(self) -> None:
+        process = mp.Process(target=_run_worker, name="flowpay-worker")
+        process.start()
+        self._workers.append(process)
+        self._started_at[process] = time.monotonic()
+        logger.info(f" 🚀 Started worker pid={process.pid}")
+
+    def _retire(self, process: Any) -> None:
+        # terminate() 在 POSIX 上就是送 SIGTERM，worker 會處理完手上的交易才離開
+        self._workers.remove(process)
+        self._retiring.append(process)
+        process.terminate()
+        logger.info(f" 📉 Retiring worker pid={process.pid}")
+
+    def _reap(self) -> None:
+        now = time.monotonic()
+        for process in list(self._workers):
+            if process.is_alive():
+                continue
+            self._workers.remove(process)
+            lifetime = now - self._started_at.pop(process, now)
+            logger.error(
+                f" 💥 Worker pid={process.pid} exited ({process.exitcode}) "
+                f"after {lifetime:.0f}s. Restarting..."
+            )
+            # 剛啟動就掛掉代表在 crash loop，退避重啟時間
+            if lifetime < 30:
+                self._crash_streak += 1
+                self._next_restart_at = now + backoff_delay(
+                    self._crash_streak - 1, 1.0, 30.0, jitter=0
+                )
+            else:
+                self._crash_streak = 0
+
+        for process in list(self._retiring):
+            if not process.is_alive():
+                self._retiring.remove(process)
+                self._started_at.pop(process, None)
+                process.join()
+
+    def _reconcile(self) -> None:
+        while len(self._workers) > self.target:
+            self._retire(self._workers[-1])
+
+        if time.monotonic() < self._next_restart_at:
+            return
+        while len(self._workers) < self.target:
+            self._spawn()
+
+    # ---------- Autoscaling ----------
+
+    def _queue_depth(self) -> Optional[int]:
+        try:
+            if self._channel is None or self._channel.is_closed:
+                # 只試一次：下一輪 poll 會再試，不要卡住 supervisor 迴圈
+                _, self._channel = self._connector.connect(retries=1, declare=False)
+            # 跟 replay_dlq.py 一樣，用 passive declare 只查狀態不建立 Queue
+            # 有 partition 時是所有 partition 加總
+            depth = 0
+            for queue_name in self._connector.queue_names:
+                state = self._channel.queue_declare(
+                    queue=queue_name, durable=True, passive=True
+                )
+                depth += int(state.method.message_count)
+            return depth
+        except Exception as e:
+            logger.warning(f" ⚠️ Cannot read queue depth: {e}")
+            self._channel = None
+            return None
+
+    def _autoscale(self) -> None:
+        backlog = self._queue_depth()
+        if backlog is None:
+            return
+
+        wanted = desired_workers(
+            backlog, self.min_workers, self.max_workers, self.messages_per_worker
+        )
+        now = time.monotonic()
+        if wanted > self.target:
+            logger.info(f" 📈 Backlog {backlog}: scaling {self.target} -> {wanted}")
+            self.target = wanted
+            self._last_scale_up = now
+        elif (
+            wanted < self.target
+            and now - self._last_scale_up >= self.scale_down_cooldown
+        ):
+            # 一次只縮一個，讓積壓慢慢消化
+            self.target -= 1
+            logger.info(f" 📉 Backlog {backlog}: scaling down to {self.target}")
+
+    # ---------- 主迴圈 ----------
+
+    def _handle_signal(self, sig: int, frame: Any) -> None:
+        logger.warning(f" 🛑 Supervisor received signal ({sig}). Stopping workers...")
+        self.should_run = False
+
+    def run(self) -> None:
+        signal.signal(signal.SIGINT, self._handle_signal)
+        signal.signal(signal.SIGTERM, self._handle_signal)
+
+        logger.info(
+            f" [*] Supervisor started (min={self.min_workers}, max={self.max_workers})."
+        )
+        next_poll = 0.0
+        while self.should_run:
+            self._reap()
+            if time.monotonic() >= next_poll:
+                self._autoscale()
+                next_poll = time.monotonic() + self.poll_interval
+            self._reconcile()
+            time.sleep(1)
+
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        for process in list(self._workers):
+            self._retire(process)
+
+        deadline = time.monotonic() + SUPERVISOR_SHUTDOWN_TIMEOUT
+        for process in self._retiring:
+            process.join(timeout=max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.error(f" ☠️ Worker pid={process.pid} did not stop. Killing.")
+                process.kill()
+                process.join()
+        self._retiring.clear()
+
+        self._connector.close()
+        logger.info(" 👋 Supervisor stopped.")
+
+
+def main() -> None:
+    WorkerSupervisor().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import logging
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, FrozenSet, List, NamedTuple, Optional
+from urllib.parse import quote
+
+import httpx
+from opentelemetry import metrics
+
+from core.config import (
+    ADMISSION_ENABLED,
+    ADMISSION_HARD_WATERMARK,
+    ADMISSION_POLL_INTERVAL_SECONDS,
+    ADMISSION_PRIORITY_MERCHANTS,
+    ADMISSION_RETRY_AFTER_MAX_SECONDS,
+    ADMISSION_RETRY_AFTER_MIN_SECONDS,
+    ADMISSION_SOFT_WATERMARK,
+    ADMISSION_STALE_AFTER_SECONDS,
+    RABBITMQ_MANAGEMENT_URL,
+    RABBITMQ_VHOST,
+)
+from core.messaging import payment_queue_names
+
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter(__name__)
+shed_counter = meter.create_counter(
+    "flowpay.webhook.shed",
+    description="Webhooks rejected by admission control (429 / 503)",
+)
+
+
+class QueueSnapshot(NamedTuple):
+    depth: int
+    # consumer 每秒 ack 幾筆 (也就是 Worker 消化的速度)
+    ack_rate: float
+    consumers: int
+    taken_at: float
+
+
+class AdmissionDecision(NamedTuple):
+    admitted: bool
+    status_code: int = 200
+    retry_after: int = 0
+    reason: str = ""
+
+
+ADMIT = AdmissionDecision(admitted=True)
+
+
+class RabbitMQQueueStats:
+    """
+    從 RabbitMQ management API 讀 Queue 深度跟 ack rate
+    (AMQP 的 passive declare 只有深度，沒有消化速度)
+    有 partition 時是所有 partition 加總
+    """
+
+    def __init__(
+        self,
+        queue_names: Optional[List[str]] = None,
+        base_url: str = RABBITMQ_MANAGEMENT_URL,
+        vhost: str = RABBITMQ_VHOST,
+        timeout: float = 2.0,
+        transport: Optional[httpx.BaseTransport] = None,
+    ) -> None:
+        self.paths = [
+            f"/api/queues/{quote(vhost, safe='')}/{quote(queue_name)}"
+            for queue_name in (queue_names or payment_queue_names())
+        ]
+        self._client = httpx.Client(
+            base_url=base_url,
+            auth=(
+                os.getenv("RABBITMQ_USER", "poposing"),
+                os.getenv("RABBITMQ_PASS", "poposing1234"),
+            ),
+            timeout=timeout,
+            transport=transport,
+        )
+
+    def fetch(self) -> QueueSnapshot:
+        depth, ack_rate, consumers = 0, 0.0, 0
+        for path in self.paths:
+            resp = self._client.get(path)
+            resp.raise_for_status()
+            data = resp.json()
+            stats = data.get("message_stats") or {}
+            depth += int(data.get("messages") or 0)
+            ack_rate += float((stats.get("ack_details") or {}).get("rate") or 0.0)
+            consumers += int(data.get("consumers") or 0)
+        return QueueSnapshot(depth, ack_rate, consumers, time.monotonic())
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class AdmissionController:
+    """
+    Webhook 入口的 load shedding：Worker 跟不上時讓上游退避，
+    而不是把好幾個小時的積壓堆在 Broker 裡。
+
+    - 積壓 < soft watermark：全部放行
+    - soft ~ hard：優先商家照常放行，其他商家依積壓比例擋掉 (429)
+    - >= hard：全部擋掉 (503)
+    Retry-After 是照目前 ack rate 把積壓消化回 soft watermark 要的秒數。
+    背景 thread 定期更新 Queue 狀態，每個 Request 只讀記憶體裡的快照。
+    """
+
+    def __init__(
+        self,
+        stats: Any,
+        soft_watermark: int = ADMISSION_SOFT_WATERMARK,
+        hard_watermark: int = ADMISSION_HARD_WATERMARK,
+        priority_merchants: FrozenSet[str] = ADMISSION_PRIORITY_MERCHANTS,
+        poll_interval: float = ADMISSION_POLL_INTERVAL_SECONDS,
+        stale_after: float = ADMISSION_STALE_AFTER_SECONDS,
+        retry_after_min: int = ADMISSION_RETRY_AFTER_MIN_SECONDS,
+        retry_after_max: int = ADMISSION_RETRY_AFTER_MAX_SECONDS,
+        enabled: bool = ADMISSION_ENABLED,
+    ) -> None:
+        # 要有 fetch() -> QueueSnapshot 跟 close()，例如 RabbitMQQueueStats
+        self.stats = stats
+        self.soft_watermark = soft_watermark
+        self.hard_watermark = max(hard_watermark, soft_watermark + 1)
+        self.priority_merchants = priority_merchants
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.retry_after_min = retry_after_min
+        self.retry_after_max = retry_after_max
+        self.enabled = enabled
+
+        self.snapshot: Optional[QueueSnapshot] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- Queue 狀態 ----------
+
+    def refresh(self) -> None:
+        try:
+            self.snapshot = self.stats.fetch()
+        except Exception as e:
+            # 沒更新的快照過一陣子就會變成 stale -> 放行
+            logger.warning(f" ⚠️ Cannot read queue stats for admission control: {e}")
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self.refresh()
+            self._stopped.wait(self.poll_interval)
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="admission-control", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.stats.close()
+
+    # ---------- 判斷 ----------
+
+    def retry_after(self, snapshot: QueueSnapshot) -> int:
+        excess = snapshot.depth - self.soft_watermark
+        if snapshot.ack_rate <= 0:
+            # 沒有 consumer 在消化 (Worker 全掛 / 卡住)，請上游等最久
+            return self.retry_after_max
+        seconds = math.ceil(excess / snapshot.ack_rate)
+        return max(self.retry_after_min, min(self.retry_after_max, seconds))
+
+    def check(self, merchant_id: Optional[str] = None) -> AdmissionDecision:
+        snapshot = self.snapshot
+        if not self.enabled or snapshot is None:
+            return ADMIT
+        if time.monotonic() - snapshot.taken_at > self.stale_after:
+            # 看不到 Broker 狀態時寧可放行，publish 失敗本來就會回 500
+            return ADMIT
+        if snapshot.depth < self.soft_watermark:
+            return ADMIT
+
+        if snapshot.depth >= self.hard_watermark:
+            decision = AdmissionDecision(
+                False, 503, self.retry_after(snapshot), "hard_watermark"
+            )
+        elif merchant_id in self.priority_merchants:
+            return ADMIT
+        else:
+            # 從 soft 到 hard 線性增加擋掉的比例，避免一過線就整批斷掉
+            shed_ratio = (snapshot.depth - self.soft_watermark) / (
+                self.hard_watermark - self.soft_watermark
+            )
+            if random.random() >= shed_ratio:  # noqa: S311
+                return ADMIT
+            decision = AdmissionDecision(
+                False, 429, self.retry_after(snapshot), "soft_watermark"
+            )
+
+        shed_counter.add(
+            1, {"reason": decision.reason, "status_code": decision.status_code}
+        )
+        return decision
+
+
+def make_admission_controller(**kwargs: Any) -> AdmissionController:
+    """預設接 RabbitMQ management API 的 payment_events"""
+    return AdmissionController(RabbitMQQueueStats(), **kwargs)
@@ -0,0 +1,270 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import aio_pika
+
+from core.config import PUBLISH_BATCH_SIZE, PUBLISH_LINGER_MS
+from core.messaging import (
+    PAYMENT_EVENTS_QUEUE,
+    RabbitMQConnector,
+    batch_fill_histogram,
+    batch_size_histogram,
+    publish_duration_histogram,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PublisherBusy(RuntimeError):
+    """在途 (還沒等到 Broker confirm) 的訊息太多"""
+
+
+class _PendingMessage(NamedTuple):
+    message: aio_pika.Message
+    routing_key: str
+    future: "asyncio.Future[None]"
+
+
+class _TopologyRecorder:
+    """
+    假裝成 pika channel，把 RabbitMQConnector.declare_topology 的呼叫記下來
+    Topology 只在 RabbitMQConnector 定義一份，aio-pika 這邊照著重播
+    """
+
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+
+    def exchange_declare(self, **kwargs: Any) -> None:
+        self.calls.append(("exchange_declare", kwargs))
+
+    def queue_declare(self, **kwargs: Any) -> None:
+        self.calls.append(("queue_declare", kwargs))
+
+    def queue_bind(self, **kwargs: Any) -> None:
+        self.calls.append(("queue_bind", kwargs))
+
+
+async def declare_topology(channel: Any, connector: RabbitMQConnector) -> None:
+    """用 aio-pika channel 宣告跟 RabbitMQConnector.declare_topology 一樣的拓撲"""
+    recorder = _TopologyRecorder()
+    connector.declare_topology(recorder)
+    queues: Dict[str, Any] = {}
+    for method, kwargs in recorder.calls:
+        if method == "exchange_declare":
+            await channel.declare_exchange(
+                kwargs["exchange"],
+                aio_pika.ExchangeType(kwargs["exchange_type"].value),
+                durable=kwargs.get("durable", False),
+            )
+        elif method == "queue_declare":
+            queues[kwargs["queue"]] = await channel.declare_queue(
+                kwargs["queue"],
+                durable=kwargs.get("durable", False),
+                arguments=kwargs.get("arguments"),
+            )
+        else:
+            await queues[kwargs["queue"]].bind(
+                kwargs["exchange"], routing_key=kwargs["routing_key"]
+            )
+
+
+class AsyncPublisher:
+    """
+    API 用的 asyncio Publisher (aio-pika)
+    - 一條 connect_robust 長連線 (斷線自動重連、重建 channel)，
+      開 channels 個 publisher-confirm channel 輪流用
+    - publish() 等到 Broker confirm 才回來；confirm 是非同步的，
+      同一個 channel 上可以同時有很多筆在途，等待時不佔 thread
+    - Micro-batching：併發送進來的訊息先收成一批，滿 batch_size 筆或
+      第一筆等了 linger_ms 就 flush；整批在同一個 channel 上一口氣送出，
+      只等一次這批的 confirm，再 resolve 每個呼叫者的 Future
+    - 單筆被 Broker 拒收只有那一筆失敗；flush 本身出錯 (channel 斷掉、
+      關機被取消) 整批的 Future 都會收到例外，不會有人一直等下去
+    - 在途的訊息 (排隊中 + 等 confirm) 超過 max_in_flight 就直接拋
+      PublisherBusy (不無限排隊)
+    """
+
+    def __init__(
+        self,
+        channels: int = 4,
+        host: str = "localhost",
+        port: int = 5672,
+        queue_name: str = PAYMENT_EVENTS_QUEUE,
+        max_in_flight: int = 10000,
+        confirm_timeout: float = 5.0,
+        batch_size: int = PUBLISH_BATCH_SIZE,
+        linger_ms: float = PUBLISH_LINGER_MS,
+    ) -> None:
+        self.channels = channels
+        self.host = host
+        self.port = port
+        self.queue_name = queue_name
+        self.max_in_flight = max_in_flight
+        self.confirm_timeout = confirm_timeout
+        self.batch_size = max(batch_size, 1)
+        self.linger = linger_ms / 1000
+
+        self._connection: Optional[Any] = None
+        self._channels: List[Any] = []
+        self._next_channel: "itertools.cycle[Any]" = itertools.cycle([])
+        self._in_flight = 0
+        self._pending: List[_PendingMessage] = []
+        self._linger_timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set["asyncio.Task[None]"] = set()
+
+    @property
+    def ready(self) -> bool:
+        """channels 開好了，而且連線沒斷 (connect_robust 重連中不算)"""
+        if not self._channels:
+            return False
+        return self._connection is None or self._connection.connected.is_set()
+
+    async def start(self) -> None:
+        """
+        連線失敗 / 被取消 (啟動暖機逾時) 時會先把開到一半的連線關掉再拋出，
+        可以直接重試
+        """
+        try:
+            self._channels = await self._open()
+        except BaseException:
+            await self.close()
+            raise
+        self._next_channel = itertools.cycle(self._channels)
+        logger.info(f"✅ Async publisher ready ({len(self._channels)} channels).")
+
+    async def _open(self) -> List[Any]:
+        """建立連線 + channels，宣告一次 Topology (benchmark 會換成記憶體版)"""
+        connector = RabbitMQConnector(
+            host=self.host, port=self.port, queue_name=self.queue_name
+        )
+        self._connection = await aio_pika.connect_robust(
+            host=self.host,
+            port=self.port,
+            login=connector.username,
+            password=connector.password,
+        )
+        channels = [
+            await self._connection.channel(
+                publisher_confirms=True, on_return_raises=True
+            )
+            for _ in range(max(self.channels, 1))
+        ]
+        await declare_topology(channels[0], connector)
+        logger.info(f"✅ Connected to RabbitMQ as {connector.username} (asyncio).")
+        return channels
+
+    async def publish(
+        self,
+        body: bytes,
+        headers: Optional[Dict[str, Any]] = None,
+        routing_key: Optional[str] = None,
+        content_type: Optional[str] = None,
+    ) -> None:
+        """
+        發送一則持久化訊息，等到 Broker confirm 才回傳
+        Broker 拒收 (Nack / Unroutable) 或等太久時會拋出例外
+        """
+        if not self._channels:
+            raise RuntimeError("AsyncPublisher.start() has not been called")
+        if self._in_flight >= self.max_in_flight:
+            raise PublisherBusy(f"{self._in_flight} messages waiting for confirm")
+        message = aio_pika.Message(
+            body,
+            headers=headers,
+            content_type=content_type,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,  # RabbitMQ重啟不會消失
+        )
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[None]" = loop.create_future()
+        self._pending.append(
+            _PendingMessage(message, routing_key or self.queue_name, future)
+        )
+        self._in_flight += 1
+        started = time.perf_counter()
+        if len(self._pending) >= self.batch_size:
+            self._flush_pending()
+        elif self._linger_timer is None:
+            self._linger_timer = loop.call_later(self.linger, self._flush_pending)
+        try:
+            await future
+        finally:
+            self._in_flight -= 1
+            publish_duration_histogram.record(
+                (time.perf_counter() - started) * 1000, {"publisher": "async"}
+            )
+
+    def _flush_pending(self) -> None:
+        """把目前排隊的訊息切成一批，交給背景 task 送出"""
+        if self._linger_timer is not None:
+            self._linger_timer.cancel()
+            self._linger_timer = None
+        # 呼叫者已經放棄等待 (Request 被取消) 的就不送了
+        batch = [item for item in self._pending if not item.future.done()]
+        self._pending = []
+        if not batch:
+            return
+        task = asyncio.create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[_PendingMessage]) -> None:
+        batch_size_histogram.record(len(batch), {"publisher": "async"})
+        batch_fill_histogram.record(
+            len(batch) / self.batch_size, {"publisher": "async"}
+        )
+        try:
+            if not self._channels:
+                raise RuntimeError("AsyncPublisher is closed")
+            channel = next(self._next_channel)
+            # 整批先全部寫出去再一起等：Broker 會把 confirm 合併 (multiple=True)
+            # 回來，這批只等一次 round-trip
+            results = await asyncio.gather(
+                *(
+                    channel.default_exchange.publish(
+                        item.message,
+                        routing_key=item.routing_key,
+                        timeout=self.confirm_timeout,
+                    )
+                    for item in batch
+                ),
+                return_exceptions=True,
+            )
+        except asyncio.CancelledError:
+            self._fail(batch, RuntimeError("Publish batch was cancelled"))
+            raise
+        except Exception as e:
+            # 拿不到 channel / 送到一半 channel 斷掉：整批都算失敗
+            logger.error(f"❌ Publish batch of {len(batch)} failed: {e}")
+            self._fail(batch, e)
+            return
+        for item, result in zip(batch, results, strict=True):
+            if item.future.done():
+                continue
+            if isinstance(result, BaseException):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(None)
+
+    @staticmethod
+    def _fail(batch: List[_PendingMessage], error: Exception) -> None:
+        for item in batch:
+            if not item.future.done():
+                item.future.set_exception(error)
+
+    async def close(self) -> None:
+        # 還在排隊的先送出去，等所有批次都有結果才關 channel
+        self._flush_pending()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        channels, self._channels = self._channels, []
+        for channel in channels:
+            try:
+                await channel.close()
+            except Exception:
+                logger.debug("Publisher channel already closed.")
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
@@ -0,0 +1,13 @@
+import random
+
+
+def backoff_delay(
+    attempt: int, base: float, maximum: float, jitter: float = 0.5
+) -> float:
+    """
+    第 attempt 次 (從 0 開始) 失敗後要等多久：指數退避 base * 2^attempt，上限 maximum，
+    再隨機抖掉最多 jitter 比例 (0.5 = 半抖動，1.0 = full jitter)，
+    很多 client 同時失敗時不會一起重試
+    """
+    ceiling = min(maximum, base * 2.0**attempt)
+    return ceiling * (1 - jitter) + random.uniform(0, ceiling * jitter)  # noqa: S311
@@ -0,0 +1,231 @@
+import os
+
+# -----------------------------------------------------------
+# 集中管理可調整的執行參數 (全部從環境變數讀取，有合理預設值)
+# -----------------------------------------------------------
+
+# --- RabbitMQ Publisher (API 端) ---
+# API 的 AsyncPublisher 在一條長連線上開幾個 publisher-confirm channel (輪流用)
+PUBLISHER_POOL_SIZE = int(os.getenv("PUBLISHER_POOL_SIZE", "4"))
+# Micro-batching: 一個批次最多幾筆 / 第一筆進來後最多等幾毫秒就 flush
+PUBLISH_BATCH_SIZE = int(os.getenv("PUBLISH_BATCH_SIZE", "100"))
+PUBLISH_LINGER_MS = float(os.getenv("PUBLISH_LINGER_MS", "2"))
+# 送進 Queue 的訊息格式: application/json 或 application/msgpack (需要 msgpack)
+MESSAGE_CONTENT_TYPE = os.getenv("MESSAGE_CONTENT_TYPE", "application/json")
+
+# --- Payment Worker ---
+# 同時處理中的訊息數量 (1 = 原本的逐筆處理模式)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+# RabbitMQ prefetch，預設跟併發數一樣
+WORKER_PREFETCH = int(os.getenv("WORKER_PREFETCH", str(WORKER_CONCURRENCY)))
+
+# --- Partitioned payment_events (依 order_id 分到多個 Queue) ---
+# 切成幾個 partition (payment_events.p0 ~ p{N-1})，依 order_id 的 crc32 分配
+# 1 = 不切 (沿用原本單一的 payment_events)；改數量前要先把舊的 Queue 消化完
+PAYMENT_PARTITIONS = int(os.getenv("PAYMENT_PARTITIONS", "1"))
+# Worker 用 Redis lease 認領 partition：lease 多久過期 / 多久續約並重新平衡一次
+PARTITION_LEASE_TTL_SECONDS = float(os.getenv("PARTITION_LEASE_TTL_SECONDS", "15"))
+PARTITION_REBALANCE_INTERVAL_SECONDS = float(
+    os.getenv("PARTITION_REBALANCE_INTERVAL_SECONDS", "5")
+)
+
+# --- Database ---
+# Worker 併發處理時，每個 thread 都會借一條連線，pool 要夠大
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# 建一條 DB 連線最多等幾秒 (driver 預設會等很久，啟動暖機會卡住)
+DB_CONNECT_TIMEOUT_SECONDS = int(os.getenv("DB_CONNECT_TIMEOUT_SECONDS", "5"))
+
+# --- payment_events 按月 partition / 冷資料歸檔 ---
+# 預先建好未來幾個月的 partition (Worker 啟動時跟 archive CLI 都會補)
+PAYMENT_PARTITION_MONTHS_AHEAD = int(os.getenv("PAYMENT_PARTITION_MONTHS_AHEAD", "3"))
+# Worker 多久補建一次 (秒)：沒有 DEFAULT partition，長時間不重啟的 Worker
+# 不能只靠啟動時預建的月份
+PAYMENT_PARTITION_ENSURE_INTERVAL_SECONDS = float(
+    os.getenv("PAYMENT_PARTITION_ENSURE_INTERVAL_SECONDS", "3600")
+)
+# 超過幾個月的 partition 由 archive CLI detach、匯出成壓縮檔後刪掉
+PAYMENT_RETENTION_MONTHS = int(os.getenv("PAYMENT_RETENTION_MONTHS", "12"))
+PAYMENT_ARCHIVE_DIR = os.getenv("PAYMENT_ARCHIVE_DIR", "./archive/payment_events")
+
+# --- 對帳：每日彙總 (payment_daily_summaries) / 匯出 ---
+# 多久重算一次有變動的日子的彙總 (秒，整個 cluster 每個間隔只有一個 worker 算；
+# 0 = Worker 不算，改用 settlement CLI 排程)
+PAYMENT_SUMMARY_REFRESH_SECONDS = float(
+    os.getenv("PAYMENT_SUMMARY_REFRESH_SECONDS", "300")
+)
+# 匯出時 server-side cursor 一次拉幾筆
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "5000"))
+
+# --- Worker Supervisor (多進程 + 依 Queue 深度自動擴縮) ---
+SUPERVISOR_MIN_WORKERS = int(os.getenv("SUPERVISOR_MIN_WORKERS", "1"))
+SUPERVISOR_MAX_WORKERS = int(
+    os.getenv("SUPERVISOR_MAX_WORKERS", str(os.cpu_count() or 1))
+)
+# 每個 worker 負責多少積壓訊息 (desired = backlog / 這個值)
+SUPERVISOR_MESSAGES_PER_WORKER = int(os.getenv("SUPERVISOR_MESSAGES_PER_WORKER", "500"))
+SUPERVISOR_POLL_INTERVAL = float(os.getenv("SUPERVISOR_POLL_INTERVAL", "5"))
+# 縮容要等積壓持續下降一段時間，避免來回震盪
+SUPERVISOR_SCALE_DOWN_COOLDOWN = float(
+    os.getenv("SUPERVISOR_SCALE_DOWN_COOLDOWN", "60")
+)
+# 關機時等 worker 把手上交易做完的時間，超過就強制結束
+SUPERVISOR_SHUTDOWN_TIMEOUT = float(os.getenv("SUPERVISOR_SHUTDOWN_TIMEOUT", "30"))
+
+# --- Batch consume 模式 ---
+# 一次最多拉幾筆一起處理 (1 = 關閉批次模式)
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "1"))
+# 批次最多等多久就處理 (毫秒)
+WORKER_BATCH_WAIT_MS = float(os.getenv("WORKER_BATCH_WAIT_MS", "50"))
+
+# --- RabbitMQ 連線 (pika) ---
+# 連不上時重試幾次，每次等 base * 2^n 秒 (最多 max 秒，加 jitter)，用完才拋例外
+RABBITMQ_CONNECT_RETRIES = int(os.getenv("RABBITMQ_CONNECT_RETRIES", "6"))
+RABBITMQ_CONNECT_BACKOFF_SECONDS = float(
+    os.getenv("RABBITMQ_CONNECT_BACKOFF_SECONDS", "0.5")
+)
+RABBITMQ_CONNECT_BACKOFF_MAX_SECONDS = float(
+    os.getenv("RABBITMQ_CONNECT_BACKOFF_MAX_SECONDS", "8")
+)
+
+# --- 啟動暖機 / 健康檢查 ---
+# import 時不連任何外部服務；API 在背景暖機 (Broker channel、Redis、DB 連線池)，
+# 暖好之前 /readyz 回 503。每一步最多等 timeout 秒，失敗就退避重試
+STARTUP_WARMUP_TIMEOUT_SECONDS = float(os.getenv("STARTUP_WARMUP_TIMEOUT_SECONDS", "5"))
+STARTUP_BACKOFF_SECONDS = float(os.getenv("STARTUP_BACKOFF_SECONDS", "0.5"))
+STARTUP_BACKOFF_MAX_SECONDS = float(os.getenv("STARTUP_BACKOFF_MAX_SECONDS", "8"))
+# 啟動時先開好幾條 DB 連線放進 pool (不超過 DB_POOL_SIZE)
+STARTUP_DB_CONNECTIONS = int(os.getenv("STARTUP_DB_CONNECTIONS", "2"))
+# Worker 的健康檔：開始消費後每秒更新 mtime，關機時刪掉 (空字串 = 不寫)
+WORKER_HEALTH_FILE = os.getenv(
+    "WORKER_HEALTH_FILE",
+    "/tmp/flowpay-worker.health",  # noqa: S108
+)
+
+# --- Redis ---
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# --- 訂單狀態快取 (order_status:{order_id}) ---
+ORDER_STATUS_TTL_SECONDS = int(os.getenv("ORDER_STATUS_TTL_SECONDS", "86400"))
+# 查不到 / 還在排隊的訂單只快取一下下，避免輪詢打爆 DB
+ORDER_STATUS_NEGATIVE_TTL_MS = int(os.getenv("ORDER_STATUS_NEGATIVE_TTL_MS", "2000"))
+# 批次查詢訂單狀態一次最多幾筆
+ORDER_LOOKUP_MAX_IDS = int(os.getenv("ORDER_LOOKUP_MAX_IDS", "1000"))
+
+# --- 訂單狀態推播 (GET /orders/stream, SSE) ---
+# 一條 stream 最多訂閱幾筆訂單
+ORDER_STREAM_MAX_IDS = int(os.getenv("ORDER_STREAM_MAX_IDS", "100"))
+# 沒有狀態變更時多久送一次 keep-alive (秒)，讓 proxy 不要切斷閒置連線
+ORDER_STREAM_HEARTBEAT_SECONDS = float(
+    os.getenv("ORDER_STREAM_HEARTBEAT_SECONDS", "15")
+)
+# 一條 stream 最長多久 (秒)，到了就結束，客戶端用 EventSource 自動重連
+ORDER_STREAM_MAX_SECONDS = float(os.getenv("ORDER_STREAM_MAX_SECONDS", "600"))
+
+# --- 批次 Webhook (/webhook/batch) ---
+# 一個請求最多幾筆
+WEBHOOK_BATCH_MAX_ITEMS = int(os.getenv("WEBHOOK_BATCH_MAX_ITEMS", "1000"))
+
+# --- Webhook 入口的流量控制 (Admission Control / Load Shedding) ---
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# payment_events 積壓超過 soft watermark 開始擋一般商家 (429，積壓越多擋越多)，
+# 超過 hard watermark 全部擋 (503)
+ADMISSION_SOFT_WATERMARK = int(os.getenv("ADMISSION_SOFT_WATERMARK", "50000"))
+ADMISSION_HARD_WATERMARK = int(os.getenv("ADMISSION_HARD_WATERMARK", "200000"))
+# 在 soft ~ hard 之間照常放行的商家 (X-Merchant-Id，逗號分隔)
+ADMISSION_PRIORITY_MERCHANTS = frozenset(
+    merchant.strip()
+    for merchant in os.getenv("ADMISSION_PRIORITY_MERCHANTS", "").split(",")
+    if merchant.strip()
+)
+# 多久查一次 Queue 狀態；資料太舊 (查不到 Broker) 就先全部放行
+ADMISSION_POLL_INTERVAL_SECONDS = float(
+    os.getenv("ADMISSION_POLL_INTERVAL_SECONDS", "2")
+)
+ADMISSION_STALE_AFTER_SECONDS = float(os.getenv("ADMISSION_STALE_AFTER_SECONDS", "15"))
+# Retry-After = 積壓消化回 soft watermark 需要的秒數，夾在 min ~ max 之間
+ADMISSION_RETRY_AFTER_MIN_SECONDS = int(
+    os.getenv("ADMISSION_RETRY_AFTER_MIN_SECONDS", "1")
+)
+ADMISSION_RETRY_AFTER_MAX_SECONDS = int(
+    os.getenv("ADMISSION_RETRY_AFTER_MAX_SECONDS", "300")
+)
+# Queue 深度 / consumer ack rate 從 RabbitMQ management API 讀
+RABBITMQ_MANAGEMENT_URL = os.getenv("RABBITMQ_MANAGEMENT_URL", "http://localhost:15672")
+RABBITMQ_VHOST = os.getenv("RABBITMQ_VHOST", "/")
+
+# --- Webhook 入口去重 (webhook_seen:{order_id}) ---
+# 跟 Worker 的 processed:{order_id} 一樣保留一天
+WEBHOOK_DEDUPE_TTL_SECONDS = int(os.getenv("WEBHOOK_DEDUPE_TTL_SECONDS", "86400"))
+# 還在等 Broker confirm 的 key 只保留一下下 (publish 的 confirm timeout 的幾倍)：
+# process 在 publish 途中掛掉時，上游重送過一會兒就能再進來
+WEBHOOK_DEDUPE_PENDING_TTL_SECONDS = int(
+    os.getenv("WEBHOOK_DEDUPE_PENDING_TTL_SECONDS", "30")
+)
+# 每個 API process 記住最近幾筆已送出的 order_id (0 = 不用本地 LRU)
+WEBHOOK_DEDUPE_LOCAL_SIZE = int(os.getenv("WEBHOOK_DEDUPE_LOCAL_SIZE", "10000"))
+
+# --- 商家 Callback 派送 ---
+CALLBACK_QUEUE = os.getenv("CALLBACK_QUEUE", "payment_callbacks")
+# Dispatcher 同時處理中的 callback 數量 (= prefetch)
+CALLBACK_PREFETCH = int(os.getenv("CALLBACK_PREFETCH", "200"))
+# 每個商家 host 同時最多幾個請求，避免一個壞掉的 host 拖垮其他人
+CALLBACK_PER_HOST_CONCURRENCY = int(os.getenv("CALLBACK_PER_HOST_CONCURRENCY", "10"))
+# 每個 host 最多幾筆在排隊，超過就先丟回 Queue 尾端讓給別的 host
+CALLBACK_PER_HOST_BACKLOG = int(os.getenv("CALLBACK_PER_HOST_BACKLOG", "50"))
+CALLBACK_TIMEOUT_SECONDS = float(os.getenv("CALLBACK_TIMEOUT_SECONDS", "5"))
+CALLBACK_MAX_ATTEMPTS = int(os.getenv("CALLBACK_MAX_ATTEMPTS", "5"))
+CALLBACK_BACKOFF_BASE_SECONDS = float(os.getenv("CALLBACK_BACKOFF_BASE_SECONDS", "0.5"))
+CALLBACK_BACKOFF_MAX_SECONDS = float(os.getenv("CALLBACK_BACKOFF_MAX_SECONDS", "30"))
+
+# --- 銀行 Gateway ---
+BANK_API_URL = os.getenv("BANK_API_URL", "http://localhost:8001")
+# 每次扣款的硬性 deadline (秒)
+BANK_API_TIMEOUT_SECONDS = float(os.getenv("BANK_API_TIMEOUT_SECONDS", "2"))
+BANK_MAX_CONNECTIONS = int(os.getenv("BANK_MAX_CONNECTIONS", "100"))
+# 批次裡同時呼叫銀行 API 的上限
+BANK_CALL_CONCURRENCY = int(os.getenv("BANK_CALL_CONCURRENCY", "32"))
+# Circuit Breaker：連續失敗幾次就斷路，斷路多久後放一個試探請求
+BANK_BREAKER_FAILURE_THRESHOLD = int(os.getenv("BANK_BREAKER_FAILURE_THRESHOLD", "5"))
+BANK_BREAKER_RECOVERY_SECONDS = float(os.getenv("BANK_BREAKER_RECOVERY_SECONDS", "10"))
+
+# --- 延遲重試 (TTL + Dead Letter 組成的重試佇列) ---
+# 第 N 次重試等多久 (毫秒)；重試次數用完才進 DLQ
+_RETRY_DELAYS = os.getenv("RETRY_DELAYS_MS", "1000,5000,30000,120000,600000")
+RETRY_DELAYS_MS = [int(delay) for delay in _RETRY_DELAYS.split(",")]
+# 每則訊息實際延遲落在 [delay * (1 - jitter), delay] 之間，避免重試同時湧回
+RETRY_JITTER = float(os.getenv("RETRY_JITTER", "0.2"))
+
+# --- Telemetry (Tracing 取樣 / Metrics) ---
+# Head sampling：新 trace 有多少比例要記錄 (有上游 parent 時跟著 parent 走)
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+# Tail sampling：trace 結束後，正常又不慢的只留這個比例 (出錯 / 慢的一律保留)
+TRACE_TAIL_SAMPLE_RATIO = float(os.getenv("TRACE_TAIL_SAMPLE_RATIO", "1.0"))
+TRACE_TAIL_LATENCY_MS = float(os.getenv("TRACE_TAIL_LATENCY_MS", "500"))
+# 等待決定的 trace 最多暫存幾個 (超過就直接丟掉最舊的)
+TRACE_TAIL_MAX_PENDING = int(os.getenv("TRACE_TAIL_MAX_PENDING", "10000"))
+# 關掉個別 auto-instrumentation，例如 "redis,sqlalchemy" (跟 OTel 官方同名)
+OTEL_PYTHON_DISABLED_INSTRUMENTATIONS = os.getenv(
+    "OTEL_PYTHON_DISABLED_INSTRUMENTATIONS", ""
+)
+# Worker / Callback 的 Prometheus /metrics port (0 = 不開)
+# 同一台機器上多個 Worker 會從這個 port 往上找空的，最多找 METRICS_PORT_RANGE 個
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRICS_PORT_RANGE = int(os.getenv("METRICS_PORT_RANGE", "16"))
+
+# --- Worker 效能剖析 (分段計時 / 慢訊息 / 取樣 profiler) ---
+# 單筆 (或單一批次) 處理超過這個時間就印出分段明細 (毫秒)
+SLOW_MESSAGE_THRESHOLD_MS = float(os.getenv("SLOW_MESSAGE_THRESHOLD_MS", "1000"))
+# 每個階段保留最近幾筆耗時來算 p50 / p95 / p99
+STAGE_STATS_WINDOW = int(os.getenv("STAGE_STATS_WINDOW", "2048"))
+# 多久印一次各階段的百分位數 (秒，0 = 不印)
+STAGE_STATS_LOG_INTERVAL_SECONDS = float(
+    os.getenv("STAGE_STATS_LOG_INTERVAL_SECONDS", "60")
+)
+# 取樣 profiler (預設關閉)：隨機抽多少比例的訊息 / 是否抓所有慢訊息
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MESSAGES = os.getenv("PROFILE_SLOW_MESSAGES", "false").lower() == "true"
+# 每隔幾毫秒抓一次 stack
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# profile 輸出位置 (collapsed stack 格式，可以丟給 speedscope / flamegraph.pl)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/flowpay-profiles")  # noqa: S108
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from core.backoff import backoff_delay
+from core.config import (
+    STARTUP_BACKOFF_MAX_SECONDS,
+    STARTUP_BACKOFF_SECONDS,
+    STARTUP_WARMUP_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# 暖機步驟：一個 async 函式，成功就算這個依賴暖好了
+WarmUpStep = Callable[[], Awaitable[Any]]
+
+
+class Readiness:
+    """
+    API 啟動暖機 (/readyz 用)
+    - 每個依賴一個暖機步驟，全部同時在背景跑，每次最多等 timeout 秒，
+      失敗就退避重試，直到成功或 process 關機
+    - required 的步驟全部成功才算 ready；optional 的只回報狀態
+    process 一啟動就能回 /healthz，暖好之前 /readyz 回 503，不會接到流量
+    """
+
+    def __init__(
+        self,
+        timeout: float = STARTUP_WARMUP_TIMEOUT_SECONDS,
+        backoff: float = STARTUP_BACKOFF_SECONDS,
+        max_backoff: float = STARTUP_BACKOFF_MAX_SECONDS,
+    ) -> None:
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # name -> (step, required)
+        self._steps: Dict[str, Tuple[WarmUpStep, bool]] = {}
+        # name -> "ok" / "pending" / 最近一次的錯誤
+        self._status: Dict[str, str] = {}
+        self._started = time.monotonic()
+
+    def add(self, name: str, step: WarmUpStep, required: bool = True) -> None:
+        self._steps[name] = (step, required)
+        self._status[name] = "pending"
+
+    @property
+    def ready(self) -> bool:
+        return all(
+            self._status[name] == "ok"
+            for name, (_, required) in self._steps.items()
+            if required
+        )
+
+    def status(self) -> Dict[str, str]:
+        return dict(self._status)
+
+    async def run(self) -> None:
+        await asyncio.gather(*(self._warm_up(name) for name in self._steps))
+
+    async def _warm_up(self, name: str) -> None:
+        step, _ = self._steps[name]
+        attempt = 0
+        while True:
+            try:
+                await asyncio.wait_for(step(), self.timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._status[name] = f"{type(e).__name__}: {e}"[:200]
+                delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+                logger.warning(
+                    f"⚠️ [Startup] {name} not ready ({self._status[name]}). "
+                    f"Retrying in {delay:.1f}s..."
+                )
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._status[name] = "ok"
+            elapsed = time.monotonic() - self._started
+            logger.info(f"✅ [Startup] {name} ready after {elapsed:.2f}s")
+            return
+
+
+class HealthFile:
+    """
+    Worker 的健康檔 (Worker 沒有 HTTP API，給 k8s 的 exec probe 用)
+    - beat()：消費迴圈每一輪呼叫，最多每 interval 秒更新一次 mtime
+      (檔案存在 = 已經連上 Broker 開始消費；mtime 夠新 = 迴圈沒有卡住)
+    - clear()：關機時刪掉
+    """
+
+    def __init__(self, path: str, interval: float = 1.0) -> None:
+        self.path = Path(path) if path else None
+        self.interval = interval
+        self._last_beat = float("-inf")
+
+    def beat(self) -> None:
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if now - self._last_beat < self.interval:
+            return
+        self._last_beat = now
+        try:
+            self.path.touch()
+        except OSError as e:
+            logger.warning(f"⚠️ Cannot update health file {self.path}: {e}")
+
+    def clear(self) -> None:
+        if self.path is None:
+            return
+        self._last_beat = float("-inf")
+        self.path.unlink(missing_ok=True)
@@ -1,12 +1,28 @@
+import functools
 import logging
 import os
+import queue
+import secrets
 import sys
+import threading
 import time
-from typing import Any, Optional, Tuple
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
 
 import pika
 import pika.exceptions
 import pika.exchange_type
+from opentelemetry import metrics
+
+from core.backoff import backoff_delay
+from core.config import (
+    PAYMENT_PARTITIONS,
+    RABBITMQ_CONNECT_BACKOFF_MAX_SECONDS,
+    RABBITMQ_CONNECT_BACKOFF_SECONDS,
+    RABBITMQ_CONNECT_RETRIES,
+    RETRY_DELAYS_MS,
+    RETRY_JITTER,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,18 +35,94 @@ logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
+PAYMENT_EVENTS_QUEUE = "payment_events"
+
+# 訊息已經被重試過幾次 (放在 headers 裡跟著訊息走)
+RETRY_COUNT_HEADER = "x-retry-count"
+# 從 DLQ 回放的訊息 (replay_dlq.py 會加上)
+REPLAY_HEADER = "x-replayed"
+
+meter = metrics.get_meter(__name__)
+
+batch_size_histogram = meter.create_histogram(
+    "flowpay.publisher.batch.size",
+    unit="{message}",
+    description="Number of messages in each flushed publish batch",
+)
+batch_fill_histogram = meter.create_histogram(
+    "flowpay.publisher.batch.fill_ratio",
+    description="Flushed batch size divided by the configured max batch size",
+)
+publish_duration_histogram = meter.create_histogram(
+    "flowpay.publisher.publish.duration",
+    unit="ms",
+    description="Time from publish() until the broker confirmed the message",
+)
+
+
+def partition_queue_name(partition: int, queue_name: str = PAYMENT_EVENTS_QUEUE) -> str:
+    return f"{queue_name}.p{partition}"
+
+
+def is_partition_queue(queue_name: str) -> bool:
+    base, _, suffix = queue_name.rpartition(".p")
+    return base == PAYMENT_EVENTS_QUEUE and suffix.isdigit()
+
+
+def partition_of(key: str, partitions: int = PAYMENT_PARTITIONS) -> int:
+    """crc32 在每個 process / 每次重啟都一樣 (內建的 hash() 不是)"""
+    return zlib.crc32(key.encode()) % max(partitions, 1)
+
+
+def payment_queue_names(
+    partitions: int = PAYMENT_PARTITIONS, queue_name: str = PAYMENT_EVENTS_QUEUE
+) -> List[str]:
+    """partitions <= 1 時就是原本單一的 Queue"""
+    if partitions <= 1:
+        return [queue_name]
+    return [partition_queue_name(i, queue_name) for i in range(partitions)]
+
+
+def payment_routing_key(order_id: str, partitions: int = PAYMENT_PARTITIONS) -> str:
+    """同一筆訂單永遠進同一個 partition (直接發到 Queue，routing key = Queue 名稱)"""
+    if partitions <= 1:
+        return PAYMENT_EVENTS_QUEUE
+    return partition_queue_name(partition_of(order_id, partitions))
+
+
+def dead_letter_routing_key(queue_name: str) -> str:
+    # 所有 DLQ 共用同一個 DLX (direct)，用 routing key 區分
+    # payment_events 沿用舊的 "dead_letter" (已存在的 Queue 參數不能改)
+    return "dead_letter" if queue_name == PAYMENT_EVENTS_QUEUE else f"{queue_name}.dlq"
+
+
+class BrokerUnavailable(RuntimeError):
+    """重試完還是連不上 RabbitMQ (或帳密錯誤)"""
+
 
 class RabbitMQConnector:
     def __init__(
         self,
         host: str = "localhost",
         port: int = 5672,
-        queue_name: str = "payment_events",
+        queue_name: str = PAYMENT_EVENTS_QUEUE,
+        retry_delays_ms: Optional[List[int]] = None,
+        partitions: Optional[int] = None,
     ) -> None:
         self.host = host
         self.port = port
         self.queue_name = queue_name
         self.dlq_name = f"{queue_name}.dlq"
+        self.retry_delays_ms = (
+            RETRY_DELAYS_MS if retry_delays_ms is None else retry_delays_ms
+        )
+        self.dead_letter_routing_key = dead_letter_routing_key(queue_name)
+        # 只有 payment_events 預設照 PAYMENT_PARTITIONS 切
+        if partitions is None:
+            partitions = PAYMENT_PARTITIONS if queue_name == PAYMENT_EVENTS_QUEUE else 1
+        self.partitions = partitions
+        # 實際存在的 Queue (各自有自己的 DLQ / 重試佇列)
+        self.queue_names = payment_queue_names(partitions, queue_name)
 
         self.username = os.getenv("RABBITMQ_USER", "poposing")
         self.password = os.getenv("RABBITMQ_PASS", "poposing1234")
@@ -40,11 +132,20 @@ class RabbitMQConnector:
         self._connection: Optional[Any] = None
         self._channel: Optional[Any] = None
 
-    def connect(self, retries: int = 5, delay: int = 2) -> Tuple[Any, Any]:
-        while retries > 0:
+    def connect(
+        self,
+        retries: int = RABBITMQ_CONNECT_RETRIES,
+        backoff: float = RABBITMQ_CONNECT_BACKOFF_SECONDS,
+        declare: bool = True,
+    ) -> Tuple[Any, Any]:
+        """
+        連線 + 開 channel (+ 宣告 Topology)
+        連不上時指數退避重試 retries 次，還是不行 (或帳密錯誤) 就拋 BrokerUnavailable，
+        要不要結束 process 由呼叫端決定
+        """
+        credentials = pika.PlainCredentials(self.username, self.password)
+        for attempt in range(max(retries, 1)):
             try:
-                credentials = pika.PlainCredentials(self.username, self.password)
-
                 self._connection = pika.BlockingConnection(
                     pika.ConnectionParameters(
                         host=self.host,
@@ -59,27 +160,12 @@ class RabbitMQConnector:
                 if self._channel is None:
                     raise RuntimeError("Failed to create RabbitMQ channel")
 
-                # --- DLX 設定 ---
-                dlx_name = "dlx_payment"
-                self._channel.exchange_declare(
-                    exchange=dlx_name,
-                    exchange_type=pika.exchange_type.ExchangeType.direct,
-                )
-                self._channel.queue_declare(queue=self.dlq_name, durable=True)
-                self._channel.queue_bind(
-                    exchange=dlx_name, queue=self.dlq_name, routing_key="dead_letter"
-                )
-
-                arguments = {
-                    "x-dead-letter-exchange": dlx_name,
-                    "x-dead-letter-routing-key": "dead_letter",
-                }
-                self._channel.queue_declare(
-                    queue=self.queue_name, durable=True, arguments=arguments
-                )
+                if declare:
+                    self.declare_topology(self._channel)
 
                 logger.info(
-                    f"✅ Connected to RabbitMQ as {self.username}. DLQ configured."
+                    f"✅ Connected to RabbitMQ as {self.username}."
+                    + (" DLQ configured." if declare else "")
                 )
 
                 # 這裡再次檢查 connection，滿足 Mypy
@@ -88,18 +174,260 @@ class RabbitMQConnector:
 
                 return self._connection, self._channel
 
+            # 帳密錯誤重試也沒用 (要先接，它是 AMQPConnectionError 的子類別)
+            except pika.exceptions.ProbableAuthenticationError as e:
+                logger.error("❌ Authentication failed! Check your username/password.")
+                raise BrokerUnavailable("RabbitMQ authentication failed") from e
             # [修正 4] 使用 pika.exceptions
             except pika.exceptions.AMQPConnectionError as e:
-                logger.warning(f"⚠️ Connection failed ({e}). Retrying...")
-                retries -= 1
+                if attempt + 1 >= retries:
+                    logger.error("❌ Could not connect to RabbitMQ.")
+                    raise BrokerUnavailable(
+                        f"Could not connect to RabbitMQ at {self.host}:{self.port}"
+                    ) from e
+                delay = backoff_delay(
+                    attempt, backoff, RABBITMQ_CONNECT_BACKOFF_MAX_SECONDS
+                )
+                logger.warning(
+                    f"⚠️ Connection failed ({e}). Retrying in {delay:.1f}s..."
+                )
                 time.sleep(delay)
-            except pika.exceptions.ProbableAuthenticationError:
-                logger.error("❌ Authentication failed! Check your username/password.")
-                sys.exit(1)
 
-        logger.error("❌ Could not connect to RabbitMQ.")
-        sys.exit(1)
+        raise BrokerUnavailable("RabbitMQ connect() called with retries < 1")
+
+    def declare_topology(self, channel: Any) -> None:
+        """
+        宣告 DLX / DLQ / 主 Queue (有 partition 時每個 partition 各一套)
+        (長連線的 Publisher 只需要在啟動時宣告一次)
+        """
+        # --- DLX 設定 ---
+        dlx_name = "dlx_payment"
+        channel.exchange_declare(
+            exchange=dlx_name,
+            exchange_type=pika.exchange_type.ExchangeType.direct,
+        )
+        for queue_name in self.queue_names:
+            self._declare_queue(channel, dlx_name, queue_name)
+
+    def _declare_queue(self, channel: Any, dlx_name: str, queue_name: str) -> None:
+        dlq_name = f"{queue_name}.dlq"
+        routing_key = dead_letter_routing_key(queue_name)
+        channel.queue_declare(queue=dlq_name, durable=True)
+        channel.queue_bind(exchange=dlx_name, queue=dlq_name, routing_key=routing_key)
+
+        arguments: Dict[str, Any] = {
+            "x-dead-letter-exchange": dlx_name,
+            "x-dead-letter-routing-key": routing_key,
+        }
+        if is_partition_queue(queue_name):
+            # 同一個 partition 同時只有一個 consumer 在收 (lease 交接時也不會重疊)，
+            # 同一筆訂單的事件才會照順序處理
+            arguments["x-single-active-consumer"] = True
+        channel.queue_declare(queue=queue_name, durable=True, arguments=arguments)
+
+        # --- 延遲重試佇列 ---
+        # 沒有 consumer，訊息放到 TTL 到期後 dead-letter 回主 Queue
+        for delay_ms in self.retry_delays_ms:
+            channel.queue_declare(
+                queue=retry_queue_name(queue_name, delay_ms),
+                durable=True,
+                arguments={
+                    "x-message-ttl": delay_ms,
+                    "x-dead-letter-exchange": "",
+                    # 回到自己的 Queue (partition 模式下是 payment_events.pK)
+                    "x-dead-letter-routing-key": queue_name,
+                },
+            )
 
     def close(self) -> None:
         if self._connection and not self._connection.is_closed:
             self._connection.close()
+
+
+def retry_queue_name(queue_name: str, delay_ms: int) -> str:
+    return f"{queue_name}.retry.{delay_ms}ms"
+
+
+def retry_delay_ms(
+    attempt: int,
+    delays_ms: Optional[List[int]] = None,
+    jitter: float = RETRY_JITTER,
+) -> Tuple[int, int]:
+    """
+    第 attempt 次重試 (從 1 開始) 要用哪一層重試佇列，以及加上 jitter 的實際延遲
+    回傳 (tier_delay_ms, expiration_ms)
+    """
+    delays = RETRY_DELAYS_MS if delays_ms is None else delays_ms
+    tier = delays[min(attempt, len(delays)) - 1]
+    # per-message expiration 只能比佇列 TTL 短，所以 jitter 往下抖
+    expiration = int(tier * (1 - jitter * secrets.randbelow(1000) / 1000))
+    return tier, max(expiration, 1)
+
+
+class ThreadSafeChannel:
+    """
+    給 Thread Pool 裡的 handler 使用的 channel 代理
+    pika 的 channel 只能在建立連線的那個 thread 操作，
+    所以 ack / nack 都透過 add_callback_threadsafe 排回 I/O thread 執行。
+    """
+
+    def __init__(self, connection: Any, channel: Any) -> None:
+        self._connection = connection
+        self._channel = channel
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False) -> None:
+        self._connection.add_callback_threadsafe(
+            functools.partial(
+                self._channel.basic_ack, delivery_tag=delivery_tag, multiple=multiple
+            )
+        )
+
+    def basic_nack(
+        self, delivery_tag: int, multiple: bool = False, requeue: bool = True
+    ) -> None:
+        self._connection.add_callback_threadsafe(
+            functools.partial(
+                self._channel.basic_nack,
+                delivery_tag=delivery_tag,
+                multiple=multiple,
+                requeue=requeue,
+            )
+        )
+
+    def basic_publish(
+        self, exchange: str, routing_key: str, body: bytes, properties: Any = None
+    ) -> None:
+        self._connection.add_callback_threadsafe(
+            functools.partial(
+                self._channel.basic_publish,
+                exchange=exchange,
+                routing_key=routing_key,
+                body=body,
+                properties=properties,
+            )
+        )
+
+
+# 連線斷掉 / channel 被關掉時可以透過重連恢復的錯誤
+RECOVERABLE_ERRORS = (
+    pika.exceptions.AMQPConnectionError,
+    pika.exceptions.AMQPChannelError,
+    pika.exceptions.StreamLostError,
+)
+
+
+class PublisherPool:
+    """
+    長連線的 Publisher 連線池
+    App 啟動時建立一次，所有 Request 共用，不再每個 Request 重新握手。
+    - Topology (DLX / DLQ / Queue) 只在第一條連線宣告一次
+    - 開啟 Publisher Confirms，publish 回傳代表 Broker 已經收下 (durably queued)
+    - 連線斷掉時自動重連並重送一次
+    """
+
+    def __init__(
+        self,
+        size: int = 4,
+        host: str = "localhost",
+        port: int = 5672,
+        queue_name: str = "payment_events",
+        checkout_timeout: float = 5.0,
+    ) -> None:
+        self.size = size
+        self.host = host
+        self.port = port
+        self.queue_name = queue_name
+        self.checkout_timeout = checkout_timeout
+
+        # pika 的 BlockingConnection 不是 thread-safe
+        # 所以一條連線同一時間只借給一個 thread 使用
+        self._idle: "queue.Queue[Tuple[RabbitMQConnector, Any]]" = queue.Queue()
+        self._all: List[RabbitMQConnector] = []
+        self._lock = threading.Lock()
+        self._topology_declared = False
+        self._started = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._idle.put(self._open())
+        logger.info(f"✅ Publisher pool ready ({self.size} connections).")
+
+    def _open(self) -> Tuple[RabbitMQConnector, Any]:
+        connector = RabbitMQConnector(
+            host=self.host, port=self.port, queue_name=self.queue_name
+        )
+        with self._lock:
+            _, channel = connector.connect(declare=not self._topology_declared)
+            self._topology_declared = True
+            self._all.append(connector)
+        channel.confirm_delivery()
+        return connector, channel
+
+    def _reopen(self, connector: RabbitMQConnector) -> Tuple[RabbitMQConnector, Any]:
+        try:
+            connector.close()
+        except Exception:
+            logger.debug("Publisher connection already closed.")
+        with self._lock:
+            if connector in self._all:
+                self._all.remove(connector)
+        return self._open()
+
+    def publish(
+        self,
+        body: bytes,
+        headers: Optional[Dict[str, Any]] = None,
+        routing_key: Optional[str] = None,
+        content_type: Optional[str] = None,
+    ) -> None:
+        """
+        發送一則持久化訊息，等到 Broker confirm 才回傳
+        Broker 拒收 (Nack / Unroutable) 時會拋出例外
+        """
+        properties = pika.BasicProperties(
+            delivery_mode=2,  # 訊息持久化，RabbitMQ重啟不會消失
+            headers=headers,
+            content_type=content_type,
+        )
+        # 第一次 publish 時才建立連線
+        self.start()
+        started = time.perf_counter()
+        connector, channel = self._idle.get(timeout=self.checkout_timeout)
+        try:
+            for attempt in range(2):
+                try:
+                    # 順便處理 heartbeat，並提早發現已經斷掉的連線
+                    channel.connection.process_data_events(time_limit=0)
+                    channel.basic_publish(
+                        exchange="",
+                        routing_key=routing_key or self.queue_name,
+                        body=body,
+                        properties=properties,
+                        mandatory=True,
+                    )
+                    return
+                except RECOVERABLE_ERRORS as e:
+                    if attempt > 0:
+                        raise
+                    logger.warning(
+                        f"⚠️ Publisher connection lost ({e}). Reconnecting..."
+                    )
+                    connector, channel = self._reopen(connector)
+        finally:
+            self._idle.put((connector, channel))
+            publish_duration_histogram.record(
+                (time.perf_counter() - started) * 1000, {"publisher": "pool"}
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            for connector in self._all:
+                try:
+                    connector.close()
+                except Exception:
+                    logger.debug("Publisher connection already closed.")
+            self._all.clear()
@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import FrameType
+from typing import Deque, Dict, Iterator, Optional
+
+from opentelemetry import metrics, trace
+
+from core.config import (
+    PROFILE_DIR,
+    PROFILE_INTERVAL_MS,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SLOW_MESSAGES,
+    SLOW_MESSAGE_THRESHOLD_MS,
+    STAGE_STATS_LOG_INTERVAL_SECONDS,
+    STAGE_STATS_WINDOW,
+)
+
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter(__name__)
+stage_duration_histogram = meter.create_histogram(
+    "flowpay.worker.stage.duration",
+    unit="ms",
+    description="Time spent in each worker / payment stage",
+)
+
+
+class RollingPercentiles:
+    """保留最近 window 筆數值，算 p50 / p95 / p99"""
+
+    def __init__(self, window: int = STAGE_STATS_WINDOW) -> None:
+        self._values: Deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self._values.append(value)
+        self.count += 1
+
+    def percentiles(self) -> Dict[str, float]:
+        values = sorted(self._values)
+        if not values:
+            return {}
+
+        def pick(q: float) -> float:
+            return round(values[min(int(q * len(values)), len(values) - 1)], 2)
+
+        return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+class StageStats:
+    """每個階段一組 RollingPercentiles (多個 thread 共用)"""
+
+    def __init__(
+        self,
+        window: int = STAGE_STATS_WINDOW,
+        log_interval: float = STAGE_STATS_LOG_INTERVAL_SECONDS,
+    ) -> None:
+        self.window = window
+        self.log_interval = log_interval
+        self._stages: Dict[str, RollingPercentiles] = {}
+        self._lock = threading.Lock()
+        self._last_log = time.monotonic()
+
+    def record(self, stage_name: str, ms: float) -> None:
+        with self._lock:
+            stats = self._stages.get(stage_name)
+            if stats is None:
+                stats = self._stages[stage_name] = RollingPercentiles(self.window)
+            stats.add(ms)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {**stats.percentiles(), "count": stats.count}
+                for name, stats in self._stages.items()
+            }
+
+    def maybe_log(self) -> None:
+        """每 log_interval 秒印一次各階段的百分位數"""
+        if self.log_interval <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_log < self.log_interval:
+                return
+            self._last_log = now
+        logger.info(f" ⏱️ Stage percentiles (ms): {json.dumps(self.snapshot())}")
+
+
+stage_stats = StageStats()
+
+
+def collapse_stack(frame: Optional[FrameType]) -> str:
+    """frame -> 'file:func;file:func;...' (最外層在前，collapsed stack 格式)"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    取樣 profiler：背景 thread 每 interval 抓一次指定 thread 的 stack
+    只有在有人要 profile 的時候才會真的抓，平常只是在睡
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS) -> None:
+        self.interval = interval_ms / 1000
+        self._targets: Dict[int, "Counter[str]"] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: int) -> None:
+        with self._lock:
+            self._targets[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="stack-sampler", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, thread_id: int) -> "Counter[str]":
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._targets:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._targets.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[collapse_stack(frame)] += 1
+
+
+sampler = StackSampler()
+
+
+class MessageProfile:
+    """一筆訊息 (或一個批次) 的分段耗時"""
+
+    def __init__(self, label: str, mode: str = "single") -> None:
+        self.label = label
+        self.mode = mode
+        self.stages: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+
+_current_profile: ContextVar[Optional[MessageProfile]] = ContextVar(
+    "flowpay_message_profile", default=None
+)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    量一個階段的耗時：記到 metrics、rolling percentiles，
+    以及目前這筆訊息的分段明細 (如果有的話)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        profile = _current_profile.get()
+        mode = profile.mode if profile else "single"
+        stage_duration_histogram.record(ms, {"stage": name, "mode": mode})
+        stage_stats.record(name, ms)
+        if profile is not None:
+            profile.stages[name] = profile.stages.get(name, 0.0) + ms
+
+
+def _write_profile(label: str, stacks: "Counter[str]") -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = re.sub(r"[^A-Za-z0-9_.-]", "_", label)[:64]
+    path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{safe_label}.folded")
+    with open(path, "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+@contextmanager
+def profile_message(label: str = "", mode: str = "single") -> Iterator[MessageProfile]:
+    """
+    包住一筆訊息的處理：
+    - 超過 SLOW_MESSAGE_THRESHOLD_MS 就印出結構化的分段明細
+    - 開啟 profiler 時，被抽中的 / 慢的訊息會另外輸出一份 stack profile
+    """
+    profile = MessageProfile(label, mode)
+    token = _current_profile.set(profile)
+    sampled = random.random() < PROFILE_SAMPLE_RATE  # noqa: S311
+    capture = sampled or PROFILE_SLOW_MESSAGES
+    thread_id = threading.get_ident()
+    if capture:
+        sampler.start(thread_id)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+        stacks = sampler.stop(thread_id) if capture else Counter()
+        total_ms = profile.elapsed_ms()
+        slow = total_ms >= SLOW_MESSAGE_THRESHOLD_MS
+
+        profile_path = None
+        if stacks and (sampled or slow):
+            try:
+                profile_path = _write_profile(profile.label, stacks)
+            except OSError as e:
+                logger.warning(f" ⚠️ Failed to write profile: {e}")
+
+        if slow:
+            span_context = trace.get_current_span().get_span_context()
+            breakdown = {
+                "event": "slow_message",
+                "label": profile.label,
+                "mode": profile.mode,
+                "total_ms": round(total_ms, 2),
+                "stages_ms": {k: round(v, 2) for k, v in profile.stages.items()},
+                "stage_p99_ms": {
+                    name: stats.get("p99")
+                    for name, stats in stage_stats.snapshot().items()
+                    if name in profile.stages
+                },
+                "trace_id": (
+                    f"{span_context.trace_id:032x}" if span_context.is_valid else None
+                ),
+                "profile": profile_path,
+            }
+            logger.warning(f" 🐢 Slow message: {json.dumps(breakdown)}")
+        elif profile_path:
+            logger.info(f" 🔬 Sampled profile for {profile.label}: {profile_path}")
+
+        stage_stats.maybe_log()
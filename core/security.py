@@ -1,43 +1,74 @@
+import functools
 import hashlib
 import hmac
 import logging
 import os
-from typing import Any, Dict
+from typing import Any, Callable, Coroutine, Tuple
 
-from fastapi import HTTPException, Request
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
 
 logger = logging.getLogger(__name__)
 
 # get from env
 SECRET_KEY = os.getenv("SECRET_KEY", "my_suer_secret_key")  # noqa: S105
+# 換 key 時先部署 "new,old"，上游全部切到新 key 之後再拿掉舊的
+SECRET_KEYS = os.getenv("SECRET_KEYS", SECRET_KEY)
 
 
-async def verify_signature(request: Request) -> bool:
+@functools.lru_cache(maxsize=1)
+def signing_keys() -> Tuple["hmac.HMAC", ...]:
     """
-    Verify the signature (HMAC-SHA256)
+    每把 key 先建好一個 HMAC 物件，每個 Request 只要 copy() 再 update(body)
+    (省掉每次重新處理 key 的成本)
     """
+    return tuple(
+        hmac.new(key.strip().encode(), digestmod=hashlib.sha256)
+        for key in SECRET_KEYS.split(",")
+        if key.strip()
+    )
 
-    # 1. header signature
-    signature = request.headers.get("X-Signature")
-    if not signature:
-        logger.warning(" X-Signature header is missing")
-        raise HTTPException(status_code=403, detail="X-Signature header is required")
 
-    # 2. get body, 在FastAPI裡面body 讀去後要重置，不然後面會拿不到
-    body_bytes = await request.body()
+def is_valid_signature(body: bytes, signature: str) -> bool:
+    """
+    Verify the signature (HMAC-SHA256) against every active key
+    """
+    for base in signing_keys():
+        mac = base.copy()
+        mac.update(body)
+        if hmac.compare_digest(signature, mac.hexdigest()):
+            return True
+    return False
+
+
+class SignedRoute(APIRoute):
+    """
+    需要驗簽的路由
+    body 只讀一次：驗完簽之後 Starlette 會快取在 Request 上，
+    handler 再呼叫 request.body() 拿到的是同一份 bytes，不用重設 _receive。
+    """
 
-    async def receive() -> Dict[str, Any]:
-        return {"type": "http.request", "body": body_bytes}
+    def get_route_handler(
+        self,
+    ) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
 
-    request._receive = receive
+        async def signed_handler(request: Request) -> Response:
+            # 1. header signature
+            signature = request.headers.get("X-Signature")
+            if not signature:
+                logger.warning(" X-Signature header is missing")
+                raise HTTPException(
+                    status_code=403, detail="X-Signature header is required"
+                )
 
-    # 3. caculate HMAC
-    expected_signature = hmac.new(
-        SECRET_KEY.encode(), body_bytes, hashlib.sha256
-    ).hexdigest()
+            # 2. read body once & compare
+            body_bytes = await request.body()
+            if not is_valid_signature(body_bytes, signature):
+                logger.error(" X-Signature header is invalid")
+                raise HTTPException(
+                    status_code=403, detail="X-Signature header is invalid"
+                )
+            return await handler(request)
 
-    # 4. compare
-    if not hmac.compare_digest(signature, expected_signature):
-        logger.error(" X-Signature header is invalid")
-        raise HTTPException(status_code=403, detail="X-Signature header is invalid")
-    return True
+        return signed_handler
@@ -1,19 +1,120 @@
+import logging
 import os
-from typing import Optional
-
-from fastapi import FastAPI
-from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
-from opentelemetry.instrumentation.pika import PikaInstrumentor
-from opentelemetry.instrumentation.redis import RedisInstrumentor
-from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
+
+import prometheus_client
+from opentelemetry import metrics, trace
+from opentelemetry.context import Context
+from opentelemetry.exporter.prometheus import PrometheusMetricReader
+from opentelemetry.metrics import Histogram
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, View
 from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor, TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
 from sqlalchemy import Engine
 
+from core.config import (
+    METRICS_PORT_RANGE,
+    OTEL_PYTHON_DISABLED_INSTRUMENTATIONS,
+    TRACE_SAMPLE_RATIO,
+    TRACE_TAIL_LATENCY_MS,
+    TRACE_TAIL_MAX_PENDING,
+    TRACE_TAIL_SAMPLE_RATIO,
+)
+
+if TYPE_CHECKING:
+    from fastapi import FastAPI
+
+# OTLP exporter / auto-instrumentation 套件 import 很慢 (加起來幾百毫秒)，
+# 只在真的要初始化的函式裡才 import，import 這個模組本身很輕
+
+logger = logging.getLogger(__name__)
+
+# 延遲類 histogram 的 bucket (毫秒)
+LATENCY_BUCKETS_MS = (
+    1, 2, 5, 10, 25, 50, 75, 100, 250, 500, 750, 1000, 2500, 5000, 10000,
+)  # fmt: skip
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Tail sampling (單一 process 內)：
+    同一個 trace 的 span 先暫存，等本地的 root span 結束後再決定整個 trace 要不要送出
+    - 有任何 span 出錯 -> 保留
+    - root span 超過 latency_threshold_ms -> 保留
+    - 其他的只保留 keep_ratio
+    """
+
+    def __init__(
+        self,
+        delegate: SpanProcessor,
+        keep_ratio: float = TRACE_TAIL_SAMPLE_RATIO,
+        latency_threshold_ms: float = TRACE_TAIL_LATENCY_MS,
+        max_pending_traces: int = TRACE_TAIL_MAX_PENDING,
+    ) -> None:
+        self.delegate = delegate
+        self.keep_ratio = keep_ratio
+        self.latency_threshold_ns = latency_threshold_ms * 1_000_000
+        self.max_pending_traces = max_pending_traces
+        self._pending: "OrderedDict[int, List[ReadableSpan]]" = OrderedDict()
+        # root 結束後才結束的 span (例如背景工作) 照同一個決定處理
+        self._decided: "OrderedDict[int, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        self.delegate.on_start(span, parent_context=parent_context)
+
+    def _keep(self, spans: List[ReadableSpan], root: ReadableSpan) -> bool:
+        if any(s.status.status_code == StatusCode.ERROR for s in spans):
+            return True
+        if root.start_time is not None and root.end_time is not None:
+            if root.end_time - root.start_time >= self.latency_threshold_ns:
+                return True
+        return random.random() < self.keep_ratio  # noqa: S311
+
+    def on_end(self, span: ReadableSpan) -> None:
+        context = span.get_span_context()
+        if context is None:
+            return
+        trace_id = context.trace_id
+        is_local_root = span.parent is None or span.parent.is_remote
+
+        with self._lock:
+            decided = self._decided.get(trace_id)
+            if decided is not None:
+                spans = [span] if decided else []
+            else:
+                pending = self._pending.setdefault(trace_id, [])
+                pending.append(span)
+                if not is_local_root:
+                    # 太多 trace 在等 root (例如 root 永遠沒結束) -> 丟掉最舊的
+                    while len(self._pending) > self.max_pending_traces:
+                        self._pending.popitem(last=False)
+                    return
+                del self._pending[trace_id]
+                keep = self._keep(pending, span)
+                self._decided[trace_id] = keep
+                while len(self._decided) > self.max_pending_traces:
+                    self._decided.popitem(last=False)
+                spans = pending if keep else []
+
+        for finished in spans:
+            self.delegate.on_end(finished)
+
+    def shutdown(self) -> None:
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
+
 
 def setup_telemetry(service_name: str) -> TracerProvider:
     """
@@ -30,44 +131,144 @@ def setup_telemetry(service_name: str) -> TracerProvider:
         }
     )
 
-    # 2. 設定 Trace Provider
-    provider = TracerProvider(resource=resource)
+    # 2. 設定 Trace Provider (head sampling：沒被取樣的 span 幾乎沒有成本)
+    sampler = ParentBased(root=TraceIdRatioBased(TRACE_SAMPLE_RATIO))
+    provider = TracerProvider(resource=resource, sampler=sampler)
 
     # 3. 設定Exporter (send to Jaeger)
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+        OTLPSpanExporter,
+    )
+
     otlp_endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
     exporter = OTLPSpanExporter(endpoint=otlp_endpoint, insecure=True)
     # exporter = ConsoleSpanExporter()
 
     # 4. 加入 Processor (Enhancing batch process performance)
-    processor = BatchSpanProcessor(exporter)
+    processor: SpanProcessor = BatchSpanProcessor(exporter)
+    if TRACE_TAIL_SAMPLE_RATIO < 1.0:
+        processor = TailSamplingSpanProcessor(processor)
     provider.add_span_processor(processor)
 
     # 設定全域 Provider
     trace.set_tracer_provider(provider)
+
+    # 5. Metrics：不管 trace 取樣多少，效能數字都從這裡來
+    setup_metrics(resource)
+    return provider
+
+
+def setup_metrics(resource: Resource) -> MeterProvider:
+    """
+    OTel Metrics -> Prometheus (pull)
+    API 用 /metrics 曝露，Worker / Callback 另外開一個 HTTP port
+    """
+    reader = PrometheusMetricReader()
+    provider = MeterProvider(
+        resource=resource,
+        metric_readers=[reader],
+        views=[
+            View(
+                instrument_name="flowpay.*.duration",
+                aggregation=ExplicitBucketHistogramAggregation(LATENCY_BUCKETS_MS),
+            )
+        ],
+    )
+    metrics.set_meter_provider(provider)
     return provider
 
 
-def instrument_app(app: Optional[FastAPI], engine: Optional[Engine] = None) -> None:
+def start_metrics_server(port: int, port_range: int = METRICS_PORT_RANGE) -> int:
+    """
+    開一個 Prometheus 可以 scrape 的 HTTP server (背景 thread)
+    port 被同機器上的其他 Worker 用掉時往上找，回傳實際使用的 port (0 = 沒開)
+    """
+    if port <= 0:
+        return 0
+    for candidate in range(port, port + max(port_range, 1)):
+        try:
+            prometheus_client.start_http_server(candidate)
+        except OSError:
+            continue
+        logger.info(f" 📈 Metrics available on :{candidate}/metrics")
+        return candidate
+    logger.warning(f" ⚠️ No free metrics port in {port}-{port + port_range - 1}")
+    return 0
+
+
+def render_metrics() -> bytes:
+    """給 API 的 /metrics endpoint 用"""
+    return prometheus_client.generate_latest()
+
+
+@contextmanager
+def timed(
+    histogram: Histogram, attributes: Optional[Dict[str, str]] = None
+) -> Iterator[None]:
+    """量一段程式的執行時間 (毫秒) 記到 histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.record((time.perf_counter() - start) * 1000, attributes)
+
+
+def disabled_instrumentations() -> List[str]:
+    return [
+        name.strip().lower()
+        for name in OTEL_PYTHON_DISABLED_INSTRUMENTATIONS.split(",")
+        if name.strip()
+    ]
+
+
+def instrument_fastapi(app: "FastAPI") -> None:
+    """
+    FastAPI 的 middleware 要在 app 收到第一個 ASGI 呼叫 (包括 lifespan) 之前掛上，
+    所以 API 在 import 時呼叫這個，其餘的 instrumentation 留到 lifespan
+    (/metrics 跟探針本身不用 trace)
+    """
+    if "fastapi" in disabled_instrumentations():
+        return
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics,healthz,readyz")
+
+
+def instrument_app(app: Optional["FastAPI"], engine: Optional[Engine] = None) -> None:
     """
     Auto-Instrument OpenTelemetry app
+    OTEL_PYTHON_DISABLED_INSTRUMENTATIONS 裡列出的不會開 (fastapi, sqlalchemy,
+    pika, redis, httpx)
     :param app:
     :param engine:
     :return:
     """
+    disabled = disabled_instrumentations()
 
     # 1. FastAPI
     if app:
-        FastAPIInstrumentor.instrument_app(app)
+        instrument_fastapi(app)
 
     # 2. SQLAlchemy (DB)
-    if engine:
+    if engine and "sqlalchemy" not in disabled:
+        from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+
         SQLAlchemyInstrumentor().instrument(engine=engine)
 
     # 3. pika (RabbitMQ)
-    PikaInstrumentor().instrument()
+    if "pika" not in disabled:
+        from opentelemetry.instrumentation.pika import PikaInstrumentor
+
+        PikaInstrumentor().instrument()
 
     # 4. redis
-    RedisInstrumentor().instrument()
+    if "redis" not in disabled:
+        from opentelemetry.instrumentation.redis import RedisInstrumentor
+
+        RedisInstrumentor().instrument()
 
     # 5. HTTPX
-    HTTPXClientInstrumentor().instrument()
+    if "httpx" not in disabled:
+        from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+
+        HTTPXClientInstrumentor().instrument()
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from core.backoff import backoff_delay
+from core.config import (
+    CALLBACK_BACKOFF_BASE_SECONDS,
+    CALLBACK_BACKOFF_MAX_SECONDS,
+    CALLBACK_MAX_ATTEMPTS,
+    CALLBACK_PER_HOST_BACKLOG,
+    CALLBACK_PER_HOST_CONCURRENCY,
+    CALLBACK_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# deliver() 的結果
+DELIVERED = "delivered"
+FAILED = "failed"  # 商家明確拒絕 (4xx) -> DLQ
+RETRY = "retry"  # process 內的重試用完還是失敗 -> 丟進重試佇列晚點再送
+DEFERRED = "deferred"  # 這個 host 排隊太多，先丟回 Queue 尾端
+
+# 4xx 裡面值得重試的狀態碼
+_RETRYABLE_CLIENT_ERRORS = {408, 425, 429}
+
+
+def encode_callback_task(url: str, order_id: str, status: str) -> bytes:
+    """Worker 丟進 callback queue 的訊息格式"""
+    return json.dumps({"url": url, "order_id": order_id, "status": status}).encode()
+
+
+def decode_callback_task(body: bytes) -> Dict[str, str]:
+    task = json.loads(body)
+    return {"url": task["url"], "order_id": task["order_id"], "status": task["status"]}
+
+
+class CallbackDispatcher:
+    """
+    非同步的商家 Callback 派送器
+    - 共用一個有連線池的 httpx.AsyncClient
+    - 失敗先在 process 內用 exponential backoff 重試幾次 (短暫的錯誤)，
+      還是失敗就回傳 RETRY，由呼叫端丟進重試佇列等久一點再送 (不佔 prefetch)
+    - 每個商家 host 有自己的併發上限，壞掉的 host 不會餓死其他人
+    """
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        per_host_concurrency: int = CALLBACK_PER_HOST_CONCURRENCY,
+        per_host_backlog: int = CALLBACK_PER_HOST_BACKLOG,
+        max_attempts: int = CALLBACK_MAX_ATTEMPTS,
+        backoff_base: float = CALLBACK_BACKOFF_BASE_SECONDS,
+        backoff_max: float = CALLBACK_BACKOFF_MAX_SECONDS,
+        defer_seconds: float = 1.0,
+    ) -> None:
+        self._client = client or httpx.AsyncClient(
+            timeout=CALLBACK_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=100,
+            ),
+        )
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_backlog = per_host_backlog
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.defer_seconds = defer_seconds
+
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._pending: Dict[str, int] = {}
+
+    async def deliver(self, url: str, payload: Dict[str, Any]) -> str:
+        host = urlsplit(url).netloc
+        if self._pending.get(host, 0) >= self.per_host_backlog:
+            # 先讓出位置給其他 host，稍等再丟回 Queue，避免原地空轉
+            await asyncio.sleep(self.defer_seconds)
+            return DEFERRED
+
+        self._pending[host] = self._pending.get(host, 0) + 1
+        semaphore = self._semaphores.setdefault(
+            host, asyncio.Semaphore(self.per_host_concurrency)
+        )
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                async with semaphore:
+                    retryable = await self._post(url, payload)
+                if retryable is None:
+                    return DELIVERED
+                if not retryable:
+                    logger.error(f" ❌ [Callback] {url} rejected {payload}")
+                    return FAILED
+                if attempt == self.max_attempts:
+                    break
+                # 等待期間不佔用這個 host 的併發名額
+                # attempt 從 1 開始；full jitter，商家恢復時不會被一起打
+                await asyncio.sleep(
+                    backoff_delay(
+                        attempt - 1, self.backoff_base, self.backoff_max, jitter=1.0
+                    )
+                )
+            logger.warning(f" ⏳ [Callback] {url} still failing, retrying later")
+            return RETRY
+        finally:
+            self._pending[host] -= 1
+            if self._pending[host] == 0:
+                del self._pending[host]
+                self._semaphores.pop(host, None)
+
+    async def _post(self, url: str, payload: Dict[str, Any]) -> Optional[bool]:
+        """送一次 callback；成功回傳 None，失敗回傳「值不值得重試」"""
+        try:
+            response = await self._client.post(url, json=payload)
+        except httpx.HTTPError as e:
+            logger.warning(f" ⚠️ [Callback] {url} failed: {e!r}")
+            return True
+
+        if response.is_success:
+            logger.info(f" ✅ [Callback] Notification delivered to {url}.")
+            return None
+        logger.warning(f" ⚠️ [Callback] Merchant responded {response.status_code}.")
+        return (
+            response.status_code >= 500
+            or response.status_code in _RETRYABLE_CLIENT_ERRORS
+        )
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
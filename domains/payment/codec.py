@@ -0,0 +1,88 @@
+import functools
+from typing import Any, Dict, Mapping, Optional
+
+from pydantic import ValidationError
+
+from domains.payment.schemas import WebhookPayload
+
+# 訊息格式的版本 (放在 AMQP headers)，沒有帶的舊訊息當成 v1
+SCHEMA_VERSION = 1
+SCHEMA_VERSION_HEADER = "x-schema-version"
+
+# 訊息編碼由 AMQP content_type 決定
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+class MessageDecodeError(ValueError):
+    """訊息格式錯誤 / 版本不認得 (永久性錯誤，重試也不會好)"""
+
+
+@functools.lru_cache(maxsize=1)
+def _msgpack() -> Any:
+    # msgpack 是選用套件，只有真的用到才需要安裝
+    try:
+        import msgpack
+    except ImportError as err:
+        raise MessageDecodeError(
+            f"{MSGPACK_CONTENT_TYPE} needs the msgpack package (flowpay[msgpack])"
+        ) from err
+    return msgpack
+
+
+def message_headers() -> Dict[str, Any]:
+    """每則付款訊息都要帶的 headers (trace context 由呼叫端再 inject)"""
+    return {SCHEMA_VERSION_HEADER: SCHEMA_VERSION}
+
+
+def encode_payment(
+    payload: WebhookPayload,
+    content_type: str = JSON_CONTENT_TYPE,
+    raw_json: Optional[bytes] = None,
+) -> bytes:
+    """
+    WebhookPayload -> 訊息 body
+    raw_json: 已經驗過簽、也 validate 過的原始 JSON，格式是 JSON 時直接沿用
+    """
+    if content_type == JSON_CONTENT_TYPE:
+        if raw_json is not None:
+            return raw_json
+        return payload.model_dump_json().encode()
+    if content_type == MSGPACK_CONTENT_TYPE:
+        packed: bytes = _msgpack().packb(payload.model_dump(), use_bin_type=True)
+        return packed
+    raise MessageDecodeError(f"Unsupported content type: {content_type}")
+
+
+def decode_payment(
+    body: bytes,
+    content_type: Optional[str] = None,
+    headers: Optional[Mapping[str, Any]] = None,
+) -> WebhookPayload:
+    """
+    訊息 body -> WebhookPayload (欄位一定齊全、型別正確)
+    沒有 content_type 的舊訊息當成 JSON
+    """
+    version = int((headers or {}).get(SCHEMA_VERSION_HEADER, 1))
+    if version > SCHEMA_VERSION:
+        raise MessageDecodeError(f"Unsupported schema version: {version}")
+
+    try:
+        if content_type in (None, "", JSON_CONTENT_TYPE):
+            # pydantic-core 直接解析 bytes，不經過 dict
+            return WebhookPayload.model_validate_json(body)
+        if content_type == MSGPACK_CONTENT_TYPE:
+            unpackb = _msgpack().unpackb
+            return WebhookPayload.model_validate(unpackb(body, raw=False))
+    except MessageDecodeError:
+        raise
+    except (ValidationError, ValueError, TypeError) as err:
+        raise MessageDecodeError(f"Malformed payment message: {err}") from err
+    raise MessageDecodeError(f"Unsupported content type: {content_type}")
+
+
+def decode_properties(body: bytes, properties: Any) -> WebhookPayload:
+    """直接吃 pika 的 BasicProperties"""
+    if properties is None:
+        return decode_payment(body)
+    return decode_payment(body, properties.content_type, properties.headers)
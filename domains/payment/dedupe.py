@@ -0,0 +1,180 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence
+
+from opentelemetry import metrics
+
+from core.config import (
+    WEBHOOK_DEDUPE_LOCAL_SIZE,
+    WEBHOOK_DEDUPE_PENDING_TTL_SECONDS,
+    WEBHOOK_DEDUPE_TTL_SECONDS,
+)
+from domains.payment.status_cache import (
+    PENDING_OR_NOT_FOUND,
+    order_status_key,
+    parse_cached_status,
+)
+
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter(__name__)
+duplicate_counter = meter.create_counter(
+    "flowpay.webhook.duplicates",
+    description="Duplicate webhooks answered at the API without publishing",
+)
+
+# seen key 的兩個狀態：還在送 Queue / 已經確認送進 Queue
+_PENDING = "pending"
+_PUBLISHED = "published"
+
+
+def webhook_seen_key(order_id: str) -> str:
+    return f"webhook_seen:{order_id}"
+
+
+class WebhookDeduplicator:
+    """
+    在 API 入口擋掉重複的 Webhook (上游重送、使用者連點)
+    Redis SET NX 原子地搶 webhook_seen:{order_id}，搶到的才 publish；
+    搶不到的直接回目前已知的訂單狀態，不用再進 Queue。
+
+    本地 LRU 只記「已經確認送進 Queue」的 order_id，
+    重送風暴時大部分重複請求連 Redis 都不用碰。
+
+    搶到的 key 先用很短的 pending TTL，confirm 之後才延長成 ttl_seconds：
+    publish 途中 process 掛掉 / 被取消 (來不及 release) 也不會擋掉上游重送一整天
+    client 是 redis.asyncio client (API 的 event loop 上使用)
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        ttl_seconds: int = WEBHOOK_DEDUPE_TTL_SECONDS,
+        local_size: int = WEBHOOK_DEDUPE_LOCAL_SIZE,
+        pending_ttl_seconds: int = WEBHOOK_DEDUPE_PENDING_TTL_SECONDS,
+    ) -> None:
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.pending_ttl_seconds = pending_ttl_seconds
+        self.local_size = local_size
+        # order_id -> 本地過期時間 (monotonic)，跟 Redis 的 TTL 一致
+        self._recent: "OrderedDict[str, float]" = OrderedDict()
+
+    def _seen_locally(self, order_id: str) -> bool:
+        expires_at = self._recent.get(order_id)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self._recent[order_id]
+            return False
+        self._recent.move_to_end(order_id)
+        return True
+
+    def _remember(self, order_id: str) -> None:
+        if self.local_size <= 0:
+            return
+        self._recent[order_id] = time.monotonic() + self.ttl_seconds
+        self._recent.move_to_end(order_id)
+        while len(self._recent) > self.local_size:
+            self._recent.popitem(last=False)
+
+    async def claim(self, order_id: str) -> Optional[str]:
+        """
+        第一次看到這筆訂單 -> 回傳 None (呼叫端負責 publish，再 confirm / release)
+        重複的 -> 回傳目前已知的訂單狀態
+        """
+        if self._seen_locally(order_id):
+            duplicate_counter.add(1, {"source": "local"})
+            status = parse_cached_status(
+                await self.client.get(order_status_key(order_id))
+            )
+            return status or PENDING_OR_NOT_FOUND
+
+        # 一個 round trip：搶 key + 讀 seen 狀態 + 讀訂單狀態
+        pipe = self.client.pipeline()
+        pipe.set(
+            webhook_seen_key(order_id), _PENDING, nx=True, ex=self.pending_ttl_seconds
+        )
+        pipe.get(webhook_seen_key(order_id))
+        pipe.get(order_status_key(order_id))
+        claimed, seen_state, cached = await pipe.execute()
+        if claimed:
+            return None
+
+        # 別人已經確認送進 Queue 了，之後的重複請求在本地就能擋掉
+        # (還在 pending 的不記，對方 publish 失敗會 release)
+        if seen_state == _PUBLISHED:
+            self._remember(order_id)
+        duplicate_counter.add(1, {"source": "redis"})
+        return parse_cached_status(cached) or PENDING_OR_NOT_FOUND
+
+    async def claim_many(self, order_ids: Sequence[str]) -> List[Optional[str]]:
+        """
+        批次版的 claim，一個 pipeline 做完 (同一批裡重複的 order_id 也會被擋下)
+        """
+        results: List[Optional[str]] = [None] * len(order_ids)
+        local: List[int] = []
+        remote: List[int] = []
+        for index, order_id in enumerate(order_ids):
+            if self._seen_locally(order_id):
+                duplicate_counter.add(1, {"source": "local"})
+                local.append(index)
+            else:
+                remote.append(index)
+
+        pipe = self.client.pipeline()
+        for index in remote:
+            key = webhook_seen_key(order_ids[index])
+            pipe.set(key, _PENDING, nx=True, ex=self.pending_ttl_seconds)
+            pipe.get(key)
+            pipe.get(order_status_key(order_ids[index]))
+        replies = await pipe.execute() if remote else []
+
+        for position, index in enumerate(remote):
+            claimed, seen_state, cached = replies[position * 3 : position * 3 + 3]
+            if claimed:
+                continue
+            if seen_state == _PUBLISHED:
+                self._remember(order_ids[index])
+            duplicate_counter.add(1, {"source": "redis"})
+            results[index] = parse_cached_status(cached) or PENDING_OR_NOT_FOUND
+
+        # 本地命中的也要回目前狀態 (一次 MGET)
+        if local:
+            keys = [order_status_key(order_ids[i]) for i in local]
+            for index, cached in zip(local, await self.client.mget(keys), strict=True):
+                results[index] = parse_cached_status(cached) or PENDING_OR_NOT_FOUND
+        return results
+
+    async def confirm(self, order_id: str) -> None:
+        """訊息已經被 Broker 確認收下：key 延長成完整的 TTL"""
+        await self.client.set(
+            webhook_seen_key(order_id), _PUBLISHED, xx=True, ex=self.ttl_seconds
+        )
+        self._remember(order_id)
+
+    async def release(self, order_id: str) -> None:
+        """publish 失敗：放掉 key，讓上游重送的請求可以再進來"""
+        await self.client.delete(webhook_seen_key(order_id))
+        self._recent.pop(order_id, None)
+
+    async def confirm_many(self, order_ids: Sequence[str]) -> None:
+        if not order_ids:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for order_id in order_ids:
+            pipe.set(
+                webhook_seen_key(order_id), _PUBLISHED, xx=True, ex=self.ttl_seconds
+            )
+            self._remember(order_id)
+        await pipe.execute()
+
+    async def release_many(self, order_ids: Sequence[str]) -> None:
+        if not order_ids:
+            return
+        await self.client.delete(
+            *[webhook_seen_key(order_id) for order_id in order_ids]
+        )
+        for order_id in order_ids:
+            self._recent.pop(order_id, None)
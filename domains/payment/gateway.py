@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from core.aio import BackgroundEventLoop
+from core.config import (
+    BANK_API_TIMEOUT_SECONDS,
+    BANK_API_URL,
+    BANK_BREAKER_FAILURE_THRESHOLD,
+    BANK_BREAKER_RECOVERY_SECONDS,
+    BANK_CALL_CONCURRENCY,
+    BANK_MAX_CONNECTIONS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(ConnectionError):
+    """銀行目前被判定為不健康，直接失敗，不浪費 worker 的併發名額"""
+
+
+class BankDeclinedError(Exception):
+    """銀行明確拒絕扣款 (業務失敗，不需要重試)"""
+
+
+class CircuitBreaker:
+    """
+    簡單的 Circuit Breaker (thread-safe)
+    CLOSED: 正常放行；連續失敗 failure_threshold 次 -> OPEN
+    OPEN: 直接拋 CircuitOpenError；過了 recovery_timeout -> HALF_OPEN
+    HALF_OPEN: 只放一個試探請求，成功 -> CLOSED，失敗 -> OPEN
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = BANK_BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout: float = BANK_BREAKER_RECOVERY_SECONDS,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self._opened_at >= self.recovery_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def check(self) -> None:
+        """不佔用名額，只確認目前是不是斷路中 (還沒開始工作前先擋掉)"""
+        with self._lock:
+            if self._current_state() == self.OPEN:
+                raise CircuitOpenError("Bank circuit is open")
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN:
+                raise CircuitOpenError("Bank circuit is open")
+            if state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError("Bank circuit is half-open")
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("🟢 [Bank] Circuit closed.")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == self.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                if self._state != self.OPEN:
+                    logger.warning(
+                        f"🔴 [Bank] Circuit opened after {self._failures} failures."
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class BankGatewayClient:
+    """
+    銀行 Gateway Client
+    - 非同步、共用連線池的 httpx.AsyncClient
+    - 每次呼叫都有硬性 deadline
+    - Circuit Breaker：銀行不健康時 fail fast
+    同步的 Worker 透過 charge_sync() 在背景 event loop 上呼叫
+    """
+
+    def __init__(
+        self,
+        base_url: str = BANK_API_URL,
+        timeout: float = BANK_API_TIMEOUT_SECONDS,
+        max_connections: int = BANK_MAX_CONNECTIONS,
+        breaker: Optional[CircuitBreaker] = None,
+        event_loop: Optional[BackgroundEventLoop] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.breaker = breaker or CircuitBreaker()
+        self._event_loop = event_loop or BackgroundEventLoop(name="bank-gateway")
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # 第一次呼叫才建立 (要在 event loop 裡面)
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                transport=self._transport,
+            )
+        return self._client
+
+    async def charge(self, order_id: str, amount: int) -> None:
+        """
+        扣款；成功直接回傳
+        - ValueError：金額不合法 (永久錯誤)
+        - BankDeclinedError：銀行拒絕 (例如 Insufficient funds)
+        - ConnectionError / CircuitOpenError：銀行不健康 (可以重試)
+        """
+        self.breaker.before_call()
+        try:
+            response = await asyncio.wait_for(
+                self._get_client().post(
+                    "/charge",
+                    json={"order_id": order_id, "amount": amount},
+                    # 重試時銀行可以用 order_id 去重，不會重複扣款
+                    headers={"Idempotency-Key": order_id},
+                ),
+                timeout=self.timeout,
+            )
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure()
+            raise ConnectionError(f"Bank API Timeout ({e!r})") from e
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise ConnectionError(f"Bank API Error {response.status_code}")
+
+        # 4xx 代表銀行是健康的，只是這筆被拒絕
+        self.breaker.record_success()
+        if response.status_code == 422:
+            raise ValueError("Invalid Amount")
+        if response.status_code == 402:
+            raise BankDeclinedError("Insufficient funds")
+        response.raise_for_status()
+        logger.info(f"💰 [Bank] Deducted {amount} for {order_id}")
+
+    async def charge_many(self, payments: List[Dict[str, Any]]) -> Dict[str, Exception]:
+        """同時扣款多筆 (最多 BANK_CALL_CONCURRENCY 個併發)，回傳失敗的 order_id"""
+        semaphore = asyncio.Semaphore(BANK_CALL_CONCURRENCY)
+
+        async def charge_one(payment: Dict[str, Any]) -> None:
+            async with semaphore:
+                await self.charge(payment["order_id"], payment["amount"])
+
+        outcomes = await asyncio.gather(
+            *(charge_one(p) for p in payments), return_exceptions=True
+        )
+        errors: Dict[str, Exception] = {}
+        for payment, outcome in zip(payments, outcomes, strict=True):
+            if isinstance(outcome, Exception):
+                errors[payment["order_id"]] = outcome
+        return errors
+
+    def charge_sync(self, order_id: str, amount: int) -> None:
+        self._event_loop.run(self.charge(order_id, amount))
+
+    def charge_many_sync(self, payments: List[Dict[str, Any]]) -> Dict[str, Exception]:
+        return self._event_loop.run(self.charge_many(payments))
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def close(self) -> None:
+        self._event_loop.run(self.aclose())
+        self._event_loop.stop()
@@ -0,0 +1,248 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import Engine, text
+
+from core.config import PAYMENT_PARTITION_MONTHS_AHEAD
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "payment_events"
+_PARTITION_NAME = re.compile(r"^payment_events_(\d{4})(\d{2})$")
+
+# 一次刪多少筆 order key (避免一個超大 transaction 卡住 vacuum / replication)
+KEY_DELETE_BATCH = 50000
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month:%Y%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = _PARTITION_NAME.match(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def partition_bounds(month: date) -> "tuple[datetime, datetime]":
+    """[這個月 1 號, 下個月 1 號) (UTC)"""
+    lower = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    upper_month = add_months(month, 1)
+    upper = datetime(upper_month.year, upper_month.month, 1, tzinfo=timezone.utc)
+    return lower, upper
+
+
+def ensure_partitions(
+    engine: Engine, months_ahead: int = PAYMENT_PARTITION_MONTHS_AHEAD
+) -> int:
+    """補建這個月到未來 months_ahead 個月的 partition，回傳新建了幾個"""
+    with engine.begin() as conn:
+        created = conn.execute(
+            text("SELECT flowpay_ensure_payment_partitions(:months)"),
+            {"months": months_ahead},
+        ).scalar_one()
+    return int(created)
+
+
+class PartitionInfo(NamedTuple):
+    name: str
+    month: date
+    # False = 之前歸檔到一半 (已經 detach，還沒匯出 / 刪掉)
+    attached: bool
+    # DETACH ... CONCURRENTLY 做到一半被中斷 (還掛著，要用 FINALIZE 做完)
+    detach_pending: bool = False
+
+
+def list_partitions(engine: Engine) -> List[PartitionInfo]:
+    """payment_events_YYYYMM：掛在 payment_events 底下的，以及已經 detach 的"""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT c.relname, c.relispartition, "
+                "coalesce(i.inhdetachpending, false) FROM pg_class c "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "LEFT JOIN pg_inherits i ON i.inhrelid = c.oid "
+                "WHERE n.nspname = current_schema() AND c.relkind = 'r' "
+                "AND c.relname ~ '^payment_events_[0-9]{6}$'"
+            )
+        ).all()
+    partitions = []
+    for name, attached, detach_pending in rows:
+        month = partition_month(name)
+        if month is not None:
+            partitions.append(
+                PartitionInfo(name, month, bool(attached), bool(detach_pending))
+            )
+    return sorted(partitions, key=lambda p: p.month)
+
+
+def partitions_to_archive(
+    partitions: List[PartitionInfo], today: date, retention_months: int
+) -> List[PartitionInfo]:
+    """整個月都早於保留期限的 partition (這個月跟前 retention_months 個月保留)"""
+    cutoff = add_months(today.replace(day=1), -retention_months)
+    return [p for p in partitions if p.month < cutoff]
+
+
+class ArchiveResult(NamedTuple):
+    name: str
+    path: str
+    rows: int
+    sha256: str
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _detach(engine: Engine, partition: PartitionInfo) -> None:
+    # CONCURRENTLY 不會擋住 payment_events 的讀寫，但不能在 transaction 裡跑；
+    # 上次做到一半被中斷的 (detach pending) 不能再 detach 一次，要用 FINALIZE 做完
+    mode = "FINALIZE" if partition.detach_pending else "CONCURRENTLY"
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(
+            text(
+                f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION "{partition.name}" {mode}'
+            )
+        )
+
+
+def manifest_path(output_dir: str, partition: PartitionInfo) -> str:
+    return os.path.join(output_dir, f"{partition.name}.csv.gz.manifest.json")
+
+
+def load_manifest(
+    output_dir: str, partition: PartitionInfo
+) -> Optional[Dict[str, Any]]:
+    """之前匯出完成時寫的 manifest (沒有 = 還沒匯出完)"""
+    try:
+        with open(manifest_path(output_dir, partition)) as f:
+            manifest: Dict[str, Any] = json.load(f)
+    except FileNotFoundError:
+        return None
+    return manifest
+
+
+def is_archived(partition: PartitionInfo, output_dir: str) -> bool:
+    """
+    已經 detach、匯出完、order key 也刪了 (--keep-table 留下來的 table)，
+    再跑一次不用重新匯出
+    """
+    if partition.attached:
+        return False
+    manifest = load_manifest(output_dir, partition)
+    return manifest is not None and "order_keys_deleted" in manifest
+
+
+def _export(engine: Engine, partition: PartitionInfo, path: str) -> int:
+    """COPY ... TO STDOUT 直接串流進 gzip，不會把整個 partition 讀進記憶體"""
+    tmp_path = f"{path}.tmp"
+    # partition.name 一定符合 payment_events_YYYYMM (list_partitions 篩過)
+    select_all = f'SELECT * FROM "{partition.name}" ORDER BY id'  # noqa: S608
+    count_all = f'SELECT count(*) FROM "{partition.name}"'  # noqa: S608
+    raw: Any = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor, gzip.open(tmp_path, "wb") as out:
+            cursor.copy_expert(
+                f"COPY ({select_all}) TO STDOUT WITH (FORMAT csv, HEADER)", out
+            )
+            cursor.execute(count_all)
+            rows = int(cursor.fetchone()[0])
+        raw.commit()
+    finally:
+        raw.close()
+    os.replace(tmp_path, path)
+    return rows
+
+
+def _delete_order_keys(engine: Engine, month: date) -> int:
+    """歸檔掉的訂單不再需要 order key (分批刪，走 created_at 的 BRIN index)"""
+    lower, upper = partition_bounds(month)
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            result = conn.execute(
+                text(
+                    "DELETE FROM payment_order_keys WHERE ctid IN ("
+                    "SELECT ctid FROM payment_order_keys "
+                    "WHERE created_at >= :lower AND created_at < :upper LIMIT :batch)"
+                ),
+                {"lower": lower, "upper": upper, "batch": KEY_DELETE_BATCH},
+            )
+        deleted += result.rowcount
+        if result.rowcount < KEY_DELETE_BATCH:
+            return deleted
+
+
+def archive_partition(
+    engine: Engine,
+    partition: PartitionInfo,
+    output_dir: str,
+    keep_table: bool = False,
+) -> ArchiveResult:
+    """
+    detach -> 匯出 payment_events_YYYYMM.csv.gz + manifest -> 刪 order key -> DROP
+    每一步都可以重跑：中斷後再執行一次，會從已經 detach 的 table 接著做；
+    manifest 已經寫好的不會重新匯出
+    """
+    if partition.attached:
+        action = "Finalizing detach of" if partition.detach_pending else "Detaching"
+        logger.info(f" ✂️ {action} {partition.name}...")
+        _detach(engine, partition)
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{partition.name}.csv.gz")
+    manifest = None if partition.attached else load_manifest(output_dir, partition)
+    if manifest is None:
+        logger.info(f" 📦 Exporting {partition.name} -> {path}")
+        rows = _export(engine, partition, path)
+        result = ArchiveResult(partition.name, path, rows, _sha256(path))
+        manifest = {
+            **result._asdict(),
+            "month": partition.month.isoformat(),
+            "archived_at": datetime.now(timezone.utc).isoformat(),
+        }
+        _write_manifest(output_dir, partition, manifest)
+    else:
+        logger.info(f" 📦 {partition.name} already exported -> {path}")
+        result = ArchiveResult(
+            partition.name, path, manifest["rows"], manifest["sha256"]
+        )
+
+    if "order_keys_deleted" not in manifest:
+        deleted = _delete_order_keys(engine, partition.month)
+        logger.info(f" 🗝️ Deleted {deleted} order keys for {partition.month:%Y-%m}")
+        manifest["order_keys_deleted"] = deleted
+        _write_manifest(output_dir, partition, manifest)
+
+    if not keep_table:
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP TABLE "{partition.name}"'))
+        logger.info(f" 🗑️ Dropped {partition.name}")
+    return result
+
+
+def _write_manifest(
+    output_dir: str, partition: PartitionInfo, manifest: Dict[str, Any]
+) -> None:
+    path = manifest_path(output_dir, partition)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
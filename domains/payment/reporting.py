@@ -0,0 +1,223 @@
+import csv
+from datetime import date, datetime, time, timedelta, timezone
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from sqlalchemy import Engine, text
+from sqlmodel import Session, col, select
+
+from core.config import EXPORT_FETCH_SIZE
+from domains.payment.model import PaymentDailySummary, PaymentEvent
+
+EXPORT_COLUMNS = ("id", "order_id", "amount", "status", "created_at")
+
+# pg_try_advisory_xact_lock 的 key：同時只有一個 process 在重算彙總
+_SUMMARY_LOCK_KEY = 0x466C6F77  # "Flow"
+
+# 重算 [start, end) 的彙總：先刪掉再整段重新 GROUP BY (狀態改變後舊的組合要消失)
+# created_at 的範圍條件會 prune 到最近的 partition，走 BRIN index
+_REFRESH_SQL = (
+    "DELETE FROM payment_daily_summaries WHERE day >= :start_day AND day < :end_day",
+    "INSERT INTO payment_daily_summaries "
+    "(day, status, event_count, amount_total, refreshed_at) "
+    "SELECT (created_at AT TIME ZONE 'UTC')::date, status, count(*), "
+    "coalesce(sum(amount), 0), now() "
+    "FROM payment_events WHERE created_at >= :start AND created_at < :end "
+    "GROUP BY 1, 2",
+)
+
+# trigger 標記過、彙總還沒重算的日子 (拿出來的同時清掉)
+_CLAIM_DIRTY_DAYS_SQL = "DELETE FROM payment_summary_dirty_days RETURNING day"
+_MARK_DIRTY_DAYS_SQL = (
+    "INSERT INTO payment_summary_dirty_days (day) "
+    "SELECT unnest(CAST(:days AS date[])) ON CONFLICT (day) DO NOTHING"
+)
+
+
+def day_start(day: date) -> datetime:
+    """那一天 00:00 (UTC)"""
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def day_ranges(days: Iterable[date]) -> List[Tuple[date, date]]:
+    """連續的日子併成一段 [start, end)，一段只要一次 GROUP BY"""
+    ranges: List[Tuple[date, date]] = []
+    for day in sorted(set(days)):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1] = (ranges[-1][0], day + timedelta(days=1))
+        else:
+            ranges.append((day, day + timedelta(days=1)))
+    return ranges
+
+
+def _refresh_ranges(conn: Any, ranges: List[Tuple[date, date]]) -> int:
+    written = 0
+    for start, end in ranges:
+        params = {
+            "start_day": start,
+            "end_day": end,
+            "start": day_start(start),
+            "end": day_start(end),
+        }
+        conn.execute(text(_REFRESH_SQL[0]), params)
+        written += conn.execute(text(_REFRESH_SQL[1]), params).rowcount
+    return written
+
+
+def _try_lock(conn: Any, session: bool = False) -> bool:
+    lock = "pg_try_advisory_lock" if session else "pg_try_advisory_xact_lock"
+    return bool(
+        conn.execute(
+            text(f"SELECT {lock}(:key)"), {"key": _SUMMARY_LOCK_KEY}
+        ).scalar_one()
+    )
+
+
+def refresh_daily_summaries(engine: Engine, since: date) -> Optional[int]:
+    """
+    重算 since 之後每天的彙總 (整段重算，settlement CLI 補資料用)，回傳寫入幾列
+    其他 process (另一個 worker / CLI) 正在重算時直接跳過，回傳 None
+    """
+    with engine.begin() as conn:
+        if not _try_lock(conn):
+            return None
+        return _refresh_ranges(conn, [(since, date.max)])
+
+
+def refresh_changed_summaries(engine: Engine) -> Optional[List[date]]:
+    """
+    只重算 payment_events 有變動的日子 (payment_summary_dirty_days)，回傳重算了哪幾天
+    - 整段拿著 session advisory lock，同時只有一個 process 在重算
+    - 先用一個很短的 transaction 拿走標記：重算期間新的寫入會再標記一次，
+      下一輪再算，Worker 寫入不會卡在重算的 transaction 上
+    - 重算失敗就把拿走的日子標回去
+    其他 process 正在重算時直接跳過，回傳 None
+    """
+    with engine.connect() as conn:
+        if not _try_lock(conn, session=True):
+            conn.rollback()
+            return None
+        try:
+            conn.commit()
+            with conn.begin():
+                days = sorted(conn.execute(text(_CLAIM_DIRTY_DAYS_SQL)).scalars())
+            if not days:
+                return days
+            try:
+                with conn.begin():
+                    _refresh_ranges(conn, day_ranges(days))
+            except Exception:
+                with conn.begin():
+                    conn.execute(text(_MARK_DIRTY_DAYS_SQL), {"days": days})
+                raise
+            return days
+        finally:
+            conn.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": _SUMMARY_LOCK_KEY}
+            )
+            conn.commit()
+
+
+def daily_summaries(
+    session: Session, start: date, end: date, status: Optional[str] = None
+) -> List[PaymentDailySummary]:
+    """[start, end) 每天每種狀態的彙總 (報表只讀這張表)"""
+    query = select(PaymentDailySummary).where(
+        PaymentDailySummary.day >= start, PaymentDailySummary.day < end
+    )
+    if status:
+        query = query.where(PaymentDailySummary.status == status)
+    return list(
+        session.exec(
+            query.order_by(
+                col(PaymentDailySummary.day), col(PaymentDailySummary.status)
+            )
+        ).all()
+    )
+
+
+def stream_events(
+    engine: Engine,
+    start: date,
+    end: date,
+    status: Optional[str] = None,
+    fetch_size: int = EXPORT_FETCH_SIZE,
+) -> Iterator[Sequence[Any]]:
+    """
+    [start, end) 的 payment_events，一次 yield 一批 (最多 fetch_size 筆)
+    - Postgres 用 server-side cursor (stream_results)，記憶體用量跟總筆數無關
+    - 在 read-only 的 REPEATABLE READ snapshot 裡讀，匯出途中 Worker 繼續寫也不會
+      讀到一半的狀態，也不會擋到 Worker
+    """
+    query = select(*(getattr(PaymentEvent, c) for c in EXPORT_COLUMNS)).where(
+        PaymentEvent.created_at >= day_start(start),
+        PaymentEvent.created_at < day_start(end),
+    )
+    if status:
+        query = query.where(PaymentEvent.status == status)
+    query = query.order_by(col(PaymentEvent.created_at), col(PaymentEvent.id))
+
+    options: Dict[str, Any] = {"stream_results": True, "yield_per": fetch_size}
+    if engine.dialect.name == "postgresql":
+        options.update(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+    with engine.connect().execution_options(**options) as conn:
+        result = conn.execute(query)
+        for rows in result.partitions():
+            yield rows
+
+
+def _csv_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def write_csv(batches: Iterable[Sequence[Any]], out: IO[str]) -> int:
+    """一批一批寫成 CSV (含 header)，回傳筆數"""
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_COLUMNS)
+    rows = 0
+    for batch in batches:
+        writer.writerows([_csv_value(v) for v in row] for row in batch)
+        rows += len(batch)
+    return rows
+
+
+def _pyarrow() -> Any:
+    # pyarrow 是選用套件，只有匯出 Parquet 才需要安裝
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as err:
+        raise RuntimeError(
+            "Parquet export needs the pyarrow package (flowpay[parquet])"
+        ) from err
+    return pyarrow
+
+
+def write_parquet(batches: Iterable[Sequence[Any]], path: str) -> int:
+    """每一批寫成一個 row group (不會把整份資料放進記憶體)，回傳筆數"""
+    pa = _pyarrow()
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("order_id", pa.string()),
+            ("amount", pa.int64()),
+            ("status", pa.string()),
+            ("created_at", pa.timestamp("us", tz="UTC")),
+        ]
+    )
+    rows = 0
+    with pa.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        for batch in batches:
+            columns = dict(zip(EXPORT_COLUMNS, zip(*batch, strict=True), strict=True))
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            rows += len(batch)
+    return rows
@@ -1,6 +1,8 @@
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from core.config import ORDER_LOOKUP_MAX_IDS
 
 
 class WebhookPayload(BaseModel):
@@ -8,3 +10,7 @@ class WebhookPayload(BaseModel):
     amount: int
     status: str
     callback_url: Optional[str] = None
+
+
+class OrderStatusQuery(BaseModel):
+    order_ids: List[str] = Field(min_length=1, max_length=ORDER_LOOKUP_MAX_IDS)
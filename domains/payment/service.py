@@ -1,59 +1,118 @@
 import logging
-import secrets
-import time
-from typing import Optional
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-import httpx
-from sqlmodel import Session, select
+from opentelemetry.propagate import inject
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, select, update
 
 from core.database import engine
-from domains.payment.model import PaymentEvent
+from core.messaging import PublisherPool
+from core.profiling import stage
+from domains.payment.callbacks import encode_callback_task
+from domains.payment.gateway import BankGatewayClient
+from domains.payment.model import (
+    PaymentEvent,
+    PaymentOrderKey,
+    created_at_of,
+    find_order_keys,
+    utcnow,
+)
+from domains.payment.status_cache import OrderStatusCache
 
 logger = logging.getLogger(__name__)
 
+# 重試 / 回放時可以接著處理的訂單狀態 (SUCCESS 永遠不會再扣一次款)
+RESUMABLE_STATUSES = ("PROCESSING", "FAILED")
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """銀行斷線 / 逾時 / 斷路中：等一下再試可能就會成功"""
+    return isinstance(error, ConnectionError)
+
 
 class PaymentService:
+    def __init__(
+        self,
+        status_cache: Optional[OrderStatusCache] = None,
+        callback_publisher: Optional[PublisherPool] = None,
+        bank_gateway: Optional[BankGatewayClient] = None,
+    ) -> None:
+        # 每次狀態變更都寫進 Redis，API 輪詢就不用查 DB
+        self.status_cache = status_cache
+        # 商家 Callback 丟進 callback queue，由 Dispatcher 非同步送出
+        self.callback_publisher = callback_publisher
+        # 銀行 Gateway (連線池 + deadline + Circuit Breaker，第一次呼叫才連線)
+        self.bank_gateway = bank_gateway or BankGatewayClient()
+
     def process_payment(
         self,
         order_id: str,
         amount: int,
         status: str,
         callback_url: Optional[str] = None,
+        resume: bool = False,
+        final_attempt: bool = True,
     ) -> bool:
         """
         支付核心
         回傳： True , False (Retry, DLQ)
+        resume: 這是重試 / 回放的訊息，訂單已存在但還沒成功時要接著處理
+        final_attempt: False 時銀行暫時性錯誤不會把訂單標成 FAILED (之後還會重試)
         """
         logger.info(f"🏦 [Service] Processing payment for {order_id}...")
+        # 銀行斷路中就不用建單了，直接失敗 (不佔用 DB / worker)
+        self.bank_gateway.breaker.check()
         with Session(engine) as session:
             # 1. 檢查訂單是否已存在 (雖然 Redis 擋過，但 DB 是最後防線)
-            existing_order = session.exec(
-                select(PaymentEvent).where(PaymentEvent.order_id == order_id)
-            ).first()
+            with stage("db.lookup"):
+                existing_order = session.exec(
+                    select(PaymentEvent).where(
+                        PaymentEvent.order_id == order_id,
+                        PaymentEvent.created_at == created_at_of(order_id),
+                    )
+                ).first()
 
-            if existing_order:
+            if existing_order and not (
+                resume and existing_order.status in RESUMABLE_STATUSES
+            ):
                 logger.warning(f"⚠️ [Service] Order {order_id} already exists in DB.")
                 return True  # 視為已處理，讓 Worker ACK
 
-            # 2. 建立初始訂單 (狀態: PROCESSING)
-            new_payment = PaymentEvent(
-                order_id=order_id,
-                amount=amount,
-                status="PROCESSING",  # 初始狀態
-            )
-            session.add(new_payment)
-            session.commit()
-            session.refresh(new_payment)
+            if existing_order:
+                # 重試：沿用之前建立的訂單，重新呼叫銀行
+                logger.info(f"🔁 [Service] Resuming order {order_id}...")
+                new_payment = existing_order
+            else:
+                # 2. 建立初始訂單 (狀態: PROCESSING)
+                new_payment = PaymentEvent(
+                    order_id=order_id,
+                    amount=amount,
+                    status="PROCESSING",  # 初始狀態
+                )
+                # 同一個 transaction 寫 order key (PK 擋住重複建單，也記下 partition)
+                session.add(
+                    PaymentOrderKey(
+                        order_id=order_id, created_at=new_payment.created_at
+                    )
+                )
+            new_payment.status = "PROCESSING"
+            with stage("db.write"):
+                session.add(new_payment)
+                session.commit()
+                session.refresh(new_payment)
+            self._cache_statuses([(order_id, "PROCESSING")])
 
-            # 3. [模擬] 呼叫外部銀行 API (這裡是你的業務邏輯核心)
-            # 實際上你會用 httpx 去打綠界/LinePay
+            # 3. 呼叫外部銀行 API (這裡是你的業務邏輯核心)
             try:
                 self._call_bank_api(order_id, amount)
 
                 # 4. 銀行扣款成功 -> 更新狀態為 SUCCESS
                 new_payment.status = "SUCCESS"
-                session.add(new_payment)
-                session.commit()
+                with stage("db.write"):
+                    session.add(new_payment)
+                    session.commit()
+                self._cache_statuses([(order_id, "SUCCESS")])
                 logger.info(f"✅ [Service] Payment {order_id} SUCCESS.")
 
                 if callback_url:
@@ -61,11 +120,18 @@ class PaymentService:
                 return True
 
             except Exception as e:
+                if is_transient_error(e) and not final_attempt:
+                    # 銀行暫時性錯誤，訂單維持 PROCESSING，交給 Worker 延遲重試
+                    logger.warning(f"⏳ [Service] Bank unavailable for {order_id}: {e}")
+                    raise
+
                 # 5. 銀行扣款失敗 -> 更新狀態為 FAILED
                 logger.error(f"❌ [Service] Bank error: {e}")
                 new_payment.status = "FAILED"
-                session.add(new_payment)
-                session.commit()
+                with stage("db.write"):
+                    session.add(new_payment)
+                    session.commit()
+                self._cache_statuses([(order_id, "FAILED")])
                 # 這裡要看你的策略：
                 # 如果是「餘額不足」，那是業務失敗，回傳 True (不用重試)
                 # 如果是「銀行斷線」，那是系統錯誤，回傳 False (需要 NACK 重試)
@@ -78,36 +144,193 @@ class PaymentService:
                 else:
                     raise e  # 拋出異常，讓 Worker 進行重試或 DLQ
 
-    def _call_bank_api(self, order_id: str, amount: int) -> None:
-        """模擬外部 API 呼叫"""
-        time.sleep(0.5)  # 模擬網路延遲
+    def process_payments_batch(
+        self, payments: List[Dict[str, Any]]
+    ) -> Dict[str, Optional[Exception]]:
+        """
+        批次版的支付核心 (語意跟 process_payment 一樣)
+        - order key 一個 multi-row INSERT ... ON CONFLICT DO NOTHING 搶建單資格，
+          搶到的再一個 multi-row INSERT 建立訂單
+        - 同時呼叫銀行 API
+        - 每種最終狀態一個 bulk UPDATE，只 commit 兩次
+        回傳每個 order_id 的結果：None (可以 ACK)，Exception (系統錯誤, Retry / DLQ)
+        每筆 payment 可以帶 resume / final_attempt (意義同 process_payment)
+        """
+        results: Dict[str, Optional[Exception]] = {}
+        if not payments:
+            return results
+        logger.info(f"🏦 [Service] Processing batch of {len(payments)} payments...")
+        self.bank_gateway.breaker.check()
+
+        with Session(engine) as session:
+            # 1. 建立初始訂單，已存在的 (DB 最後防線) 會被跳過
+            #    同一批裡重複的 order_id 只用第一筆
+            now = utcnow()
+            first_payments: Dict[str, Dict[str, Any]] = {}
+            for p in payments:
+                first_payments.setdefault(p["order_id"], p)
+            claim_keys = (
+                insert(PaymentOrderKey)
+                .values(
+                    [{"order_id": oid, "created_at": now} for oid in first_payments]
+                )
+                .on_conflict_do_nothing(index_elements=["order_id"])
+                .returning(col(PaymentOrderKey.order_id))
+            )
+            with stage("db.write"):
+                inserted = set(session.exec(claim_keys).scalars())
+                if inserted:
+                    session.exec(
+                        insert(PaymentEvent).values(
+                            [
+                                {
+                                    "order_id": order_id,
+                                    "amount": p["amount"],
+                                    "status": "PROCESSING",
+                                    "created_at": now,
+                                }
+                                for order_id, p in first_payments.items()
+                                if order_id in inserted
+                            ]
+                        )
+                    )
+                session.commit()
+            self._cache_statuses((order_id, "PROCESSING") for order_id in inserted)
+            # 每筆訂單在哪個 partition (之後的 UPDATE 只掃那些 partition)
+            created_at: Dict[str, datetime] = dict.fromkeys(inserted, now)
+
+            # 重試 / 回放的訊息：訂單已存在但還沒成功，要接著處理
+            resume_ids = [
+                p["order_id"]
+                for p in payments
+                if p.get("resume") and p["order_id"] not in inserted
+            ]
+            if resume_ids:
+                with stage("db.lookup"):
+                    keys = find_order_keys(session, resume_ids)
+                    resumable = session.exec(
+                        select(PaymentEvent.order_id).where(
+                            col(PaymentEvent.order_id).in_(list(keys)),
+                            col(PaymentEvent.created_at).in_(set(keys.values())),
+                            col(PaymentEvent.status).in_(RESUMABLE_STATUSES),
+                        )
+                    ).all()
+                inserted.update(resumable)
+                created_at.update((oid, keys[oid]) for oid in resumable)
+
+            new_payments = []
+            for payment in payments:
+                if payment["order_id"] in inserted:
+                    # 同一批裡重複的 order_id 只處理第一筆
+                    inserted.discard(payment["order_id"])
+                    new_payments.append(payment)
+                else:
+                    logger.warning(
+                        f"⚠️ [Service] Order {payment['order_id']} already exists in DB."
+                    )
+                    results[payment["order_id"]] = None
 
-        # 模擬隨機失敗
-        if amount < 0:
-            raise ValueError("Invalid Amount")
+            # 2. 同時呼叫銀行 API
+            errors = self._call_bank_api_many(new_payments)
 
-        # 模擬 10% 機率銀行斷線
-        if secrets.randbits(8) < 26:
-            raise ConnectionError("Bank API Timeout")  # nosec
+            # 銀行暫時性錯誤、之後還會重試的訂單維持 PROCESSING
+            deferred = {
+                p["order_id"]
+                for p in new_payments
+                if p["order_id"] in errors
+                and is_transient_error(errors[p["order_id"]])
+                and not p.get("final_attempt", True)
+            }
 
-        logger.info(f"💰 [Bank] Deducted {amount} for {order_id}")
+            # 3. 每種最終狀態一個 bulk UPDATE
+            succeeded = [
+                p["order_id"] for p in new_payments if p["order_id"] not in errors
+            ]
+            failed = [order_id for order_id in errors if order_id not in deferred]
+            with stage("db.write"):
+                for status, order_ids in (
+                    ("SUCCESS", succeeded),
+                    ("FAILED", failed),
+                ):
+                    if order_ids:
+                        session.exec(
+                            update(PaymentEvent)
+                            .where(
+                                col(PaymentEvent.order_id).in_(order_ids),
+                                col(PaymentEvent.created_at).in_(
+                                    {created_at[oid] for oid in order_ids}
+                                ),
+                            )
+                            .values(status=status)
+                        )
+                session.commit()
+            self._cache_statuses(
+                [(order_id, "SUCCESS") for order_id in succeeded]
+                + [(order_id, "FAILED") for order_id in failed]
+            )
+
+        for payment in new_payments:
+            order_id = payment["order_id"]
+            callback_url = payment.get("callback_url")
+            error = errors.get(order_id)
+            if error is None:
+                logger.info(f"✅ [Service] Payment {order_id} SUCCESS.")
+                results[order_id] = None
+                if callback_url:
+                    self._send_callback(callback_url, order_id, "SUCCESS")
+            elif order_id in deferred:
+                logger.warning(f"⏳ [Service] Bank unavailable for {order_id}: {error}")
+                results[order_id] = error
+            elif "Insufficient funds" in str(error):
+                # 業務失敗，不用重試
+                results[order_id] = None
+            else:
+                logger.error(f"❌ [Service] Bank error for {order_id}: {error}")
+                results[order_id] = error
+                if callback_url:
+                    self._send_callback(callback_url, order_id, "FAILED")
+        return results
+
+    def _cache_statuses(self, statuses: Iterable[Tuple[str, str]]) -> None:
+        """寫入狀態快取；Redis 出問題不影響交易本身 (API 會 fallback 查 DB)"""
+        if self.status_cache is None:
+            return
+        try:
+            with stage("cache"):
+                self.status_cache.set_many(statuses)
+        except Exception as e:
+            logger.warning(f"⚠️ [Service] Failed to cache order status: {e}")
+
+    def _call_bank_api_many(
+        self, payments: List[Dict[str, Any]]
+    ) -> Dict[str, Exception]:
+        """同時呼叫多筆銀行 API，回傳失敗的 order_id -> Exception"""
+        with stage("bank"):
+            return self.bank_gateway.charge_many_sync(payments)
+
+    def _call_bank_api(self, order_id: str, amount: int) -> None:
+        """呼叫銀行 Gateway (deadline 到了或斷路中會拋 ConnectionError)"""
+        with stage("bank"):
+            self.bank_gateway.charge_sync(order_id, amount)
 
     def _send_callback(self, url: str, order_id: str, status: str) -> None:
         """
         這就是你說的「主動回饋到呼應方」
+        只負責丟進 callback queue，真正的 HTTP 由 apps/callback 的 Dispatcher 送出，
+        商家回應多慢都不會卡住支付流程
         """
-        logger.info(f" 📞 [Callback] Notifying {url} for {order_id} ({status})...")
+        logger.info(
+            f" 📞 [Callback] Queueing notify {url} for {order_id} ({status})..."
+        )
+        if self.callback_publisher is None:
+            logger.error(" ❌ [Callback] No callback publisher configured.")
+            return
         try:
-            # 這裡簡單用 httpx 同步發送 (如果要高效能，這裡應該要再丟一個 task 進 Queue)
-            response = httpx.post(
-                url, json={"order_id": order_id, "status": status}, timeout=5.0
-            )
-            if response.status_code == 200:
-                logger.info(" ✅ [Callback] Notification delivered.")
-            else:
-                logger.warning(
-                    f" ⚠️ [Callback] Merchant responded {response.status_code}."
+            headers: Dict[str, Any] = {}
+            inject(headers)
+            with stage("callback"):
+                self.callback_publisher.publish(
+                    encode_callback_task(url, order_id, status), headers
                 )
         except Exception as e:
-            logger.error(f" ❌ [Callback] Failed to notify: {e}")
-            # 在真實系統中，這裡失敗應該要進「重試隊列 (Retry Queue)」
+            logger.error(f" ❌ [Callback] Failed to queue notification: {e}")
@@ -0,0 +1,208 @@
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.config import ORDER_STATUS_NEGATIVE_TTL_MS, ORDER_STATUS_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 查不到 DB 資料時回給使用者的狀態 (也是 negative cache 的值)
+PENDING_OR_NOT_FOUND = "PENDING_OR_NOT_FOUND"
+
+# 狀態在生命週期中的先後，最終狀態永遠不會被 PROCESSING 蓋掉
+_STATUS_RANK = {
+    PENDING_OR_NOT_FOUND: 0,
+    "PROCESSING": 1,
+    "SUCCESS": 2,
+    "FAILED": 2,
+}
+
+# 最終狀態：之後不會再變 (推播的 stream 收到就可以結束)
+FINAL_STATUSES = frozenset({"SUCCESS", "FAILED"})
+
+ORDER_STATUS_CHANNEL_PREFIX = "order_status_events:"
+
+# 只有新版本比快取裡的大才寫入 (版本是等長字串，直接用字串比大小)
+# 寫入成功且有給 channel (ARGV[4]) 時順便 PUBLISH，訂閱者不會收到倒退的狀態
+_SET_IF_NEWER = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local sep = string.find(current, '|', 1, true)
+    if sep and string.sub(current, 1, sep - 1) >= ARGV[1] then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1] .. '|' .. ARGV[2], 'PX', ARGV[3])
+if ARGV[4] ~= '' then
+    redis.call('PUBLISH', ARGV[4], ARGV[2])
+end
+return 1
+"""
+
+
+def order_status_key(order_id: str) -> str:
+    return f"order_status:{order_id}"
+
+
+def order_status_channel(order_id: str) -> str:
+    """Worker 狀態變更的 pub/sub channel (API 的 SSE 訂閱者從這裡收推播)"""
+    return f"{ORDER_STATUS_CHANNEL_PREFIX}{order_id}"
+
+
+def status_rank(status: str) -> int:
+    """狀態在生命週期中的先後 (不認得的狀態當成處理中)"""
+    return _STATUS_RANK.get(status, 1)
+
+
+def status_version(status: str, at_us: Optional[int] = None) -> str:
+    """
+    版本 = 狀態階段 + 微秒時間戳 (固定長度)
+    at_us=0 代表「從 DB 回填」，永遠比 Worker 寫入的同階段版本舊
+    """
+    if at_us is None:
+        at_us = time.time_ns() // 1000
+    return f"{status_rank(status)}{at_us:016d}"
+
+
+def parse_cached_status(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    return value.split("|", 1)[-1]
+
+
+class _StatusCacheBase:
+    """同步 / async 版共用的設定跟 Lua 參數"""
+
+    def __init__(
+        self,
+        client: Any,
+        ttl_seconds: int = ORDER_STATUS_TTL_SECONDS,
+        negative_ttl_ms: int = ORDER_STATUS_NEGATIVE_TTL_MS,
+    ) -> None:
+        self._client = client
+        self._ttl_ms = ttl_seconds * 1000
+        self._negative_ttl_ms = negative_ttl_ms
+        self._set_if_newer = client.register_script(_SET_IF_NEWER)
+
+    def _write_args(
+        self, order_id: str, status: str, version: Optional[str] = None
+    ) -> List[Any]:
+        """Worker 的狀態變更：寫入並推播"""
+        return [
+            version or status_version(status),
+            status,
+            self._ttl_ms,
+            order_status_channel(order_id),
+        ]
+
+    def _backfill_args(self, status: str) -> List[Any]:
+        """
+        DB 回填：版本比 Worker 寫入的舊；PENDING_OR_NOT_FOUND 只短暫快取
+        DB 回填的狀態訂閱者早就收過了，不用再推
+        """
+        negative = status == PENDING_OR_NOT_FOUND
+        return [
+            status_version(status, 0),
+            status,
+            self._negative_ttl_ms if negative else self._ttl_ms,
+            "",
+        ]
+
+
+def _parse_many(
+    order_ids: List[str], values: List[Optional[str]]
+) -> Dict[str, Optional[str]]:
+    return {
+        order_id: parse_cached_status(value)
+        for order_id, value in zip(order_ids, values, strict=True)
+    }
+
+
+class OrderStatusCache(_StatusCacheBase):
+    """
+    訂單狀態的 Write-through Cache
+    Worker 每次狀態變更都寫入 order_status:{order_id}，
+    同時 PUBLISH 到 order_status_events:{order_id} 推給訂閱中的客戶端；
+    API 的輪詢幾乎不用碰 DB。
+    """
+
+    def get(self, order_id: str) -> Optional[str]:
+        return parse_cached_status(self._client.get(order_status_key(order_id)))
+
+    def get_many(self, order_ids: List[str]) -> Dict[str, Optional[str]]:
+        """一次 MGET 查多筆，沒有快取的值是 None"""
+        if not order_ids:
+            return {}
+        values = self._client.mget([order_status_key(o) for o in order_ids])
+        return _parse_many(order_ids, values)
+
+    def set(self, order_id: str, status: str, version: Optional[str] = None) -> bool:
+        """寫入狀態；如果快取裡已經有更新的版本就不寫，回傳 False"""
+        written = self._set_if_newer(
+            keys=[order_status_key(order_id)],
+            args=self._write_args(order_id, status, version),
+        )
+        return bool(written)
+
+    def set_many(self, statuses: Iterable[Tuple[str, str]]) -> None:
+        """批次寫入 (order_id, status)，一次 round-trip"""
+        pipe = self._client.pipeline(transaction=False)
+        for order_id, status in statuses:
+            self._set_if_newer(
+                keys=[order_status_key(order_id)],
+                args=self._write_args(order_id, status),
+                client=pipe,
+            )
+        pipe.execute()
+
+    def backfill_many(self, statuses: Iterable[Tuple[str, str]]) -> None:
+        """用 DB 查到的結果回填快取，一次 round-trip"""
+        pipe = self._client.pipeline(transaction=False)
+        for order_id, status in statuses:
+            self._set_if_newer(
+                keys=[order_status_key(order_id)],
+                args=self._backfill_args(status),
+                client=pipe,
+            )
+        pipe.execute()
+
+    def set_negative(self, order_id: str) -> None:
+        """短暫快取「查不到」，任何真正的狀態寫入都會蓋掉它"""
+        self._set_if_newer(
+            keys=[order_status_key(order_id)],
+            args=self._backfill_args(PENDING_OR_NOT_FOUND),
+        )
+
+
+class AsyncOrderStatusCache(_StatusCacheBase):
+    """
+    API 用的 async 版 (redis.asyncio client)，等 Redis 回應時不佔 event loop
+    只有讀取跟 DB 回填，狀態變更一律由 Worker 寫入
+    """
+
+    async def get(self, order_id: str) -> Optional[str]:
+        return parse_cached_status(await self._client.get(order_status_key(order_id)))
+
+    async def get_many(self, order_ids: List[str]) -> Dict[str, Optional[str]]:
+        """一次 MGET 查多筆，沒有快取的值是 None"""
+        if not order_ids:
+            return {}
+        values = await self._client.mget([order_status_key(o) for o in order_ids])
+        return _parse_many(order_ids, values)
+
+    async def backfill(self, order_id: str, status: str) -> None:
+        """單筆 DB 回填 (查不到的 PENDING_OR_NOT_FOUND 只短暫快取)"""
+        await self._set_if_newer(
+            keys=[order_status_key(order_id)], args=self._backfill_args(status)
+        )
+
+    async def backfill_many(self, statuses: Iterable[Tuple[str, str]]) -> None:
+        """用 DB 查到的結果回填快取，一次 round-trip"""
+        pipe = self._client.pipeline(transaction=False)
+        for order_id, status in statuses:
+            await self._set_if_newer(
+                keys=[order_status_key(order_id)],
+                args=self._backfill_args(status),
+                client=pipe,
+            )
+        await pipe.execute()
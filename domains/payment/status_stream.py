@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from domains.payment.status_cache import (
+    ORDER_STATUS_CHANNEL_PREFIX,
+    order_status_channel,
+)
+
+logger = logging.getLogger(__name__)
+
+# (order_id, status)
+StatusUpdate = Tuple[str, str]
+
+
+class OrderStatusHub:
+    """
+    訂單狀態推播的 fan-out (每個 API process 一個)
+    - 整個 process 共用一條 Redis pub/sub 連線，有人訂閱的訂單才 SUBSCRIBE
+      order_status_events:{order_id}，最後一個訂閱者離開就 UNSUBSCRIBE
+    - 收到的狀態丟進每個訂閱者自己的 asyncio.Queue
+    閒置的訂閱者只佔一個 Queue 跟一個等待中的 coroutine，不佔 Redis 連線
+    """
+
+    def __init__(self, client: Any) -> None:
+        # redis.asyncio client (decode_responses=True)，跟 API 其他地方共用，
+        # 由 lifespan 關閉
+        self.client = client
+        self._pubsub: Any = None
+        self._subscribers: Dict[str, Set["asyncio.Queue[StatusUpdate]"]] = {}
+        self._reader: Optional["asyncio.Task[None]"] = None
+        self._closed = False
+        # SUBSCRIBE / UNSUBSCRIBE 依序送出，同一筆訂單的進出不會交錯
+        self._lock = asyncio.Lock()
+
+    @property
+    def subscribed_orders(self) -> int:
+        return len(self._subscribers)
+
+    @asynccontextmanager
+    async def subscribe(
+        self, order_ids: List[str]
+    ) -> AsyncIterator["asyncio.Queue[StatusUpdate]"]:
+        """訂閱這些訂單的狀態變更，離開 context 時自動退訂"""
+        queue: "asyncio.Queue[StatusUpdate]" = asyncio.Queue()
+        try:
+            async with self._lock:
+                new = [oid for oid in order_ids if oid not in self._subscribers]
+                for order_id in order_ids:
+                    self._subscribers.setdefault(order_id, set()).add(queue)
+                if new:
+                    await self._ensure_pubsub().subscribe(
+                        *(order_status_channel(oid) for oid in new)
+                    )
+            self._ensure_reader()
+            yield queue
+        finally:
+            await self._unsubscribe(order_ids, queue)
+
+    async def _unsubscribe(
+        self, order_ids: List[str], queue: "asyncio.Queue[StatusUpdate]"
+    ) -> None:
+        async with self._lock:
+            gone = []
+            for order_id in order_ids:
+                queues = self._subscribers.get(order_id)
+                if queues is None:
+                    continue
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[order_id]
+                    gone.append(order_id)
+            if not gone or self._pubsub is None:
+                return
+            try:
+                await self._pubsub.unsubscribe(
+                    *(order_status_channel(oid) for oid in gone)
+                )
+            except Exception as e:
+                # 連線斷了：重連時只會重新訂閱還有人訂的 channel
+                logger.warning(f"⚠️ [StatusHub] Failed to unsubscribe: {e}")
+
+    def _ensure_pubsub(self) -> Any:
+        if self._pubsub is None:
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        return self._pubsub
+
+    def _ensure_reader(self) -> None:
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read(), name="order-status-hub")
+
+    async def _read(self) -> None:
+        pubsub = self._ensure_pubsub()
+        # 不能只靠 cancel：redis-py 讀取到一半被 cancel 時可能會當成 timeout 吞掉
+        while not self._closed:
+            try:
+                if not pubsub.subscribed:
+                    await asyncio.sleep(0.5)
+                    continue
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+                if message and message["type"] == "message":
+                    self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # redis-py 下一次讀取時會重連並重新 SUBSCRIBE
+                logger.warning(f"⚠️ [StatusHub] Pub/sub read failed: {e}")
+                await asyncio.sleep(1.0)
+
+    def _dispatch(self, channel: str, status: str) -> None:
+        order_id = channel.removeprefix(ORDER_STATUS_CHANNEL_PREFIX)
+        for queue in self._subscribers.get(order_id, ()):
+            queue.put_nowait((order_id, status))
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
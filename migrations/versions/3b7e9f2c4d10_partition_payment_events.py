@@ -0,0 +1,189 @@
+"""partition payment_events by month
+
+Revision ID: 3b7e9f2c4d10
+Revises: 682975db1a03
+Create Date: 2026-10-17 10:12:41.503118
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3b7e9f2c4d10"
+down_revision: Union[str, Sequence[str], None] = "682975db1a03"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 補建 [start_month, 這個月 + months_ahead] 每個月的 partition，回傳新建幾個
+# (worker 啟動時 / apps.cli.archive_payments ensure 會呼叫)
+ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION flowpay_ensure_payment_partitions(
+    months_ahead integer,
+    start_month date DEFAULT date_trunc('month', now() AT TIME ZONE 'UTC')::date
+) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    cur_month date := date_trunc('month', start_month)::date;
+    last_month date := (
+        date_trunc('month', now() AT TIME ZONE 'UTC')
+        + make_interval(months => months_ahead)
+    )::date;
+    part_name text;
+    created integer := 0;
+BEGIN
+    WHILE cur_month <= last_month LOOP
+        part_name := 'payment_events_' || to_char(cur_month, 'YYYYMM');
+        IF to_regclass(part_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF payment_events '
+                'FOR VALUES FROM (%L) TO (%L)',
+                part_name,
+                cur_month::timestamp AT TIME ZONE 'UTC',
+                (cur_month + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+            );
+            created := created + 1;
+        END IF;
+        cur_month := (cur_month + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE payment_events RENAME TO payment_events_legacy")
+    op.execute(
+        "ALTER INDEX ix_payment_events_order_id "
+        "RENAME TO ix_payment_events_legacy_order_id"
+    )
+    op.execute(
+        "ALTER TABLE payment_events_legacy "
+        "RENAME CONSTRAINT payment_events_pkey TO payment_events_legacy_pkey"
+    )
+
+    # partitioned table 的 PK / unique 一定要包含 partition key
+    op.execute(
+        """
+        CREATE TABLE payment_events (
+            id integer GENERATED BY DEFAULT AS IDENTITY,
+            order_id varchar NOT NULL,
+            amount integer NOT NULL,
+            status varchar NOT NULL,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("CREATE INDEX ix_payment_events_order_id ON payment_events (order_id)")
+    # 按時間 append 的資料，BRIN 很小又能讓時間範圍查詢跳過大部分 block
+    op.execute(
+        "CREATE INDEX ix_payment_events_created_at_brin "
+        "ON payment_events USING brin (created_at)"
+    )
+
+    # order_id 的唯一性 + 查單時拿 created_at 去 prune partition
+    op.execute(
+        """
+        CREATE TABLE payment_order_keys (
+            order_id varchar PRIMARY KEY,
+            created_at timestamptz NOT NULL
+        )
+        """
+    )
+    op.execute(
+        "CREATE INDEX ix_payment_order_keys_created_at_brin "
+        "ON payment_order_keys USING brin (created_at)"
+    )
+
+    op.execute(ENSURE_PARTITIONS_FUNCTION)
+    # 舊資料最早的那個月開始建，預先建好未來 3 個月
+    op.execute(
+        """
+        SELECT flowpay_ensure_payment_partitions(
+            3,
+            coalesce(
+                (SELECT min(created_at::timestamp) FROM payment_events_legacy),
+                now() AT TIME ZONE 'UTC'
+            )::date
+        )
+        """
+    )
+
+    # 舊的 created_at 是 str(datetime.utcnow())，當成 UTC 轉成 timestamptz
+    op.execute(
+        """
+        INSERT INTO payment_events (id, order_id, amount, status, created_at)
+        SELECT id, order_id, amount, status, created_at::timestamp AT TIME ZONE 'UTC'
+        FROM payment_events_legacy
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO payment_order_keys (order_id, created_at)
+        SELECT order_id, created_at FROM payment_events
+        """
+    )
+    op.execute(
+        """
+        SELECT setval(
+            pg_get_serial_sequence('payment_events', 'id'),
+            coalesce((SELECT max(id) FROM payment_events), 0) + 1,
+            false
+        )
+        """
+    )
+    op.execute("DROP TABLE payment_events_legacy")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # 已經歸檔 (detach / drop) 的月份不會回來，要的話先從 archive 匯回去
+    op.execute("ALTER TABLE payment_events RENAME TO payment_events_partitioned")
+    op.execute(
+        "ALTER INDEX ix_payment_events_order_id "
+        "RENAME TO ix_payment_events_partitioned_order_id"
+    )
+    op.execute(
+        "ALTER TABLE payment_events_partitioned "
+        "RENAME CONSTRAINT payment_events_pkey TO payment_events_partitioned_pkey"
+    )
+    op.execute(
+        """
+        CREATE TABLE payment_events (
+            id SERIAL NOT NULL,
+            order_id varchar NOT NULL,
+            amount integer NOT NULL,
+            status varchar NOT NULL,
+            created_at varchar NOT NULL,
+            CONSTRAINT payment_events_pkey PRIMARY KEY (id)
+        )
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO payment_events (id, order_id, amount, status, created_at)
+        SELECT id, order_id, amount, status,
+            to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US')
+        FROM payment_events_partitioned
+        """
+    )
+    op.execute(
+        "CREATE UNIQUE INDEX ix_payment_events_order_id ON payment_events (order_id)"
+    )
+    op.execute(
+        """
+        SELECT setval(
+            pg_get_serial_sequence('payment_events', 'id'),
+            coalesce((SELECT max(id) FROM payment_events), 0) + 1,
+            false
+        )
+        """
+    )
+    # 連 partition 一起刪
+    op.execute("DROP TABLE payment_events_partitioned")
+    op.execute("DROP TABLE payment_order_keys")
+    op.execute("DROP FUNCTION flowpay_ensure_payment_partitions(integer, date)")
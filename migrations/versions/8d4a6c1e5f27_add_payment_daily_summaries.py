@@ -0,0 +1,51 @@
+"""add payment_daily_summaries
+
+Revision ID: 8d4a6c1e5f27
+Revises: 3b7e9f2c4d10
+Create Date: 2026-10-17 15:40:08.221734
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8d4a6c1e5f27"
+down_revision: Union[str, Sequence[str], None] = "3b7e9f2c4d10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "payment_daily_summaries",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("event_count", sa.BigInteger(), nullable=False),
+        sa.Column("amount_total", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "refreshed_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("day", "status"),
+    )
+    # 既有的資料一次算好，之後由 worker / settlement CLI 只重算最近幾天
+    op.execute(
+        """
+        INSERT INTO payment_daily_summaries
+            (day, status, event_count, amount_total, refreshed_at)
+        SELECT (created_at AT TIME ZONE 'UTC')::date, status, count(*),
+            coalesce(sum(amount), 0), now()
+        FROM payment_events GROUP BY 1, 2
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("payment_daily_summaries")
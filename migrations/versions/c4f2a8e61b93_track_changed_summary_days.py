@@ -0,0 +1,63 @@
+"""track changed payment_daily_summaries days
+
+Revision ID: c4f2a8e61b93
+Revises: 8d4a6c1e5f27
+Create Date: 2026-10-17 18:12:45.503911
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4f2a8e61b93"
+down_revision: Union[str, Sequence[str], None] = "8d4a6c1e5f27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 每個 statement 只跑一次 (transition table 裡可能有一整批 INSERT / UPDATE)
+# 當天已經標記過就什麼都不寫，不會在熱點那一列上搶 row lock
+MARK_DAYS_FUNCTION = """
+CREATE OR REPLACE FUNCTION flowpay_mark_summary_days() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO payment_summary_dirty_days (day)
+    SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date FROM changed_rows
+    ON CONFLICT (day) DO NOTHING;
+    RETURN NULL;
+END;
+$$
+"""
+
+# transition table 一個 trigger 只能掛一種事件
+_TRIGGERS = {
+    "payment_events_mark_inserted_days": ("INSERT", "NEW"),
+    "payment_events_mark_updated_days": ("UPDATE", "NEW"),
+    "payment_events_mark_deleted_days": ("DELETE", "OLD"),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "payment_summary_dirty_days",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint("day"),
+    )
+    op.execute(MARK_DAYS_FUNCTION)
+    for name, (event, transition) in _TRIGGERS.items():
+        op.execute(
+            f"CREATE TRIGGER {name} AFTER {event} ON payment_events "
+            f"REFERENCING {transition} TABLE AS changed_rows "
+            "FOR EACH STATEMENT EXECUTE FUNCTION flowpay_mark_summary_days()"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in _TRIGGERS:
+        op.execute(f"DROP TRIGGER {name} ON payment_events")
+    op.execute("DROP FUNCTION flowpay_mark_summary_days()")
+    op.drop_table("payment_summary_dirty_days")
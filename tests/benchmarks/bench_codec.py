@@ -0,0 +1,95 @@
+"""
+訊息編解碼的 micro-benchmark
+
+    python -m tests.benchmarks.bench_codec
+
+比較舊的寫法 (payload.json() + json.loads + dict.get) 跟 domains.payment.codec
+"""
+
+import json
+import timeit
+import warnings
+from typing import Any, Callable, Dict, List, Tuple
+
+from domains.payment.codec import (
+    JSON_CONTENT_TYPE,
+    MSGPACK_CONTENT_TYPE,
+    MessageDecodeError,
+    decode_payment,
+    encode_payment,
+)
+from domains.payment.schemas import WebhookPayload
+
+NUMBER = 50_000
+
+PAYLOAD = WebhookPayload(
+    order_id="BENCH_0000000001",
+    amount=12345,
+    status="PENDING",
+    callback_url="https://merchant.example.com/flowpay/callback",
+)
+RAW_JSON = PAYLOAD.model_dump_json().encode()
+
+
+def legacy_encode() -> bytes:
+    with warnings.catch_warnings():
+        # payload.json() 是 pydantic v1 的 API，v2 會發 DeprecationWarning
+        warnings.simplefilter("ignore")
+        return PAYLOAD.json().encode()
+
+
+def legacy_decode(body: bytes) -> Tuple[Any, Any, Any, Any]:
+    data: Dict[str, Any] = json.loads(body)
+    return (
+        data.get("order_id"),
+        data.get("amount"),
+        data.get("status"),
+        data.get("callback_url"),
+    )
+
+
+def cases() -> List[Tuple[str, Callable[[], Any]]]:
+    legacy_body = legacy_encode()
+    result: List[Tuple[str, Callable[[], Any]]] = [
+        ("legacy encode  payload.json()", legacy_encode),
+        ("legacy decode  json.loads + .get", lambda: legacy_decode(legacy_body)),
+        (
+            "codec  encode  json (raw bytes)",
+            lambda: encode_payment(PAYLOAD, raw_json=RAW_JSON),
+        ),
+        ("codec  encode  json", lambda: encode_payment(PAYLOAD)),
+        ("codec  decode  json (validated)", lambda: decode_payment(RAW_JSON)),
+    ]
+    try:
+        packed = encode_payment(PAYLOAD, MSGPACK_CONTENT_TYPE)
+    except MessageDecodeError:
+        return result
+    result += [
+        (
+            "codec  encode  msgpack",
+            lambda: encode_payment(PAYLOAD, MSGPACK_CONTENT_TYPE),
+        ),
+        (
+            "codec  decode  msgpack",
+            lambda: decode_payment(packed, MSGPACK_CONTENT_TYPE),
+        ),
+    ]
+    return result
+
+
+def main() -> None:
+    print(f"{'case':<36} {'µs/op':>8}")
+    sizes = {JSON_CONTENT_TYPE: len(RAW_JSON)}
+    for name, fn in cases():
+        seconds = min(timeit.repeat(fn, number=NUMBER, repeat=3))
+        print(f"{name:<36} {seconds / NUMBER * 1e6:>8.2f}")
+    try:
+        sizes[MSGPACK_CONTENT_TYPE] = len(encode_payment(PAYLOAD, MSGPACK_CONTENT_TYPE))
+    except MessageDecodeError:
+        pass
+    for content_type, size in sizes.items():
+        print(f"{content_type:<36} {size:>8} bytes")
+
+
+if __name__ == "__main__":
+    main()
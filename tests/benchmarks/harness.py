@@ -0,0 +1,266 @@
+"""
+Benchmark 用的 in-process 替身：不需要 RabbitMQ / Redis / Postgres / 銀行
+
+- Redis    -> fakeredis (在 import apps.* 之前裝進 core.cache)；
+              API 的 redis.asyncio client 換成共用同一份資料的 FakeAsyncRedis
+- RabbitMQ -> InMemoryBroker (API 的 AsyncPublisher 跟 Worker 的 channel 都接到這裡)
+- Postgres -> SQLite 檔案 (PaymentService 的單筆流程；API 用 aiosqlite 讀同一個檔案，
+              或用 make_blocking_session 換回同步 Session 對照)
+- 銀行      -> apps.bank_sim 透過 httpx.ASGITransport 直接呼叫
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import fakeredis
+import pika
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import Session, SQLModel, create_engine
+
+
+def install_fake_redis() -> Any:
+    """
+    把 core.cache.redis_client 換成 fakeredis
+    (要在 import Worker 之前呼叫，`from core.cache import redis_client` 才會拿到替身)
+    """
+    import core.cache
+
+    if isinstance(core.cache.redis_client, fakeredis.FakeRedis):
+        return core.cache.redis_client
+    client = fakeredis.FakeRedis(decode_responses=True)
+    core.cache.redis_client = client
+    return client
+
+
+def make_sqlite_engine() -> Engine:
+    """每次 benchmark 一個新的 SQLite 檔案 (多個 Worker thread 可以同時用)"""
+    path = os.path.join(tempfile.mkdtemp(prefix="flowpay-bench-"), "flowpay.db")
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    # 只 import model，讓 metadata 有 payment_events
+    from domains.payment import model  # noqa: F401
+
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def make_async_sqlite_engine(engine: Engine) -> AsyncEngine:
+    """同一個 SQLite 檔案的 async engine (aiosqlite)，給 API 的查詢用"""
+    from core.config import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+    return create_async_engine(
+        engine.url.set(drivername="sqlite+aiosqlite"),
+        connect_args={"timeout": 30},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+    )
+
+
+def make_blocking_session(engine: Engine) -> Any:
+    """
+    API 的 AsyncSession 替身：查詢用同步 Session 直接在 event loop 上跑
+    (換成 async engine 之前的寫法，讀寫混合 benchmark 拿來跟 async 路徑對照)
+    """
+
+    class BlockingSession:
+        def __init__(self, _async_engine: Any = None) -> None:
+            self._session = Session(engine)
+
+        async def __aenter__(self) -> "BlockingSession":
+            return self
+
+        async def __aexit__(self, *exc_info: Any) -> None:
+            self._session.close()
+
+        async def exec(self, statement: Any) -> Any:
+            return self._session.exec(statement)
+
+    return BlockingSession
+
+
+def fake_async_redis(redis_client: Any) -> Any:
+    """
+    跟 install_fake_redis 的 client 共用同一份資料的 redis.asyncio 替身
+    (要在 event loop 裡建立，它會綁在建立時的 loop 上)
+    """
+    server = redis_client.connection_pool.connection_kwargs["server"]
+    return fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+
+def use_fake_api_clients(
+    redis_client: Any,
+    async_engine: Optional[AsyncEngine] = None,
+    session_factory: Optional[Any] = None,
+) -> None:
+    """
+    把 API 的 async client 換成替身 (每次 asyncio.run 都要重新換一次)
+    session_factory：取代 AsyncSession (None = 用真的 AsyncSession)
+    """
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from apps.api import main as api
+    from domains.payment.dedupe import WebhookDeduplicator
+    from domains.payment.status_cache import AsyncOrderStatusCache
+
+    client = fake_async_redis(redis_client)
+    api.redis_client = client
+    api.status_cache = AsyncOrderStatusCache(client)
+    api.deduplicator = WebhookDeduplicator(client)
+    if async_engine is not None:
+        api.async_engine = async_engine  # type: ignore[attr-defined]
+    api.AsyncSession = session_factory or AsyncSession  # type: ignore[attr-defined]
+
+
+class _Method:
+    def __init__(self, delivery_tag: int, routing_key: str) -> None:
+        self.delivery_tag = delivery_tag
+        self.routing_key = routing_key
+
+
+class _NullConnection:
+    is_open = True
+
+    def process_data_events(self, time_limit: Optional[float] = None) -> None:
+        return None
+
+
+class InMemoryBroker:
+    """
+    最小的 RabbitMQ 替身：每個 queue 一個 deque
+    confirm_latency_ms 模擬 Broker 持久化 + 確認的 round-trip
+    """
+
+    def __init__(self, confirm_latency_ms: float = 0.2) -> None:
+        self.confirm_latency = confirm_latency_ms / 1000
+        self.queues: Dict[str, Deque[Tuple[Any, Any, bytes]]] = defaultdict(deque)
+        self.unacked: Dict[int, bytes] = {}
+        self.on_ack: Optional[Callable[[bytes], None]] = None
+        self._tags = itertools.count(1)
+        self._ready = threading.Condition()
+
+    def channel(self) -> "InMemoryChannel":
+        return InMemoryChannel(self)
+
+    def deliver(self, messages: List[Tuple[str, bytes, Any]]) -> None:
+        with self._ready:
+            for routing_key, body, properties in messages:
+                self.queues[routing_key].append((routing_key, properties, body))
+            self._ready.notify_all()
+
+    def get(self, queue_name: str, timeout: float) -> Optional[Tuple[Any, Any, bytes]]:
+        with self._ready:
+            if not self._ready.wait_for(lambda: self.queues[queue_name], timeout):
+                return None
+            routing_key, properties, body = self.queues[queue_name].popleft()
+            tag = next(self._tags)
+            self.unacked[tag] = body
+        return _Method(tag, routing_key), properties, body
+
+    def settle(self, delivery_tag: int, multiple: bool = False) -> None:
+        with self._ready:
+            tags = (
+                [t for t in self.unacked if t <= delivery_tag]
+                if multiple
+                else [delivery_tag]
+            )
+            bodies = [self.unacked.pop(t) for t in tags if t in self.unacked]
+        if self.on_ack is not None:
+            for body in bodies:
+                self.on_ack(body)
+
+
+class InMemoryChannel:
+    """Worker (ack / nack / 重試的 basic_publish) 用的 channel"""
+
+    def __init__(self, broker: InMemoryBroker) -> None:
+        self.broker = broker
+        self.connection = _NullConnection()
+        self.is_open = True
+
+    def basic_publish(
+        self,
+        exchange: str,
+        routing_key: str,
+        body: bytes,
+        properties: Optional[pika.BasicProperties] = None,
+        mandatory: bool = False,
+    ) -> None:
+        time.sleep(self.broker.confirm_latency)
+        self.broker.deliver([(routing_key, body, properties)])
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False) -> None:
+        self.broker.settle(delivery_tag, multiple)
+
+    def basic_nack(
+        self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True
+    ) -> None:
+        self.broker.settle(delivery_tag, multiple)
+
+
+class _InMemoryExchange:
+    """aio-pika default exchange 的替身：等 confirm_latency 後送進 InMemoryBroker"""
+
+    def __init__(self, broker: InMemoryBroker) -> None:
+        self.broker = broker
+
+    async def publish(
+        self, message: Any, routing_key: str, *, timeout: Optional[float] = None
+    ) -> None:
+        await asyncio.sleep(self.broker.confirm_latency)
+        # aio_pika.Message 本身有 headers / content_type，Worker 直接當 properties 用
+        self.broker.deliver([(routing_key, message.body, message)])
+
+
+class _InMemoryAsyncChannel:
+    def __init__(self, broker: InMemoryBroker) -> None:
+        self.default_exchange = _InMemoryExchange(broker)
+
+    async def close(self) -> None:
+        return None
+
+
+def make_async_publisher(broker: InMemoryBroker, **kwargs: Any) -> Any:
+    """真正的 AsyncPublisher (輪流用 channel / 在途上限)，只把連線換成 InMemoryBroker"""
+    from core.async_messaging import AsyncPublisher
+
+    class InMemoryAsyncPublisher(AsyncPublisher):
+        async def _open(self) -> List[Any]:
+            return [_InMemoryAsyncChannel(broker) for _ in range(max(self.channels, 1))]
+
+    return InMemoryAsyncPublisher(**kwargs)
+
+
+def make_payment_service(redis_client: Any, engine: Engine) -> Any:
+    """PaymentService 接 SQLite + fakeredis + 模擬銀行 (不延遲、不出錯)"""
+    import httpx
+
+    from apps.bank_sim import main as bank_sim
+    from domains.payment import service as service_module
+    from domains.payment.gateway import BankGatewayClient
+    from domains.payment.status_cache import OrderStatusCache
+
+    bank_sim.config = bank_sim.SimulatorConfig(
+        latency_ms=0, error_rate=0, funds_limit=10**9
+    )
+    service_module.engine = engine  # type: ignore[attr-defined]
+    return service_module.PaymentService(
+        status_cache=OrderStatusCache(redis_client),
+        bank_gateway=BankGatewayClient(
+            base_url="http://bank", transport=httpx.ASGITransport(app=bank_sim.app)
+        ),
+    )
+
+
+def order_id_of(body: bytes) -> str:
+    order_id: str = json.loads(body)["order_id"]
+    return order_id
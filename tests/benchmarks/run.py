@@ -0,0 +1,165 @@
+"""
+In-process benchmark suite (不需要 RabbitMQ / Redis / Postgres)
+
+    python -m tests.benchmarks.run                       # 全部跑，跟 baseline 比較
+    python -m tests.benchmarks.run --only api,e2e --concurrency 1,32
+    python -m tests.benchmarks.run --save-baseline       # 把這次結果存成 baseline
+
+結果寫成 JSON (--output)；有 baseline 時，throughput 掉超過 --tolerance
+或 p99 變慢超過 --latency-tolerance 就以 exit code 1 結束。
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+# 要在 import core.* 之前設定：trace 不取樣 (不連 OTLP)、benchmark 不量 profiler
+os.environ.setdefault("TRACE_SAMPLE_RATIO", "0")
+os.environ.setdefault("STAGE_STATS_LOG_INTERVAL_SECONDS", "0")
+os.environ.setdefault("METRICS_PORT", "0")
+
+from tests.benchmarks.harness import install_fake_redis  # noqa: E402
+
+install_fake_redis()
+
+from tests.benchmarks.suites import SUITES  # noqa: E402
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "latest.json")
+
+# 每個 benchmark 預設跑幾次 (--scale 可以整體放大縮小)
+DEFAULT_OPS = {
+    "signature": 20000,
+    "dedupe": 5000,
+    "publish": 2000,
+    "service_commit": 300,
+    "api": 1000,
+    "mixed": 600,
+    "mixed_sync_async": 600,
+    "e2e": 300,
+}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="FlowPay in-process benchmarks")
+    parser.add_argument("--only", help=f"逗號分隔，可選: {','.join(SUITES)}")
+    parser.add_argument("--concurrency", default="1,16,64")
+    parser.add_argument("--scale", type=float, default=1.0, help="ops 倍數")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--latency-tolerance", type=float, default=0.5)
+    return parser.parse_args(argv)
+
+
+def run_suites(
+    names: List[str], concurrency_levels: List[int], scale: float
+) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    for name in names:
+        bench, concurrent = SUITES[name]
+        ops = max(int(DEFAULT_OPS[name] * scale), 1)
+        for concurrency in concurrency_levels if concurrent else [1]:
+            key = f"{name}@c{concurrency}"
+            result = bench(ops, concurrency)
+            results[key] = result
+            print(
+                f"{key:<22} {result['throughput']:>10.1f} ops/s   "
+                f"p50 {result['p50_ms']:>8.3f}ms  p95 {result['p95_ms']:>8.3f}ms  "
+                f"p99 {result['p99_ms']:>8.3f}ms",
+                flush=True,
+            )
+            if "sync_p99_ms" in result:
+                print(
+                    f"{'  (sync db path)':<22} {'':>16}   "
+                    f"p50 {result['sync_p50_ms']:>8.3f}ms  {'':>15}  "
+                    f"p99 {result['sync_p99_ms']:>8.3f}ms",
+                    flush=True,
+                )
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+    latency_tolerance: float,
+) -> List[str]:
+    """回傳退步的項目 (空 list = 沒有退步)"""
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if current["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: throughput {current['throughput']} < "
+                f"baseline {base['throughput']} (-{tolerance:.0%})"
+            )
+        if current["p99_ms"] > base["p99_ms"] * (1 + latency_tolerance):
+            regressions.append(
+                f"{key}: p99 {current['p99_ms']}ms > "
+                f"baseline {base['p99_ms']}ms (+{latency_tolerance:.0%})"
+            )
+    return regressions
+
+
+def write_json(path: str, data: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    # 每筆付款都印 INFO 會讓 benchmark 變成在量 logging
+    logging.disable(logging.WARNING)
+
+    names = args.only.split(",") if args.only else list(SUITES)
+    unknown = [name for name in names if name not in SUITES]
+    if unknown:
+        print(f"Unknown benchmark(s): {', '.join(unknown)}")
+        return 2
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    results = run_suites(names, levels, args.scale)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": args.scale,
+        },
+        "results": results,
+    }
+    write_json(args.output, report)
+    print(f"\n📄 Results written to {args.output}")
+
+    if args.save_baseline:
+        write_json(args.baseline, report)
+        print(f"📌 Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("ℹ️ No baseline yet (run with --save-baseline to create one).")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance, args.latency_tolerance)
+    for regression in regressions:
+        print(f"❌ Regression: {regression}")
+    if not regressions:
+        print("✅ No regressions against baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
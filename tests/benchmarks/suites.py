@@ -0,0 +1,429 @@
+"""
+各項 benchmark：每個函式回傳一筆結果
+
+{"ops", "seconds", "throughput", "p50_ms", "p95_ms", "p99_ms", "concurrency"}
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import Engine, event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session, create_engine
+
+from tests.benchmarks.harness import (
+    InMemoryBroker,
+    fake_async_redis,
+    make_async_publisher,
+    make_async_sqlite_engine,
+    make_blocking_session,
+    make_payment_service,
+    make_sqlite_engine,
+    order_id_of,
+    use_fake_api_clients,
+)
+
+Result = Dict[str, float]
+
+
+def summarize(latencies: List[float], seconds: float, concurrency: int) -> Result:
+    """latencies: 每個操作花的秒數"""
+    ordered = sorted(latencies)
+
+    def pick(q: float) -> float:
+        if not ordered:
+            return 0.0
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+    return {
+        "ops": len(ordered),
+        "seconds": round(seconds, 4),
+        "throughput": round(len(ordered) / seconds, 1) if seconds else 0.0,
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "concurrency": concurrency,
+    }
+
+
+def _loop(operation: Callable[[int], Any], ops: int) -> Result:
+    """單一 thread 連續做 ops 次"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(ops):
+        op_started = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - op_started)
+    return summarize(latencies, time.perf_counter() - started, 1)
+
+
+async def _aloop(operation: Callable[[int], Awaitable[Any]], ops: int) -> Result:
+    """單一 coroutine 連續做 ops 次"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(ops):
+        op_started = time.perf_counter()
+        await operation(i)
+        latencies.append(time.perf_counter() - op_started)
+    return summarize(latencies, time.perf_counter() - started, 1)
+
+
+def _webhook_body(order_id: str) -> bytes:
+    return json.dumps(
+        {"order_id": order_id, "amount": 100, "status": "PENDING"},
+        separators=(",", ":"),
+    ).encode()
+
+
+def _sign(body: bytes) -> str:
+    from core.security import SECRET_KEY
+
+    return hmac.new(SECRET_KEY.encode(), body, hashlib.sha256).hexdigest()
+
+
+def _run_id() -> str:
+    return uuid.uuid4().hex[:8]
+
+
+# ---------- 子系統 ----------
+
+
+def bench_signature(ops: int, concurrency: int = 1) -> Result:
+    from core.security import is_valid_signature
+
+    body = _webhook_body("BENCH_SIGNATURE")
+    signature = _sign(body)
+    return _loop(lambda _: is_valid_signature(body, signature), ops)
+
+
+def bench_dedupe(ops: int, concurrency: int = 1) -> Result:
+    from core.cache import redis_client
+    from domains.payment.dedupe import WebhookDeduplicator
+
+    async def run() -> Result:
+        deduplicator = WebhookDeduplicator(fake_async_redis(redis_client))
+        run_id = _run_id()
+        return await _aloop(lambda i: deduplicator.claim(f"DEDUPE_{run_id}_{i}"), ops)
+
+    return asyncio.run(run())
+
+
+def bench_publish(ops: int, concurrency: int = 1) -> Result:
+    """
+    AsyncPublisher：concurrency 個 coroutine 一起 publish，各自等 Broker confirm
+    (Broker 確認延遲由 InMemoryBroker 模擬)
+    """
+    from core.config import PUBLISHER_POOL_SIZE
+
+    async def run() -> Result:
+        publisher = make_async_publisher(InMemoryBroker(), channels=PUBLISHER_POOL_SIZE)
+        await publisher.start()
+        body = _webhook_body("BENCH_PUBLISH")
+        latencies: List[float] = []
+        counter = iter(range(ops))
+
+        async def publish_loop() -> None:
+            for _ in counter:
+                op_started = time.perf_counter()
+                await publisher.publish(body)
+                latencies.append(time.perf_counter() - op_started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(publish_loop() for _ in range(concurrency)))
+        seconds = time.perf_counter() - started
+        await publisher.close()
+        return summarize(latencies, seconds, concurrency)
+
+    return asyncio.run(run())
+
+
+def bench_service_commit(ops: int, concurrency: int = 1) -> Result:
+    """PaymentService.process_payment：建單 commit -> 銀行 -> 狀態 commit -> 快取"""
+    from core.cache import redis_client
+
+    service = make_payment_service(redis_client, make_sqlite_engine())
+    run = _run_id()
+    result = _loop(
+        lambda i: service.process_payment(f"COMMIT_{run}_{i}", 100, "PENDING"), ops
+    )
+    service.bank_gateway.close()
+    return result
+
+
+# ---------- API / End-to-End ----------
+
+
+@asynccontextmanager
+async def _api_client(
+    broker: InMemoryBroker,
+    concurrency: int,
+    async_engine: Optional[AsyncEngine] = None,
+    session_factory: Optional[Any] = None,
+) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    API 接上 InMemoryBroker + fakeredis (+ SQLite) 的 client
+    API 的 async client 都綁在 event loop 上，每次 asyncio.run 重新建立；
+    先把 concurrency 條 Redis / DB 連線開好，不要把建連線的時間算進延遲
+    """
+    from apps.api import main as api
+    from core.cache import redis_client
+    from core.config import DB_POOL_SIZE, PUBLISHER_POOL_SIZE
+
+    use_fake_api_clients(redis_client, async_engine, session_factory)
+    publisher = make_async_publisher(broker, channels=PUBLISHER_POOL_SIZE)
+    await publisher.start()
+    api.app.dependency_overrides[api.get_publisher] = lambda: publisher
+    await asyncio.gather(*(api.redis_client.ping() for _ in range(concurrency)))
+    if async_engine is not None:
+        warm = min(concurrency, DB_POOL_SIZE)
+        connections = [await async_engine.connect() for _ in range(warm)]
+        for connection in connections:
+            await connection.close()
+    transport = httpx.ASGITransport(app=api.app)
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://api"
+        ) as client:
+            yield client
+    finally:
+        await publisher.close()
+
+
+async def _post_webhook(client: httpx.AsyncClient, order_id: str) -> None:
+    body = _webhook_body(order_id)
+    resp = await client.post(
+        "/webhook", content=body, headers={"X-Signature": _sign(body)}
+    )
+    resp.raise_for_status()
+
+
+async def _drive_api(
+    broker: InMemoryBroker,
+    ops: int,
+    concurrency: int,
+    prefix: str,
+    on_sent: Callable[[str, float], None],
+) -> List[float]:
+    """concurrency 個 client 一起打 /webhook，總共 ops 筆"""
+    latencies: List[float] = []
+    counter = iter(range(ops))
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        for i in counter:
+            order_id = f"{prefix}_{i}"
+            started = time.perf_counter()
+            on_sent(order_id, started)
+            await _post_webhook(client, order_id)
+            latencies.append(time.perf_counter() - started)
+
+    async with _api_client(broker, concurrency) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+    return latencies
+
+
+def bench_api(ops: int, concurrency: int = 1) -> Result:
+    """API 入口：驗簽 + 解析 + 去重 + publish (等 Broker 確認)"""
+    started = time.perf_counter()
+    latencies = asyncio.run(
+        _drive_api(
+            InMemoryBroker(), ops, concurrency, f"API_{_run_id()}", lambda *_: None
+        )
+    )
+    seconds = time.perf_counter() - started
+    return summarize(latencies, seconds, concurrency)
+
+
+# 讀寫混合時，每個 SELECT 模擬的 DB 延遲 (SQLite 本身太快，看不出誰卡住 event loop)
+MIXED_DB_LATENCY_MS = 2.0
+
+
+def _slow_select(statement: str) -> None:
+    if statement.lstrip().upper().startswith("SELECT"):
+        time.sleep(MIXED_DB_LATENCY_MS / 1000)
+
+
+def _seed_orders(engine: Engine, prefix: str, count: int) -> List[str]:
+    """先建好 count 筆已完成的訂單，給查單打 DB 用"""
+    from domains.payment.model import PaymentEvent, PaymentOrderKey, utcnow
+
+    order_ids = [f"{prefix}_{i}" for i in range(count)]
+    with Session(engine) as session:
+        now = utcnow()
+        for order_id in order_ids:
+            session.add(
+                PaymentEvent(
+                    order_id=order_id, amount=100, status="SUCCESS", created_at=now
+                )
+            )
+            session.add(PaymentOrderKey(order_id=order_id, created_at=now))
+        session.commit()
+    return order_ids
+
+
+def _run_mixed(
+    engine: Engine, order_ids: List[str], ops: int, concurrency: int, sync_db: bool
+) -> Result:
+    """
+    webhook 跟查單 (GET /orders/{id}，快取沒命中要查 DB) 交錯打，回傳 webhook 的延遲
+    (讀取的 p99 放在 read_p99_ms)
+    sync_db：查單用同步 Session 在 event loop 上跑 (舊寫法)，否則走 aiosqlite
+    """
+    run_id = _run_id()
+    writes: List[float] = []
+    reads: List[float] = []
+
+    async def run() -> None:
+        async_engine: Optional[AsyncEngine] = None
+        session_factory = None
+        if sync_db:
+            sync_engine = create_engine(
+                engine.url, connect_args={"check_same_thread": False, "timeout": 30}
+            )
+
+            @event.listens_for(sync_engine, "connect")
+            def add_sync_latency(dbapi_connection: Any, _: Any) -> None:
+                dbapi_connection.set_trace_callback(_slow_select)
+
+            session_factory = make_blocking_session(sync_engine)
+        else:
+            async_engine = make_async_sqlite_engine(engine)
+
+            @event.listens_for(async_engine.sync_engine, "connect")
+            def add_latency(dbapi_connection: Any, _: Any) -> None:
+                dbapi_connection.run_async(
+                    lambda conn: conn.set_trace_callback(_slow_select)
+                )
+
+        counter = iter(range(ops))
+
+        async def client_loop(client: httpx.AsyncClient) -> None:
+            for i in counter:
+                started = time.perf_counter()
+                if i % 2 == 0:
+                    await _post_webhook(client, f"MIXW_{run_id}_{i}")
+                    writes.append(time.perf_counter() - started)
+                else:
+                    resp = await client.get(f"/orders/{order_ids[i // 2]}")
+                    resp.raise_for_status()
+                    reads.append(time.perf_counter() - started)
+
+        async with _api_client(
+            InMemoryBroker(), concurrency, async_engine, session_factory
+        ) as client:
+            # 先暖機 (第一個請求會載入 Lua script)
+            await _post_webhook(client, f"WARM_{run_id}")
+            await client.get(f"/orders/{order_ids[-1]}")
+            await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        if async_engine is not None:
+            await async_engine.dispose()
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    seconds = time.perf_counter() - started
+    result = summarize(writes, seconds, concurrency)
+    result["read_p99_ms"] = summarize(reads, seconds, concurrency)["p99_ms"]
+    return result
+
+
+def bench_mixed(ops: int, concurrency: int = 1) -> Result:
+    """
+    讀寫混合：DB 的每個 SELECT 在 aiosqlite 的 thread 裡等 MIXED_DB_LATENCY_MS；
+    DB 查詢卡住 event loop 的話 webhook 的尾端延遲會跟著變長
+    """
+    engine = make_sqlite_engine()
+    order_ids = _seed_orders(engine, f"MIXED_{_run_id()}", ops // 2 + 1)
+    return _run_mixed(engine, order_ids, ops, concurrency, sync_db=False)
+
+
+def bench_mixed_sync_vs_async(ops: int, concurrency: int = 1) -> Result:
+    """
+    同一份資料、同樣的讀寫混合負載，先跑同步 Session 再跑 async engine
+    回傳 async 的結果，同步路徑的 webhook p50 / p99 放在 sync_p50_ms / sync_p99_ms
+    (讀取的 p99 放在 sync_read_p99_ms)
+    """
+    engine = make_sqlite_engine()
+    order_ids = _seed_orders(engine, f"MIXCMP_{_run_id()}", ops // 2 + 1)
+    sync_result = _run_mixed(engine, order_ids, ops, concurrency, sync_db=True)
+    result = _run_mixed(engine, order_ids, ops, concurrency, sync_db=False)
+    result["sync_p50_ms"] = sync_result["p50_ms"]
+    result["sync_p99_ms"] = sync_result["p99_ms"]
+    result["sync_read_p99_ms"] = sync_result["read_p99_ms"]
+    return result
+
+
+def bench_end_to_end(ops: int, concurrency: int = 1, workers: int = 4) -> Result:
+    """
+    API -> InMemoryBroker -> Worker (process_message) -> SQLite，量到 Worker ACK 為止
+    latency = 送出 Webhook 到 Worker ACK 的時間
+    """
+    from apps.worker import main as worker
+    from core.cache import redis_client
+    from core.messaging import PAYMENT_EVENTS_QUEUE
+
+    broker = InMemoryBroker()
+    worker.payment_service = make_payment_service(redis_client, make_sqlite_engine())
+
+    sent_at: Dict[str, float] = {}
+    latencies: List[float] = []
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def on_ack(body: bytes) -> None:
+        finished = time.perf_counter()
+        with lock:
+            latencies.append(finished - sent_at[order_id_of(body)])
+            if len(latencies) >= ops:
+                done.set()
+
+    broker.on_ack = on_ack
+
+    def consume() -> None:
+        channel = broker.channel()
+        while not done.is_set():
+            delivery = broker.get(PAYMENT_EVENTS_QUEUE, timeout=0.1)
+            if delivery is not None:
+                worker.process_message(channel, *delivery)
+
+    threads = [threading.Thread(target=consume, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    started = time.perf_counter()
+    asyncio.run(
+        _drive_api(
+            broker,
+            ops,
+            concurrency,
+            f"E2E_{_run_id()}",
+            lambda oid, t: sent_at.update({oid: t}),
+        )
+    )
+    done.wait(timeout=300)
+    seconds = time.perf_counter() - started
+
+    done.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    worker.payment_service.bank_gateway.close()
+    return summarize(latencies, seconds, concurrency)
+
+
+# name -> (函式, 是否跑多個併發等級)
+SUITES: Dict[str, Any] = {
+    "signature": (bench_signature, False),
+    "dedupe": (bench_dedupe, False),
+    "publish": (bench_publish, True),
+    "service_commit": (bench_service_commit, False),
+    "api": (bench_api, True),
+    "mixed": (bench_mixed, True),
+    "mixed_sync_async": (bench_mixed_sync_vs_async, True),
+    "e2e": (bench_end_to_end, True),
+}
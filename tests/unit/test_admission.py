@@ -0,0 +1,95 @@
+# tests/unit/test_admission.py
+import time
+
+import httpx
+
+from core.admission import AdmissionController, QueueSnapshot, RabbitMQQueueStats
+
+
+class FakeStats:
+    def __init__(self, depth: int, ack_rate: float) -> None:
+        self.depth = depth
+        self.ack_rate = ack_rate
+
+    def fetch(self) -> QueueSnapshot:
+        return QueueSnapshot(self.depth, self.ack_rate, 1, time.monotonic())
+
+    def close(self) -> None:
+        pass
+
+
+def make_controller(depth: int, ack_rate: float = 100.0) -> AdmissionController:
+    controller = AdmissionController(
+        FakeStats(depth, ack_rate),
+        soft_watermark=1000,
+        hard_watermark=2000,
+        priority_merchants=frozenset({"VIP"}),
+        retry_after_min=1,
+        retry_after_max=300,
+        enabled=True,
+    )
+    controller.refresh()
+    return controller
+
+
+def test_admission_sheds_by_watermark_with_retry_after() -> None:
+    """
+    測試積壓低於 soft 全部放行、超過 hard 全部 503，
+    Retry-After = 消化回 soft watermark 要的秒數
+    """
+    assert make_controller(depth=999).check("anyone").admitted
+
+    decision = make_controller(depth=2500, ack_rate=100.0).check("VIP")
+    assert (decision.admitted, decision.status_code) == (False, 503)
+    # (2500 - 1000) / 100 per second
+    assert decision.retry_after == 15
+
+    # 沒有 consumer 在 ack -> 請上游等最久
+    assert make_controller(depth=2500, ack_rate=0.0).check().retry_after == 300
+
+
+def test_admission_prioritizes_merchants_between_watermarks() -> None:
+    """
+    測試 soft ~ hard 之間優先商家照常放行，一般商家依比例被擋 (429)
+    """
+    controller = make_controller(depth=1999)
+    assert all(controller.check("VIP").admitted for _ in range(200))
+
+    decisions = [controller.check("SMALL_SHOP") for _ in range(200)]
+    shed = [d for d in decisions if not d.admitted]
+    assert len(shed) > 150
+    assert {d.status_code for d in shed} == {429}
+
+
+def test_admission_fails_open_without_fresh_stats() -> None:
+    """
+    測試查不到 Queue 狀態 (還沒查到 / 太舊) 時全部放行
+    """
+    controller = make_controller(depth=5000)
+    controller.snapshot = QueueSnapshot(5000, 100.0, 1, time.monotonic() - 60)
+    assert controller.check().admitted
+
+    controller.snapshot = None
+    assert controller.check().admitted
+
+
+def test_queue_stats_reads_management_api() -> None:
+    """
+    測試從 management API 的 Queue 資訊取出深度 / ack rate
+    """
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.raw_path == b"/api/queues/%2F/payment_events"
+        return httpx.Response(
+            200,
+            json={
+                "messages": 1234,
+                "consumers": 3,
+                "message_stats": {"ack_details": {"rate": 56.5}},
+            },
+        )
+
+    stats = RabbitMQQueueStats(transport=httpx.MockTransport(handler))
+    snapshot = stats.fetch()
+    assert (snapshot.depth, snapshot.ack_rate, snapshot.consumers) == (1234, 56.5, 3)
+    stats.close()
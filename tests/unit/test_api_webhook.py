@@ -0,0 +1,297 @@
+# tests/unit/test_api_webhook.py
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from unittest.mock import AsyncMock
+
+import fakeredis
+import httpx
+from opentelemetry.sdk.resources import Resource
+
+from apps.api import main as api
+from core import security
+from core.admission import QueueSnapshot
+from core.health import Readiness
+from core.security import SECRET_KEY
+from core.telemetry import setup_metrics
+from domains.payment.dedupe import WebhookDeduplicator
+from domains.payment.status_cache import AsyncOrderStatusCache
+
+
+class FakePublisher:
+    def __init__(self) -> None:
+        self.published: List[Tuple[bytes, Dict[str, Any]]] = []
+        self.routing_keys: List[Optional[str]] = []
+
+    async def publish(
+        self,
+        body: bytes,
+        headers: Dict[str, Any],
+        routing_key: Optional[str] = None,
+        content_type: str = "",
+    ) -> None:
+        self.published.append((body, headers))
+        self.routing_keys.append(routing_key)
+
+
+def sign(body: bytes) -> str:
+    return hmac.new(SECRET_KEY.encode(), body, hashlib.sha256).hexdigest()
+
+
+def make_client() -> Tuple[httpx.AsyncClient, FakePublisher]:
+    publisher = FakePublisher()
+    api.app.dependency_overrides[api.get_publisher] = lambda: publisher
+    # redis.asyncio 的 client 綁在建立它的 event loop 上，每個測試換一個新的
+    redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    api.deduplicator = WebhookDeduplicator(redis_client)
+    api.status_cache = AsyncOrderStatusCache(redis_client)
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=api.app), base_url="http://api"
+    )
+    return client, publisher
+
+
+async def test_webhook_forwards_signed_bytes_unchanged() -> None:
+    """
+    測試驗簽通過後，原始 bytes 原封不動送進 Queue，重複的請求不再 publish
+    """
+    client, publisher = make_client()
+    body = b'{"order_id": "SIGNED_1",  "amount": 100, "status": "PENDING"}'
+
+    resp = await client.post(
+        "/webhook", content=body, headers={"X-Signature": sign(body)}
+    )
+    assert resp.json() == {"status": "received"}
+    assert publisher.published[0][0] == body
+
+    resp = await client.post(
+        "/webhook", content=body, headers={"X-Signature": sign(body)}
+    )
+    assert resp.json()["status"] == "duplicate"
+    assert len(publisher.published) == 1
+    await client.aclose()
+
+
+async def test_webhook_fails_open_when_dedupe_store_is_down(monkeypatch: Any) -> None:
+    """
+    測試 Redis 出錯時照樣 publish (fail open)；publish 失敗時 release 也出錯，
+    回的還是 publish 的 500，不會被 release 的例外蓋掉
+    """
+    client, publisher = make_client()
+    redis_down = AsyncMock(side_effect=ConnectionError("Redis is down"))
+    monkeypatch.setattr(api.deduplicator, "claim", redis_down)
+    monkeypatch.setattr(api.deduplicator, "release", redis_down)
+    body = b'{"order_id": "REDIS_DOWN", "amount": 100, "status": "PENDING"}'
+
+    resp = await client.post(
+        "/webhook", content=body, headers={"X-Signature": sign(body)}
+    )
+    assert resp.json() == {"status": "received"}
+    assert len(publisher.published) == 1
+
+    monkeypatch.setattr(api.deduplicator, "claim", AsyncMock(return_value=None))
+    monkeypatch.setattr(
+        publisher, "publish", AsyncMock(side_effect=RuntimeError("Broker said no"))
+    )
+    resp = await client.post(
+        "/webhook", content=body, headers={"X-Signature": sign(body)}
+    )
+    assert resp.status_code == 500
+    redis_down.assert_awaited_with("REDIS_DOWN")
+    await client.aclose()
+
+
+async def test_webhook_still_received_when_confirm_fails(monkeypatch: Any) -> None:
+    """
+    測試 Broker 已經收下後標記去重失敗：照樣回 received，
+    不放掉 claim (上游重送會被擋下，不會 publish 兩次)
+    """
+    client, publisher = make_client()
+    monkeypatch.setattr(
+        api.deduplicator,
+        "confirm",
+        AsyncMock(side_effect=ConnectionError("Redis is down")),
+    )
+    release = AsyncMock()
+    monkeypatch.setattr(api.deduplicator, "release", release)
+    body = b'{"order_id": "CONFIRM_DOWN", "amount": 100, "status": "PENDING"}'
+
+    statuses = []
+    for _ in range(2):
+        resp = await client.post(
+            "/webhook", content=body, headers={"X-Signature": sign(body)}
+        )
+        statuses.append(resp.json()["status"])
+    assert statuses == ["received", "duplicate"]
+    assert len(publisher.published) == 1
+    release.assert_not_awaited()
+    await client.aclose()
+
+
+async def test_webhook_rejects_bad_signature_and_invalid_payload() -> None:
+    """
+    測試簽名錯誤回 403、欄位不對回 422，兩種都不會 publish
+    """
+    client, publisher = make_client()
+    body = json.dumps({"order_id": "SIGNED_2", "amount": "lots"}).encode()
+
+    resp = await client.post(
+        "/webhook", content=body, headers={"X-Signature": "0" * 64}
+    )
+    assert resp.status_code == 403
+
+    resp = await client.post(
+        "/webhook", content=body, headers={"X-Signature": sign(body)}
+    )
+    assert resp.status_code == 422
+    assert publisher.published == []
+    await client.aclose()
+
+
+def test_signature_accepts_any_active_key_during_rotation(monkeypatch: Any) -> None:
+    """
+    測試換 key 期間新舊兩把 key 簽的都接受，其他的拒絕
+    """
+    monkeypatch.setattr(security, "SECRET_KEYS", "new_key, old_key")
+    security.signing_keys.cache_clear()
+    body = b'{"order_id": "ROTATE_1"}'
+
+    def signed_with(key: str) -> str:
+        return hmac.new(key.encode(), body, hashlib.sha256).hexdigest()
+
+    try:
+        assert security.is_valid_signature(body, signed_with("new_key"))
+        assert security.is_valid_signature(body, signed_with("old_key"))
+        assert not security.is_valid_signature(body, signed_with("retired_key"))
+    finally:
+        security.signing_keys.cache_clear()
+
+
+async def test_batch_webhook_reports_each_item() -> None:
+    """
+    測試 NDJSON 批次：好的送出 (原始行)、壞的標 invalid、重複的標 duplicate
+    """
+    client, publisher = make_client()
+    good = b'{"order_id": "BATCH_1", "amount": 100, "status": "PENDING"}'
+    body = b"\n".join([good, b'{"order_id": "BATCH_2", "amount": "lots"}', good, b""])
+
+    resp = await client.post(
+        "/webhook/batch",
+        content=body,
+        headers={"X-Signature": sign(body), "Content-Type": "application/x-ndjson"},
+    )
+
+    data = resp.json()
+    assert [r["status"] for r in data["results"]] == [
+        "received",
+        "invalid",
+        "duplicate",
+    ]
+    assert (data["received"], data["duplicates"], data["rejected"]) == (1, 1, 1)
+    assert [message for message, _ in publisher.published] == [good]
+    await client.aclose()
+
+
+async def test_batch_webhook_accepts_json_array_and_checks_signature() -> None:
+    client, publisher = make_client()
+    body = json.dumps(
+        [
+            {"order_id": "ARRAY_1", "amount": 1, "status": "PENDING"},
+            {"order_id": "ARRAY_2", "amount": 2, "status": "PENDING"},
+        ]
+    ).encode()
+
+    resp = await client.post(
+        "/webhook/batch", content=body, headers={"X-Signature": "0" * 64}
+    )
+    assert resp.status_code == 403
+
+    resp = await client.post(
+        "/webhook/batch", content=body, headers={"X-Signature": sign(body)}
+    )
+    assert resp.json()["received"] == 2
+    assert len(publisher.published) == 2
+    await client.aclose()
+
+
+async def test_metrics_endpoint_exposes_webhook_latency() -> None:
+    # 平常在 lifespan 裡初始化 (ASGITransport 不跑 lifespan)
+    setup_metrics(Resource.create({"service.name": "flowpay-api-test"}))
+    client, _ = make_client()
+    body = b'{"order_id": "METRICS_1", "amount": 100, "status": "PENDING"}'
+    await client.post("/webhook", content=body, headers={"X-Signature": sign(body)})
+
+    resp = await client.get("/metrics")
+
+    assert resp.status_code == 200
+    assert "flowpay_webhook_duration" in resp.text
+    await client.aclose()
+
+
+async def test_webhook_sheds_load_when_queue_is_backed_up(monkeypatch: Any) -> None:
+    """
+    測試 Queue 積壓超過 hard watermark 時回 503 + Retry-After，不會 publish
+    """
+    client, publisher = make_client()
+    monkeypatch.setattr(api.admission, "enabled", True)
+    monkeypatch.setattr(
+        api.admission,
+        "snapshot",
+        QueueSnapshot(
+            depth=api.admission.hard_watermark,
+            ack_rate=0.0,
+            consumers=0,
+            taken_at=time.monotonic(),
+        ),
+    )
+    body = b'{"order_id": "SHED_1", "amount": 100, "status": "PENDING"}'
+
+    resp = await client.post(
+        "/webhook", content=body, headers={"X-Signature": sign(body)}
+    )
+
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == str(api.admission.retry_after_max)
+    assert publisher.published == []
+    await client.aclose()
+
+
+async def test_probes_report_liveness_and_warm_up(monkeypatch: Any) -> None:
+    """
+    測試 /healthz 一直是 200；/readyz 要等暖機做完而且 Broker 連線還在才是 200
+    """
+    client, _ = make_client()
+
+    class Publisher:
+        ready = True
+
+    async def warming_up() -> None:
+        await asyncio.sleep(10)
+
+    readiness = Readiness(timeout=0.01)
+    readiness.add("broker", lambda: asyncio.sleep(0))
+    readiness.add("database", warming_up, required=False)
+    monkeypatch.setattr(api.app.state, "readiness", readiness, raising=False)
+    monkeypatch.setattr(api.app.state, "publisher", Publisher(), raising=False)
+
+    assert (await client.get("/healthz")).status_code == 200
+    resp = await client.get("/readyz")
+    assert resp.status_code == 503
+    assert resp.json()["checks"] == {"broker": "pending", "database": "pending"}
+
+    warm_up = asyncio.create_task(readiness.run())
+    await asyncio.sleep(0.05)
+    resp = await client.get("/readyz")
+    assert resp.status_code == 200
+    assert resp.json()["checks"]["broker"] == "ok"
+
+    # Broker 斷線重連中 -> 先不要送流量進來
+    Publisher.ready = False
+    resp = await client.get("/readyz")
+    assert resp.status_code == 503
+    assert resp.json()["checks"]["broker"] == "reconnecting"
+    warm_up.cancel()
+    await client.aclose()
@@ -0,0 +1,134 @@
+# tests/unit/test_callbacks.py
+import asyncio
+from typing import Any, List, Tuple
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+
+from apps.callback import main as callback_app
+from core.config import RETRY_DELAYS_MS
+from core.messaging import RETRY_COUNT_HEADER, retry_queue_name
+from domains.payment.callbacks import (
+    DEFERRED,
+    DELIVERED,
+    FAILED,
+    RETRY,
+    CallbackDispatcher,
+    encode_callback_task,
+)
+
+
+def make_dispatcher(statuses: List[int]) -> Tuple[CallbackDispatcher, List[str]]:
+    calls: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(str(request.url))
+        return httpx.Response(statuses[min(len(calls), len(statuses)) - 1])
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    dispatcher = CallbackDispatcher(client=client, max_attempts=3, backoff_base=0)
+    return dispatcher, calls
+
+
+async def test_dispatcher_retries_server_errors_until_delivered() -> None:
+    """
+    測試商家回 5xx 時會重試，成功後回傳 DELIVERED
+    """
+    dispatcher, calls = make_dispatcher([503, 502, 200])
+
+    outcome = await dispatcher.deliver("http://merchant/cb", {"order_id": "A"})
+
+    assert outcome == DELIVERED
+    assert len(calls) == 3
+    await dispatcher.aclose()
+
+
+async def test_dispatcher_does_not_retry_client_errors() -> None:
+    """
+    測試商家明確拒絕 (4xx) 時不重試，直接回傳 FAILED 讓訊息進 DLQ
+    """
+    dispatcher, calls = make_dispatcher([404])
+
+    outcome = await dispatcher.deliver("http://merchant/cb", {"order_id": "B"})
+
+    assert outcome == FAILED
+    assert len(calls) == 1
+    await dispatcher.aclose()
+
+
+async def test_exhausted_callbacks_go_through_retry_queues_then_dlq(
+    monkeypatch: Any,
+) -> None:
+    """
+    測試 process 內的重試用完時回傳 RETRY，訊息丟進 callback 的延遲重試佇列；
+    重試佇列每一層都走過了才進 DLQ
+    """
+    dispatcher, calls = make_dispatcher([503])
+    assert await dispatcher.deliver("http://merchant/cb", {"order_id": "C"}) == RETRY
+    assert len(calls) == 3
+    await dispatcher.aclose()
+
+    monkeypatch.setattr(
+        callback_app,
+        "dispatcher",
+        MagicMock(deliver=AsyncMock(return_value=RETRY)),
+        raising=False,
+    )
+    body = encode_callback_task("http://merchant/cb", "C", "SUCCESS")
+    channel = MagicMock()
+    method = MagicMock(delivery_tag=7)
+    properties = MagicMock(headers={}, content_type="application/json")
+    await callback_app.handle_callback(
+        channel, method, properties, body, "payment_callbacks"
+    )
+
+    retry = channel.basic_publish.call_args.kwargs
+    assert retry["routing_key"] == retry_queue_name(
+        "payment_callbacks", RETRY_DELAYS_MS[0]
+    )
+    assert retry["properties"].headers == {RETRY_COUNT_HEADER: 1}
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+
+    channel = MagicMock()
+    properties.headers = {RETRY_COUNT_HEADER: len(RETRY_DELAYS_MS)}
+    await callback_app.handle_callback(
+        channel, method, properties, body, "payment_callbacks"
+    )
+    channel.basic_publish.assert_not_called()
+    channel.basic_nack.assert_called_once_with(delivery_tag=7, requeue=False)
+
+
+async def test_dispatcher_limits_concurrency_and_backlog_per_host() -> None:
+    """
+    測試同一個 host 同時最多 per_host_concurrency 個請求，
+    排隊超過 backlog 的先 DEFERRED，其他 host 不受影響
+    """
+    active: List[str] = []
+    peak = {"merchant": 0, "other": 0}
+    release = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        active.append(host)
+        peak[host] = max(peak[host], active.count(host))
+        if host == "merchant":
+            await release.wait()
+        active.remove(host)
+        return httpx.Response(200)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    dispatcher = CallbackDispatcher(
+        client=client, per_host_concurrency=1, per_host_backlog=2, defer_seconds=0
+    )
+    slow = [
+        asyncio.ensure_future(dispatcher.deliver("http://merchant/cb", {"n": n}))
+        for n in range(2)
+    ]
+    await asyncio.sleep(0.01)
+
+    assert await dispatcher.deliver("http://merchant/cb", {"n": 2}) == DEFERRED
+    assert await dispatcher.deliver("http://other/cb", {"n": 3}) == DELIVERED
+    release.set()
+    assert await asyncio.gather(*slow) == [DELIVERED, DELIVERED]
+    assert peak == {"merchant": 1, "other": 1}
+    await dispatcher.aclose()
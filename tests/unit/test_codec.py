@@ -0,0 +1,46 @@
+# tests/unit/test_codec.py
+import pytest
+
+from domains.payment.codec import (
+    JSON_CONTENT_TYPE,
+    MSGPACK_CONTENT_TYPE,
+    SCHEMA_VERSION_HEADER,
+    MessageDecodeError,
+    decode_payment,
+    encode_payment,
+    message_headers,
+)
+from domains.payment.schemas import WebhookPayload
+
+PAYLOAD = WebhookPayload(order_id="CODEC_1", amount=100, status="PENDING")
+
+
+def test_json_round_trip_reuses_verified_bytes() -> None:
+    """
+    測試 JSON 格式直接沿用原始 bytes，解回來的欄位一致
+    """
+    raw = b'{"order_id":"CODEC_1","amount":100,"status":"PENDING"}'
+
+    assert encode_payment(PAYLOAD, raw_json=raw) is raw
+    assert decode_payment(encode_payment(PAYLOAD), None, message_headers()) == PAYLOAD
+
+
+def test_decode_rejects_bad_fields_and_unknown_versions() -> None:
+    """
+    測試缺欄位 / 型別錯 / 不認得的版本都會拋 MessageDecodeError (進 DLQ)
+    """
+    with pytest.raises(MessageDecodeError):
+        decode_payment(b'{"order_id": "CODEC_2"}', JSON_CONTENT_TYPE)
+    with pytest.raises(MessageDecodeError):
+        decode_payment(b"not json")
+    with pytest.raises(MessageDecodeError, match="version"):
+        decode_payment(encode_payment(PAYLOAD), None, {SCHEMA_VERSION_HEADER: 99})
+    with pytest.raises(MessageDecodeError, match="content type"):
+        decode_payment(encode_payment(PAYLOAD), "text/plain")
+
+
+def test_msgpack_round_trip() -> None:
+    pytest.importorskip("msgpack")
+    body = encode_payment(PAYLOAD, MSGPACK_CONTENT_TYPE)
+
+    assert decode_payment(body, MSGPACK_CONTENT_TYPE) == PAYLOAD
@@ -0,0 +1,63 @@
+# tests/unit/test_dedupe.py
+import fakeredis
+
+from domains.payment.dedupe import WebhookDeduplicator, webhook_seen_key
+from domains.payment.status_cache import PENDING_OR_NOT_FOUND, OrderStatusCache
+
+
+async def test_duplicate_webhook_returns_known_status_without_claiming() -> None:
+    """
+    測試第一個請求搶到 key，之後的重複請求直接拿到已知狀態
+    """
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    first = WebhookDeduplicator(client)
+    other_process = WebhookDeduplicator(client)
+
+    assert await first.claim("ORDER_1") is None
+    # 還在 publish 中 -> 重複請求看到的是「排隊中」
+    assert await other_process.claim("ORDER_1") == PENDING_OR_NOT_FOUND
+
+    await first.confirm("ORDER_1")
+    # Worker 那一側 (同步 client) 寫入狀態
+    worker_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    OrderStatusCache(worker_client).set("ORDER_1", "SUCCESS")
+
+    assert await other_process.claim("ORDER_1") == "SUCCESS"
+    # 已確認送出的 order_id 會記在本地 LRU
+    assert "ORDER_1" in other_process._recent
+
+
+async def test_release_lets_the_retry_through() -> None:
+    """
+    測試 publish 失敗 release 之後，上游重送可以重新進來
+    """
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    dedupe = WebhookDeduplicator(client, local_size=1)
+
+    assert await dedupe.claim("ORDER_1") is None
+    await dedupe.release("ORDER_1")
+    assert await dedupe.claim("ORDER_1") is None
+
+    # LRU 超過大小會把最舊的踢掉
+    await dedupe.confirm("ORDER_1")
+    assert await dedupe.claim("ORDER_2") is None
+    await dedupe.confirm("ORDER_2")
+    assert list(dedupe._recent) == ["ORDER_2"]
+
+
+async def test_pending_claim_expires_quickly_until_confirmed() -> None:
+    """
+    測試搶到的 key 只保留 pending TTL (publish 途中掛掉也很快能重送)，
+    confirm 之後才延長成完整的 TTL
+    """
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    dedupe = WebhookDeduplicator(client, ttl_seconds=86400, pending_ttl_seconds=30)
+
+    assert await dedupe.claim_many(["ORDER_1", "ORDER_2"]) == [None, None]
+    assert 0 < await client.ttl(webhook_seen_key("ORDER_1")) <= 30
+
+    await dedupe.confirm("ORDER_1")
+    await dedupe.confirm_many(["ORDER_2"])
+    for order_id in ("ORDER_1", "ORDER_2"):
+        assert await client.ttl(webhook_seen_key(order_id)) > 30
@@ -0,0 +1,68 @@
+# tests/unit/test_gateway.py
+import httpx
+import pytest
+
+from apps.bank_sim import main as bank_sim
+from domains.payment.gateway import (
+    BankDeclinedError,
+    BankGatewayClient,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+
+def make_gateway(**sim_config: float) -> BankGatewayClient:
+    """用 ASGITransport 直接打模擬銀行，不需要真的開 port"""
+    bank_sim.config = bank_sim.SimulatorConfig(
+        latency_ms=0, error_rate=0, funds_limit=1000
+    ).model_copy(update=sim_config)
+    return BankGatewayClient(
+        base_url="http://bank",
+        timeout=0.5,
+        breaker=CircuitBreaker(failure_threshold=2, recovery_timeout=60),
+        transport=httpx.ASGITransport(app=bank_sim.app),
+    )
+
+
+async def test_gateway_maps_bank_responses_to_errors() -> None:
+    """
+    測試成功 / 餘額不足 / 金額錯誤 各自對應到正確的結果
+    """
+    gateway = make_gateway()
+
+    await gateway.charge("ORDER_OK", 100)
+    with pytest.raises(BankDeclinedError, match="Insufficient funds"):
+        await gateway.charge("ORDER_POOR", 5000)
+    with pytest.raises(ValueError):
+        await gateway.charge("ORDER_BAD", -1)
+
+    # 業務錯誤不代表銀行不健康
+    assert gateway.breaker.state == CircuitBreaker.CLOSED
+    await gateway.aclose()
+
+
+async def test_circuit_opens_and_fails_fast_when_bank_is_down() -> None:
+    """
+    測試銀行連續出錯後斷路，之後的呼叫直接失敗不再打銀行
+    """
+    gateway = make_gateway(error_rate=1.0)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await gateway.charge("ORDER_DOWN", 100)
+
+    assert gateway.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        await gateway.charge("ORDER_DOWN", 100)
+    await gateway.aclose()
+
+
+async def test_deadline_turns_hung_bank_into_connection_error() -> None:
+    """
+    測試銀行卡住不回應時，client 的 deadline 會讓呼叫失敗而不是一直等
+    """
+    gateway = make_gateway(hang_rate=1.0, hang_seconds=5)
+
+    with pytest.raises(ConnectionError, match="Timeout"):
+        await gateway.charge("ORDER_HANG", 100)
+    await gateway.aclose()
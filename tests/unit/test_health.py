@@ -0,0 +1,77 @@
+# tests/unit/test_health.py
+import asyncio
+import os
+from pathlib import Path
+from typing import List
+
+from core.backoff import backoff_delay
+from core.health import HealthFile, Readiness
+
+
+def test_backoff_delay_doubles_up_to_the_cap_within_the_jitter() -> None:
+    """
+    測試指數退避有上限，抖動只會往下抖 (jitter=0 時是固定值)
+    """
+    assert [backoff_delay(n, 1.0, 30.0, jitter=0) for n in range(6)] == [
+        1.0,
+        2.0,
+        4.0,
+        8.0,
+        16.0,
+        30.0,
+    ]
+    for _ in range(100):
+        assert 2.0 <= backoff_delay(2, 1.0, 30.0) <= 4.0
+        assert 0.0 <= backoff_delay(2, 1.0, 30.0, jitter=1.0) <= 4.0
+
+
+async def test_readiness_retries_failed_steps_until_they_succeed() -> None:
+    """
+    測試暖機失敗會退避重試；required 的都好了才算 ready，optional 的只回報狀態
+    """
+    attempts: List[int] = []
+
+    async def flaky_broker() -> None:
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("refused")
+
+    async def stuck_database() -> None:
+        await asyncio.sleep(10)
+
+    readiness = Readiness(timeout=0.05, backoff=0.01, max_backoff=0.02)
+    readiness.add("broker", flaky_broker)
+    readiness.add("database", stuck_database, required=False)
+    assert not readiness.ready
+
+    warm_up = asyncio.create_task(readiness.run())
+    for _ in range(100):
+        if readiness.ready and readiness.status()["database"] != "pending":
+            break
+        await asyncio.sleep(0.01)
+
+    assert readiness.ready
+    assert len(attempts) == 3
+    status = readiness.status()
+    assert status["broker"] == "ok"
+    assert status["database"].startswith("TimeoutError")
+    warm_up.cancel()
+
+
+def test_health_file_beats_at_most_once_per_interval(tmp_path: Path) -> None:
+    """
+    測試健康檔第一次 beat 就建立，之後節流更新 mtime，clear 會刪掉
+    """
+    path = tmp_path / "worker.health"
+    health = HealthFile(str(path), interval=60)
+
+    health.beat()
+    assert path.exists()
+    os.utime(path, (0, 0))
+    health.beat()
+    assert path.stat().st_mtime == 0
+
+    health.clear()
+    assert not path.exists()
+    # 關掉 (空路徑) 時什麼都不做
+    HealthFile("").beat()
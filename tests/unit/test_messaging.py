@@ -0,0 +1,152 @@
+# tests/unit/test_messaging.py
+import asyncio
+from typing import Any, List
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pika.exceptions
+import pytest
+
+from core.async_messaging import AsyncPublisher, declare_topology
+from core.messaging import (
+    BrokerUnavailable,
+    RabbitMQConnector,
+    ThreadSafeChannel,
+)
+
+
+def test_thread_safe_channel_schedules_ack_on_connection_thread() -> None:
+    """
+    測試 Thread Pool 裡的 ack 不會直接碰 channel，而是排回 I/O thread
+    """
+    mock_connection = MagicMock()
+    mock_channel = MagicMock()
+
+    safe_channel = ThreadSafeChannel(mock_connection, mock_channel)
+    safe_channel.basic_ack(delivery_tag=7)
+
+    mock_channel.basic_ack.assert_not_called()
+    callback = mock_connection.add_callback_threadsafe.call_args.args[0]
+
+    # I/O thread 執行排進來的 callback 時才真的 ack
+    callback()
+    mock_channel.basic_ack.assert_called_once_with(delivery_tag=7, multiple=False)
+
+
+async def test_async_publisher_round_robins_channels_and_declares_topology() -> None:
+    """
+    測試 aio-pika 版照 RabbitMQConnector 的拓撲宣告一次，publish 輪流用 channel
+    """
+    channels = [AsyncMock(), AsyncMock()]
+    queue = AsyncMock()
+    channels[0].declare_queue.return_value = queue
+
+    class InMemoryPublisher(AsyncPublisher):
+        async def _open(self) -> List[Any]:
+            await declare_topology(
+                channels[0], RabbitMQConnector(retry_delays_ms=[1000], partitions=1)
+            )
+            return channels
+
+    publisher = InMemoryPublisher(channels=2)
+    await publisher.start()
+    for body in (b"1", b"2", b"3"):
+        await publisher.publish(body, {"x-test": "1"}, routing_key="payment_events")
+
+    channels[0].declare_exchange.assert_awaited_once()
+    declared = [c.args[0] for c in channels[0].declare_queue.await_args_list]
+    assert declared == [
+        "payment_events.dlq",
+        "payment_events",
+        "payment_events.retry.1000ms",
+    ]
+    queue.bind.assert_awaited_once_with("dlx_payment", routing_key="dead_letter")
+    assert channels[0].default_exchange.publish.await_count == 2
+    message = channels[1].default_exchange.publish.await_args.args[0]
+    assert (message.body, message.headers) == (b"2", {"x-test": "1"})
+    await publisher.close()
+
+
+async def test_async_publisher_coalesces_concurrent_messages_into_one_batch() -> None:
+    """
+    測試併發送進來的訊息會被合併成同一個批次 (同一個 channel 一起等 confirm)，
+    批次滿了不用等 linger 就 flush
+    """
+    channels = [AsyncMock(), AsyncMock()]
+
+    class InMemoryPublisher(AsyncPublisher):
+        async def _open(self) -> List[Any]:
+            return channels
+
+    # linger 很長：只有批次滿了才會 flush
+    publisher = InMemoryPublisher(channels=2, batch_size=3, linger_ms=60_000)
+    await publisher.start()
+    await asyncio.wait_for(
+        asyncio.gather(*(publisher.publish(body) for body in (b"1", b"2", b"3"))),
+        timeout=5,
+    )
+
+    assert channels[0].default_exchange.publish.await_count == 3
+    channels[1].default_exchange.publish.assert_not_awaited()
+
+    # 不滿一批的在 close 時也會送出去
+    pending = asyncio.ensure_future(publisher.publish(b"4"))
+    await asyncio.sleep(0)
+    await publisher.close()
+    await pending
+    assert channels[1].default_exchange.publish.await_count == 1
+
+
+async def test_async_publisher_fails_every_future_when_flush_fails() -> None:
+    """
+    測試 flush 出錯 (channel 斷掉) 時，整批的呼叫者都會收到例外 (API 不會誤回 200)
+    """
+    channel = MagicMock()
+    channel.close = AsyncMock()
+    type(channel).default_exchange = property(
+        MagicMock(side_effect=RuntimeError("Channel closed"))
+    )
+
+    class InMemoryPublisher(AsyncPublisher):
+        async def _open(self) -> List[Any]:
+            return [channel]
+
+    publisher = InMemoryPublisher(channels=1, batch_size=10, linger_ms=1)
+    await publisher.start()
+    results = await asyncio.gather(
+        publisher.publish(b"1"), publisher.publish(b"2"), return_exceptions=True
+    )
+    await publisher.close()
+
+    assert [str(result) for result in results] == ["Channel closed"] * 2
+    assert publisher._in_flight == 0
+
+
+def test_connect_backs_off_and_raises_instead_of_exiting() -> None:
+    """
+    測試連不上時指數退避重試，次數用完拋 BrokerUnavailable (不會 sys.exit)；
+    帳密錯誤不重試
+    """
+    connector = RabbitMQConnector()
+    refused = pika.exceptions.AMQPConnectionError("refused")
+    with (
+        patch("core.messaging.pika.BlockingConnection", side_effect=refused) as conn,
+        patch("core.messaging.time.sleep") as sleep,
+    ):
+        with pytest.raises(BrokerUnavailable):
+            connector.connect(retries=4, backoff=1.0)
+    assert conn.call_count == 4
+    delays = [c.args[0] for c in sleep.call_args_list]
+    # 最後一次失敗不用等；第 n 次等 2^n / 2 ~ 2^n 秒
+    assert len(delays) == 3
+    for attempt, delay in enumerate(delays):
+        assert 2**attempt / 2 <= delay <= 2**attempt
+
+    denied = pika.exceptions.ProbableAuthenticationError("denied")
+    with (
+        patch("core.messaging.pika.BlockingConnection", side_effect=denied) as conn,
+        patch("core.messaging.time.sleep") as sleep,
+    ):
+        with pytest.raises(BrokerUnavailable):
+            connector.connect(retries=4)
+    assert conn.call_count == 1
+    sleep.assert_not_called()
@@ -0,0 +1,119 @@
+# tests/unit/test_partitioning.py
+from datetime import date, datetime, timezone
+from typing import Any, List
+from unittest.mock import MagicMock
+
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine
+
+from domains.payment import partitioning
+from domains.payment.model import PaymentEvent
+from domains.payment.partitioning import (
+    PartitionInfo,
+    add_months,
+    archive_partition,
+    is_archived,
+    partition_bounds,
+    partition_month,
+    partition_name,
+    partitions_to_archive,
+)
+
+
+def test_partition_names_round_trip_across_years() -> None:
+    """
+    測試 partition 名稱 <-> 月份互轉，跨年時也正確
+    """
+    assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+
+    assert partition_name(date(2026, 2, 1)) == "payment_events_202602"
+    assert partition_month("payment_events_202602") == date(2026, 2, 1)
+    # 改名備份的舊表 / 其他 table 不算 partition
+    assert partition_month("payment_events_legacy") is None
+    assert partition_month("payment_events") is None
+
+    assert partition_bounds(date(2026, 12, 1)) == (
+        datetime(2026, 12, 1, tzinfo=timezone.utc),
+        datetime(2027, 1, 1, tzinfo=timezone.utc),
+    )
+
+
+def test_only_months_past_retention_are_archived() -> None:
+    """
+    測試只歸檔整個月都超過保留期限的 partition，已經 detach 的也會接著處理
+    """
+    partitions = [
+        PartitionInfo(partition_name(month), month, attached=month.year > 2025)
+        for month in (date(2025, 8, 1), date(2025, 9, 1), date(2025, 10, 1))
+    ] + [PartitionInfo("payment_events_202610", date(2026, 10, 1), True)]
+
+    archived = partitions_to_archive(partitions, date(2026, 10, 17), 12)
+    # 保留 2025-10 ~ 2026-10
+    assert [p.name for p in archived] == [
+        "payment_events_202508",
+        "payment_events_202509",
+    ]
+    assert not any(p.attached for p in archived)
+    assert partitions_to_archive(partitions, date(2026, 10, 17), 24) == []
+
+
+def test_orm_updates_carry_the_partition_key() -> None:
+    """
+    測試 ORM 的 identity 是 (id, created_at)，UPDATE 會帶 created_at 只碰一個 partition
+    """
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    statements: List[str] = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    with Session(engine) as session:
+        payment = PaymentEvent(order_id="ORDER_1", amount=100, status="PENDING")
+        session.add(payment)
+        session.commit()
+        payment.status = "SUCCESS"
+        session.add(payment)
+        session.commit()
+
+    update = next(s for s in statements if s.startswith("UPDATE"))
+    assert "payment_events.created_at = ?" in update
+
+
+def test_archive_finalizes_pending_detach_and_never_exports_twice(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """
+    測試上次 DETACH CONCURRENTLY 被中斷的用 FINALIZE 做完；
+    --keep-table 留下來的 table 已經歸檔過，重跑不會再匯出一次
+    """
+    engine = MagicMock()
+    statements: List[str] = []
+    conn = engine.connect.return_value.execution_options.return_value.__enter__()
+    conn.execute.side_effect = lambda stmt: statements.append(str(stmt))
+    exports: List[str] = []
+
+    def fake_export(engine: Any, partition: PartitionInfo, path: str) -> int:
+        exports.append(partition.name)
+        with open(path, "wb") as f:
+            f.write(b"id\n")
+        return 0
+
+    monkeypatch.setattr(partitioning, "_export", fake_export)
+    monkeypatch.setattr(partitioning, "_delete_order_keys", lambda *_: 3)
+
+    month = date(2025, 8, 1)
+    pending = PartitionInfo(partition_name(month), month, True, detach_pending=True)
+    archive_partition(engine, pending, str(tmp_path), keep_table=True)
+    assert statements == [
+        'ALTER TABLE payment_events DETACH PARTITION "payment_events_202508" FINALIZE'
+    ]
+
+    kept = PartitionInfo(partition_name(month), month, attached=False)
+    assert is_archived(kept, str(tmp_path))
+    result = archive_partition(engine, kept, str(tmp_path))
+    assert exports == ["payment_events_202508"]
+    assert result.rows == 0
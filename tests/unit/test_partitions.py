@@ -0,0 +1,93 @@
+# tests/unit/test_partitions.py
+from collections import Counter
+from typing import Any, Dict, List
+
+import fakeredis
+
+from apps.worker.partitions import PartitionLeases, partition_lease_key
+from core.messaging import (
+    PAYMENT_EVENTS_QUEUE,
+    RabbitMQConnector,
+    partition_queue_name,
+    payment_queue_names,
+    payment_routing_key,
+)
+
+
+class RecordingChannel:
+    def __init__(self) -> None:
+        self.queues: Dict[str, Dict[str, Any]] = {}
+        self.bindings: List[str] = []
+
+    def exchange_declare(self, **kwargs: Any) -> None:
+        pass
+
+    def queue_declare(
+        self, queue: str, durable: bool, arguments: Any = None, passive: bool = False
+    ) -> None:
+        self.queues[queue] = arguments or {}
+
+    def queue_bind(self, exchange: str, queue: str, routing_key: str) -> None:
+        self.bindings.append(routing_key)
+
+
+def test_same_order_always_routes_to_the_same_partition() -> None:
+    """
+    測試同一個 order_id 永遠進同一個 partition，不同訂單會分散開來
+    """
+    assert payment_routing_key("ORDER_1", partitions=1) == PAYMENT_EVENTS_QUEUE
+
+    keys = [payment_routing_key(f"ORDER_{i}", partitions=8) for i in range(800)]
+    assert keys == [payment_routing_key(f"ORDER_{i}", partitions=8) for i in range(800)]
+    assert set(keys) == set(payment_queue_names(8))
+    # crc32 分得夠平均，沒有哪個 partition 特別多
+    assert max(Counter(keys).values()) < 2 * 800 / 8
+
+
+def test_partitioned_topology_gives_each_partition_its_own_dlq() -> None:
+    """
+    測試每個 partition 都有自己的 DLQ / 重試佇列，並且只允許一個 active consumer
+    """
+    channel = RecordingChannel()
+    RabbitMQConnector(partitions=3, retry_delays_ms=[1000]).declare_topology(channel)
+
+    for queue_name in payment_queue_names(3):
+        arguments = channel.queues[queue_name]
+        assert arguments["x-dead-letter-routing-key"] == f"{queue_name}.dlq"
+        assert arguments["x-single-active-consumer"] is True
+        assert f"{queue_name}.dlq" in channel.queues
+        # 重試到期後回到自己的 partition
+        retry = channel.queues[f"{queue_name}.retry.1000ms"]
+        assert retry["x-dead-letter-routing-key"] == queue_name
+    # 沒有切的時候維持原本的 payment_events 設定 (已存在的 Queue 參數不能改)
+    assert PAYMENT_EVENTS_QUEUE not in channel.queues
+    single = RecordingChannel()
+    RabbitMQConnector(partitions=1, retry_delays_ms=[]).declare_topology(single)
+    assert single.queues[PAYMENT_EVENTS_QUEUE] == {
+        "x-dead-letter-exchange": "dlx_payment",
+        "x-dead-letter-routing-key": "dead_letter",
+    }
+
+
+def test_workers_split_partitions_and_take_over_expired_leases() -> None:
+    """
+    測試兩個 worker 平分 partition；其中一個離開後，另一個接手全部
+    """
+    client = fakeredis.FakeRedis(decode_responses=True)
+    queue_names = payment_queue_names(4)
+    first = PartitionLeases(client, queue_names, worker_id="worker-a")
+    second = PartitionLeases(client, queue_names, worker_id="worker-b")
+
+    # a 先啟動時拿走全部；b 加入後 a 讓出一半 (停掉 consumer 才 release)
+    assert first.rebalance() == set(queue_names)
+    assert second.rebalance() == set()
+    kept = first.rebalance()
+    assert len(kept) == 2
+    for queue_name in first.owned - kept:
+        first.release(queue_name)
+    assert second.rebalance() == set(queue_names) - kept
+
+    # a 關機：lease 跟心跳都拿掉，b 接手
+    first.release_all()
+    assert second.rebalance() == set(queue_names)
+    assert client.get(partition_lease_key(partition_queue_name(0))) == "worker-b"
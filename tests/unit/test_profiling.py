@@ -0,0 +1,56 @@
+# tests/unit/test_profiling.py
+import json
+import logging
+import time
+from pathlib import Path
+
+import pytest
+
+from core import profiling
+
+
+def test_slow_message_logs_stage_breakdown(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    """
+    測試超過門檻的訊息會印出各階段耗時 (同一階段多次會加總)
+    """
+    monkeypatch.setattr(profiling, "SLOW_MESSAGE_THRESHOLD_MS", 0)
+
+    with caplog.at_level(logging.WARNING, logger="core.profiling"):
+        with profiling.profile_message("ORDER_SLOW") as profile:
+            with profiling.stage("db.write"):
+                time.sleep(0.002)
+            with profiling.stage("db.write"):
+                pass
+            with profiling.stage("bank"):
+                pass
+
+    assert set(profile.stages) == {"db.write", "bank"}
+    assert profile.stages["db.write"] >= 2
+    breakdown = json.loads(caplog.records[-1].getMessage().split(": ", 1)[1])
+    assert breakdown["label"] == "ORDER_SLOW"
+    assert set(breakdown["stages_ms"]) == {"db.write", "bank"}
+    assert profiling.stage_stats.snapshot()["bank"]["count"] >= 1
+
+
+def test_sampled_message_writes_collapsed_stack_profile(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    """
+    測試被抽中的訊息會輸出 collapsed stack 格式的 profile
+    """
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "sampler", profiling.StackSampler(interval_ms=1))
+
+    with profiling.profile_message("ORDER/1"):
+        deadline = time.monotonic() + 0.05
+        while time.monotonic() < deadline:
+            pass
+
+    (profile_file,) = tmp_path.iterdir()
+    assert profile_file.name.endswith("-ORDER_1.folded")
+    stack, count = profile_file.read_text().splitlines()[0].rsplit(" ", 1)
+    assert "test_profiling.py:test_sampled_message" in stack
+    assert int(count) > 0
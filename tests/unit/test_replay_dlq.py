@@ -0,0 +1,254 @@
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from unittest.mock import MagicMock
+
+import pika
+
+from apps.cli import replay_dlq
+from apps.cli.replay_dlq import (
+    ReplayFilter,
+    error_reason,
+    parse_args,
+    parse_duration,
+    replay_routing_key,
+)
+from core.messaging import payment_routing_key
+
+
+def _message(
+    order_id: str, reason: str, died_minutes_ago: int
+) -> Tuple[bytes, Dict[str, Any]]:
+    died_at = datetime.now(timezone.utc) - timedelta(minutes=died_minutes_ago)
+    headers = {
+        "x-first-death-reason": reason,
+        "x-death": [{"time": died_at, "reason": reason, "count": 1}],
+        "x-last-error": "ConnectionError: Bank API Timeout",
+    }
+    body = {"order_id": order_id, "amount": 100, "status": "PENDING"}
+    return json.dumps(body).encode(), headers
+
+
+def test_replay_filter_matches_pattern_reason_and_age() -> None:
+    flt = ReplayFilter(
+        order_pattern="FLASH_*",
+        reason="rejected",
+        older_than=parse_duration("10m"),
+        newer_than=parse_duration("1h"),
+    )
+
+    assert flt.matches(*_message("FLASH_1", "rejected", 30))
+    assert not flt.matches(*_message("ORDER_1", "rejected", 30))
+    assert not flt.matches(*_message("FLASH_2", "expired", 30))
+    assert not flt.matches(*_message("FLASH_3", "rejected", 5))
+    assert not flt.matches(*_message("FLASH_4", "rejected", 120))
+
+
+def test_error_reason_groups_by_death_reason_and_last_error() -> None:
+    _, headers = _message("FLASH_1", "rejected", 1)
+    assert error_reason(headers) == "rejected / ConnectionError: Bank API Timeout"
+    assert error_reason({}) == "unknown"
+
+
+def test_reason_comes_from_the_final_dead_lettering_after_retries() -> None:
+    """
+    測試走過重試佇列的訊息：x-first-death-reason 是重試佇列到期的 expired，
+    分組 / --reason 要看送進 DLQ 那一次 (主 Queue 的 rejected) 跟 x-last-error
+    """
+    now = datetime.now(timezone.utc)
+    headers = {
+        "x-first-death-reason": "expired",
+        "x-first-death-queue": "payment_events.retry.1000ms",
+        # 最新的在最前面
+        "x-death": [
+            {"queue": "payment_events", "reason": "rejected", "count": 1, "time": now},
+            {
+                "queue": "payment_events.retry.1000ms",
+                "reason": "expired",
+                "count": 3,
+                "time": now - timedelta(minutes=1),
+            },
+        ],
+        "x-last-error": "ConnectionError('Bank API Timeout')",
+    }
+    body = json.dumps({"order_id": "RETRIED_1", "amount": 100}).encode()
+
+    assert error_reason(headers).startswith("rejected / ConnectionError")
+    assert ReplayFilter(reason="rejected").matches(body, headers)
+    assert ReplayFilter(reason="Bank API Timeout").matches(body, headers)
+    assert not ReplayFilter(reason="expired").matches(body, headers)
+
+
+def test_replay_routes_by_order_id_like_the_api() -> None:
+    body, headers = _message("FLASH_1", "rejected", 5)
+    properties = pika.BasicProperties(headers=headers, content_type="application/json")
+
+    routing_key = replay_routing_key(body, properties, "payment_events.p3.dlq")
+    assert routing_key == payment_routing_key("FLASH_1")
+
+    # 解析不出 order_id 的回到原本的 partition
+    assert (
+        replay_routing_key(b"not json", properties, "payment_events.p3.dlq")
+        == "payment_events.p3"
+    )
+
+
+class FakeDLQChannel:
+    """
+    BlockingChannel 的替身：DLQ 裡放好訊息，
+    等 confirm (process_data_events) 時 Broker 一次 ack 到目前最後一筆
+    """
+
+    def __init__(
+        self,
+        messages: List[Tuple[bytes, Dict[str, Any]]],
+        fail_on_publish: int = 0,
+    ) -> None:
+        self.messages = messages
+        self.fail_on_publish = fail_on_publish
+        self.published: List[Tuple[str, bytes]] = []
+        self.acks: List[Tuple[int, bool]] = []
+        self.prefetch: List[int] = []
+        self.confirm_waits = 0
+        self._on_confirm: Optional[Callable[[Any], None]] = None
+        self._impl = MagicMock()
+        self._impl.confirm_delivery.side_effect = self._confirm_delivery
+        self.connection = MagicMock()
+        self.connection.process_data_events.side_effect = self._process_data_events
+
+    def _confirm_delivery(
+        self, ack_nack_callback: Callable[[Any], None], callback: Callable[[Any], None]
+    ) -> None:
+        self._on_confirm = ack_nack_callback
+        callback(None)
+
+    def _process_data_events(self, time_limit: Optional[float] = None) -> None:
+        assert self._on_confirm is not None
+        self.confirm_waits += 1
+        ack = pika.spec.Basic.Ack(delivery_tag=len(self.published), multiple=True)
+        self._on_confirm(SimpleNamespace(method=ack))
+
+    def queue_declare(self, queue: str, durable: bool, passive: bool) -> Any:
+        return SimpleNamespace(method=SimpleNamespace(message_count=len(self.messages)))
+
+    def basic_qos(self, prefetch_count: int) -> None:
+        self.prefetch.append(prefetch_count)
+
+    def consume(self, queue: str, inactivity_timeout: float) -> Iterator[Any]:
+        for tag, (body, headers) in enumerate(self.messages, start=1):
+            properties = pika.BasicProperties(
+                headers=headers, content_type="application/json"
+            )
+            yield SimpleNamespace(delivery_tag=tag), properties, body
+        yield None, None, None
+
+    def basic_publish(
+        self, exchange: str, routing_key: str, body: bytes, properties: Any
+    ) -> None:
+        if len(self.published) + 1 == self.fail_on_publish:
+            raise ConnectionError("Connection lost")
+        self.published.append((routing_key, body))
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False) -> None:
+        self.acks.append((delivery_tag, multiple))
+
+    def cancel(self) -> None:
+        return None
+
+
+def _run_replay(channel: FakeDLQChannel, monkeypatch: Any, *argv: str) -> None:
+    connector = MagicMock(queue_names=["payment_events"])
+    connector.connect.return_value = (MagicMock(), channel)
+    monkeypatch.setattr(replay_dlq, "RabbitMQConnector", lambda: connector)
+    replay_dlq.replay(parse_args(list(argv)))
+
+
+def test_replay_waits_for_confirms_once_per_batch_then_multi_acks(
+    monkeypatch: Any,
+) -> None:
+    """
+    測試一批 publish 完只等一次 confirm，再用 multiple=True ACK 到最後一筆；
+    不符合條件的移回 DLQ 尾端
+    """
+    channel = FakeDLQChannel(
+        [
+            _message("FLASH_1", "rejected", 5),
+            _message("ORDER_1", "rejected", 5),
+            _message("FLASH_2", "rejected", 5),
+        ]
+    )
+    _run_replay(channel, monkeypatch, "--batch-size", "2", "--order-pattern", "FLASH_*")
+
+    assert [key for key, _ in channel.published] == [
+        payment_routing_key("FLASH_1"),
+        "payment_events.dlq",
+        payment_routing_key("FLASH_2"),
+    ]
+    assert channel.confirm_waits == 2
+    assert channel.acks == [(2, True), (3, True)]
+
+
+def test_replay_resumes_from_checkpoint_with_the_original_filter(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """
+    測試中斷後續跑：已經 ACK 的批次記在 checkpoint，沒 ACK 的回到 DLQ；
+    續跑時沿用第一次的過濾條件，跑完刪掉 checkpoint
+    """
+    checkpoint = tmp_path / "replay.json"
+    messages = [
+        _message("FLASH_1", "rejected", 5),
+        _message("ORDER_1", "rejected", 5),
+        _message("FLASH_2", "rejected", 5),
+        _message("ORDER_2", "rejected", 5),
+    ]
+    # 第三筆 publish 時斷線：第一批 (2 筆) 已經 confirm + ACK
+    first = FakeDLQChannel(messages, fail_on_publish=3)
+    _run_replay(
+        first,
+        monkeypatch,
+        *("--batch-size", "2", "--order-pattern", "FLASH_*"),
+        *("--checkpoint", str(checkpoint)),
+    )
+    state = json.loads(checkpoint.read_text())
+    assert (state["scanned"], state["replayed"], state["skipped"]) == (2, 1, 1)
+    assert state["filter"]["order_pattern"] == "FLASH_*"
+    assert first.acks == [(2, True)]
+
+    # 續跑時沒帶 --order-pattern，還是照 checkpoint 的條件過濾
+    second = FakeDLQChannel(messages[2:])
+    _run_replay(
+        second, monkeypatch, "--batch-size", "2", "--checkpoint", str(checkpoint)
+    )
+    assert [key for key, _ in second.published] == [
+        payment_routing_key("FLASH_2"),
+        "payment_events.dlq",
+    ]
+    assert not checkpoint.exists()
+
+
+def test_dry_run_scans_with_bounded_prefetch_and_keeps_every_message(
+    monkeypatch: Any, capsys: Any
+) -> None:
+    """
+    測試 dry-run 不會一次把整個 DLQ 拉進來：prefetch 有上限，
+    看過的原封不動搬回 DLQ 尾端，confirm 後才 ACK
+    """
+    channel = FakeDLQChannel(
+        [
+            _message("FLASH_1", "rejected", 5),
+            _message("FLASH_2", "rejected", 5),
+            _message("FLASH_3", "rejected", 5),
+        ]
+    )
+    _run_replay(
+        channel, monkeypatch, "--dry-run", *("--prefetch", "2", "--batch-size", "2")
+    )
+
+    assert channel.prefetch == [2]
+    assert [key for key, _ in channel.published] == ["payment_events.dlq"] * 3
+    assert channel.acks == [(2, True), (3, True)]
+    report = capsys.readouterr().out
+    assert "Scanned:  3" in report
+    assert "3  rejected / ConnectionError: Bank API Timeout" in report
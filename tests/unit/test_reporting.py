@@ -0,0 +1,62 @@
+# tests/unit/test_reporting.py
+import csv
+import io
+from datetime import date, datetime, timezone
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from domains.payment.model import PaymentEvent
+from domains.payment.reporting import (
+    EXPORT_COLUMNS,
+    day_ranges,
+    stream_events,
+    write_csv,
+)
+
+
+def test_export_streams_the_date_range_in_batches() -> None:
+    """
+    測試匯出只拿 [from, to) 的資料，一批一批串流 (不會一次全部讀進來)
+    """
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for day, status in ((1, "SUCCESS"), (2, "FAILED"), (2, "SUCCESS"), (3, "X")):
+            session.add(
+                PaymentEvent(
+                    order_id=f"ORDER_{day}_{status}",
+                    amount=100 * day,
+                    status=status,
+                    created_at=datetime(2026, 10, day, 12, tzinfo=timezone.utc),
+                )
+            )
+        session.commit()
+
+    batches = list(
+        stream_events(engine, date(2026, 10, 1), date(2026, 10, 3), fetch_size=2)
+    )
+    assert [len(batch) for batch in batches] == [2, 1]
+
+    out = io.StringIO()
+    assert write_csv(iter(batches), out) == 3
+    rows = list(csv.reader(io.StringIO(out.getvalue())))
+    assert tuple(rows[0]) == EXPORT_COLUMNS
+    assert [row[1] for row in rows[1:]] == [
+        "ORDER_1_SUCCESS",
+        "ORDER_2_FAILED",
+        "ORDER_2_SUCCESS",
+    ]
+
+    only_failed = stream_events(
+        engine, date(2026, 10, 1), date(2026, 10, 3), status="FAILED"
+    )
+    assert [row.order_id for batch in only_failed for row in batch] == [
+        "ORDER_2_FAILED"
+    ]
+    # 只重算有變動的日子，連續的日子併成一段
+    assert day_ranges(
+        [date(2026, 10, 3), date(2026, 10, 1), date(2026, 10, 2), date(2026, 10, 5)]
+    ) == [
+        (date(2026, 10, 1), date(2026, 10, 4)),
+        (date(2026, 10, 5), date(2026, 10, 6)),
+    ]
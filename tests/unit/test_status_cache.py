@@ -0,0 +1,68 @@
+# tests/unit/test_status_cache.py
+import fakeredis
+
+from domains.payment.status_cache import (
+    PENDING_OR_NOT_FOUND,
+    OrderStatusCache,
+    status_version,
+)
+
+
+def make_cache() -> OrderStatusCache:
+    return OrderStatusCache(fakeredis.FakeRedis(decode_responses=True))
+
+
+def test_late_processing_write_cannot_replace_final_status() -> None:
+    """
+    測試較晚抵達的 PROCESSING 不會蓋掉已經寫入的 SUCCESS
+    """
+    cache = make_cache()
+    cache.set("ORDER_1", "SUCCESS")
+
+    written = cache.set("ORDER_1", "PROCESSING")
+
+    assert written is False
+    assert cache.get("ORDER_1") == "SUCCESS"
+
+
+def test_db_backfill_never_overrides_worker_write() -> None:
+    """
+    測試 API 從 DB 回填的舊版本不會蓋掉 Worker 寫入的狀態
+    """
+    cache = make_cache()
+    cache.set("ORDER_2", "PROCESSING")
+
+    cache.set("ORDER_2", "PROCESSING", status_version("PROCESSING", 0))
+
+    assert cache.get("ORDER_2") == "PROCESSING"
+
+
+def test_negative_entry_is_short_lived_and_replaced_by_real_status() -> None:
+    """
+    測試「查不到」只會短暫快取，真正的狀態一寫入就會取代它
+    """
+    client = fakeredis.FakeRedis(decode_responses=True)
+    cache = OrderStatusCache(client, negative_ttl_ms=500)
+
+    cache.set_negative("ORDER_3")
+    assert cache.get("ORDER_3") == PENDING_OR_NOT_FOUND
+    assert 0 < client.pttl("order_status:ORDER_3") <= 500
+
+    cache.set_many([("ORDER_3", "PROCESSING")])
+    assert cache.get("ORDER_3") == "PROCESSING"
+
+
+def test_get_many_returns_none_for_misses_and_backfill_fills_them() -> None:
+    """
+    測試批次查詢：MGET 沒命中的回傳 None，回填後就查得到
+    """
+    cache = make_cache()
+    cache.set("ORDER_4", "SUCCESS")
+
+    assert cache.get_many(["ORDER_4", "ORDER_5"]) == {
+        "ORDER_4": "SUCCESS",
+        "ORDER_5": None,
+    }
+
+    cache.backfill_many([("ORDER_5", PENDING_OR_NOT_FOUND)])
+    assert cache.get_many(["ORDER_5"]) == {"ORDER_5": PENDING_OR_NOT_FOUND}
@@ -0,0 +1,86 @@
+# tests/unit/test_status_stream.py
+import asyncio
+import json
+from typing import Any, List
+
+import fakeredis
+import httpx
+
+from apps.api import main as api
+from domains.payment.status_cache import AsyncOrderStatusCache, OrderStatusCache
+from domains.payment.status_stream import OrderStatusHub
+
+
+def make_hub_and_cache() -> "tuple[OrderStatusHub, OrderStatusCache]":
+    server = fakeredis.FakeServer()
+    hub = OrderStatusHub(fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+    cache = OrderStatusCache(fakeredis.FakeRedis(server=server, decode_responses=True))
+    return hub, cache
+
+
+async def wait_for_subscribers(hub: OrderStatusHub, count: int) -> None:
+    for _ in range(100):
+        if hub.subscribed_orders >= count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("subscriber never registered")
+
+
+async def test_hub_fans_out_one_channel_per_order_and_unsubscribes() -> None:
+    """
+    測試同一筆訂單的多個訂閱者共用一個 channel，都收得到；全部離開後退訂
+    """
+    hub, cache = make_hub_and_cache()
+    async with (
+        hub.subscribe(["A", "B"]) as first,
+        hub.subscribe(["A"]) as second,
+    ):
+        assert hub.subscribed_orders == 2
+        cache.set_many([("A", "PROCESSING"), ("B", "SUCCESS")])
+        # 比快取舊的狀態不會寫入，也不會推出去
+        cache.set("A", "PENDING_OR_NOT_FOUND")
+
+        got = [await asyncio.wait_for(first.get(), 2) for _ in range(2)]
+        assert sorted(got) == [("A", "PROCESSING"), ("B", "SUCCESS")]
+        assert await asyncio.wait_for(second.get(), 2) == ("A", "PROCESSING")
+        await asyncio.sleep(0.05)
+        assert second.empty()
+
+    assert hub.subscribed_orders == 0
+    await hub.close()
+
+
+async def test_stream_endpoint_pushes_until_orders_are_final(monkeypatch: Any) -> None:
+    """
+    測試 SSE 先送現況，Worker 更新狀態時推送，全部到最終狀態就結束
+    """
+    hub, cache = make_hub_and_cache()
+    monkeypatch.setattr(api, "status_hub", hub)
+    # API 讀同一個 (fake) Redis，狀態由 cache (Worker 那一側) 寫入
+    monkeypatch.setattr(api, "status_cache", AsyncOrderStatusCache(hub.client))
+    cache.set("STREAM_1", "PROCESSING")
+    cache.set("STREAM_2", "SUCCESS")
+
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=api.app), base_url="http://api"
+    )
+    request = asyncio.create_task(
+        client.get("/orders/stream?order_id=STREAM_1&order_id=STREAM_2")
+    )
+    await wait_for_subscribers(hub, 2)
+    cache.set("STREAM_1", "FAILED")
+    resp = await asyncio.wait_for(request, 5)
+
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events: List[Any] = [
+        json.loads(line.removeprefix("data: "))
+        for line in resp.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert [(e["order_id"], e["status"], e["source"]) for e in events] == [
+        ("STREAM_1", "PROCESSING", "redis"),
+        ("STREAM_2", "SUCCESS", "redis"),
+        ("STREAM_1", "FAILED", "push"),
+    ]
+    assert hub.subscribed_orders == 0
+    await hub.close()
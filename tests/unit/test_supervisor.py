@@ -0,0 +1,14 @@
+# tests/unit/test_supervisor.py
+from apps.worker.supervisor import desired_workers
+
+
+def test_desired_workers_scales_with_backlog_within_bounds() -> None:
+    """
+    測試 worker 數量跟著積壓量擴縮，但不會超出 min / max
+    """
+    # 沒有積壓 -> 維持最少數量
+    assert desired_workers(0, minimum=2, maximum=8, per_worker=500) == 2
+    # 1200 筆 / 每個 worker 500 筆 -> 需要 3 個
+    assert desired_workers(1200, minimum=2, maximum=8, per_worker=500) == 3
+    # 閃購尖峰 -> 封頂在 max
+    assert desired_workers(100_000, minimum=2, maximum=8, per_worker=500) == 8
@@ -0,0 +1,43 @@
+# tests/unit/test_telemetry.py
+import time
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from opentelemetry.trace import Status, StatusCode
+
+from core.telemetry import TailSamplingSpanProcessor
+
+
+def make_tracer(exporter: InMemorySpanExporter) -> TracerProvider:
+    provider = TracerProvider()
+    provider.add_span_processor(
+        TailSamplingSpanProcessor(
+            SimpleSpanProcessor(exporter), keep_ratio=0.0, latency_threshold_ms=20
+        )
+    )
+    return provider
+
+
+def test_tail_sampling_keeps_only_error_and_slow_traces() -> None:
+    """
+    測試 keep_ratio=0 時，正常的 trace 全丟，出錯 / 太慢的整個 trace 保留
+    """
+    exporter = InMemorySpanExporter()
+    tracer = make_tracer(exporter).get_tracer(__name__)
+
+    with tracer.start_as_current_span("fast"):
+        with tracer.start_as_current_span("fast-child"):
+            pass
+
+    with tracer.start_as_current_span("failed"):
+        with tracer.start_as_current_span("failed-child") as child:
+            child.set_status(Status(StatusCode.ERROR))
+
+    with tracer.start_as_current_span("slow"):
+        time.sleep(0.03)
+
+    names = sorted(span.name for span in exporter.get_finished_spans())
+    assert names == ["failed", "failed-child", "slow"]
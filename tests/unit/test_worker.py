@@ -1,38 +1,161 @@
 # tests/unit/test_worker.py
+import json
+import threading
+import time
+from typing import Any, Dict, List, Tuple
 from unittest.mock import MagicMock, patch
 
-from apps.worker.main import process_message
+import fakeredis
+
+from apps.worker.main import (
+    consume_concurrently,
+    ensure_partitions_periodically,
+    order_lane,
+    process_message,
+    refresh_summaries_once,
+)
+from core.config import RETRY_DELAYS_MS
+from core.messaging import RETRY_COUNT_HEADER
+
+
+def make_delivery(retry_count: int = 0) -> Tuple[MagicMock, MagicMock]:
+    mock_method = MagicMock()
+    mock_method.delivery_tag = 1  # 假裝這是第一筆訊息
+    mock_method.routing_key = "payment_events"
+    mock_properties = MagicMock()
+    mock_properties.headers = {RETRY_COUNT_HEADER: retry_count} if retry_count else {}
+    mock_properties.content_type = "application/json"
+    return mock_method, mock_properties
 
 
 def test_worker_handles_unknown_exception_by_nacking() -> None:
     """
-    測試當發生未知錯誤時，Worker 是否會發送 NACK 並拒絕 Requeue (送入 DLQ)
+    測試當發生未知錯誤且重試次數用完時，Worker 是否會發送 NACK 並拒絕 Requeue (送入 DLQ)
     """
 
     # 1. Mock RabbitMQ 的 channel
     mock_channel = MagicMock()
-    mock_method = MagicMock()
-    mock_method.delivery_tag = 1  # 假裝這是第一筆訊息
+    mock_method, mock_properties = make_delivery(retry_count=len(RETRY_DELAYS_MS))
 
     # 2. 準備測試資料
     body = b'{"order_id": "TEST_FAIL", "amount": 100, "status": "PENDING"}'
 
-    # 3. 【關鍵】Mock 掉 DB Session，讓它故意報錯！
-    # 我們不改 source code，而是用 patch 把 Session 替換成一個會爆炸的假物件
-    with patch("apps.worker.main.Session") as mock_session:
-        # 設定：當程式呼叫 session.commit() 時，拋出 Exception
-        mock_session.return_value.__enter__.return_value.commit.side_effect = Exception(
-            "DB Is Dead"
-        )
+    # 3. 【關鍵】Mock 掉 Service，讓它故意報錯！
+    with (
+        patch("apps.worker.main.redis_client"),
+        patch("apps.worker.main.payment_service") as mock_service,
+    ):
+        mock_service.process_payment.side_effect = Exception("DB Is Dead")
 
         # 4. 執行被測函式
-        process_message(mock_channel, mock_method, None, body)
+        process_message(mock_channel, mock_method, mock_properties, body)
 
         # 5. 驗證結果 (Assert)
-        # 驗證 basic_nack 是否被呼叫
-        mock_channel.basic_nack.assert_called_once()
-
         # 驗證參數是否正確：requeue=False (這代表會進 DLQ)
-        mock_channel.basic_nack.assert_called_with(delivery_tag=1, requeue=False)
+        mock_channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=False)
+        mock_channel.basic_publish.assert_not_called()
+
+
+def test_worker_retries_transient_errors_with_backoff() -> None:
+    """
+    測試暫時性錯誤會丟進延遲重試佇列 (帶上重試次數)，而不是直接進 DLQ
+    """
+    mock_channel = MagicMock()
+    mock_method, mock_properties = make_delivery()
+    body = b'{"order_id": "TEST_RETRY", "amount": 100, "status": "PENDING"}'
+
+    with (
+        patch("apps.worker.main.redis_client"),
+        patch("apps.worker.main.payment_service") as mock_service,
+    ):
+        mock_service.process_payment.side_effect = ConnectionError("Bank down")
+
+        process_message(mock_channel, mock_method, mock_properties, body)
+
+    mock_channel.basic_nack.assert_not_called()
+    mock_channel.basic_ack.assert_called_once_with(delivery_tag=1)
+
+    publish = mock_channel.basic_publish.call_args.kwargs
+    assert publish["routing_key"] == f"payment_events.retry.{RETRY_DELAYS_MS[0]}ms"
+    assert publish["properties"].headers[RETRY_COUNT_HEADER] == 1
+    assert int(publish["properties"].expiration) <= RETRY_DELAYS_MS[0]
+
+
+def test_worker_sends_malformed_messages_straight_to_dlq() -> None:
+    """
+    測試格式錯誤 (永久性錯誤) 不會重試，直接進 DLQ
+    """
+    mock_channel = MagicMock()
+    mock_method, mock_properties = make_delivery()
+
+    with patch("apps.worker.main.redis_client"):
+        process_message(mock_channel, mock_method, mock_properties, b"not json")
+
+    mock_channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=False)
+    mock_channel.basic_publish.assert_not_called()
+
+
+def test_worker_keeps_creating_partitions_while_running() -> None:
+    """
+    測試 worker 跑著的時候定期補建 partition，失敗也不會讓迴圈停掉
+    """
+    with (
+        patch("apps.worker.main.wait_while_running", side_effect=[True, True, False]),
+        patch(
+            "apps.worker.main.ensure_partitions", side_effect=[RuntimeError("db"), 1]
+        ) as ensure,
+    ):
+        ensure_partitions_periodically()
+    assert ensure.call_count == 2
+
+
+def test_only_one_worker_refreshes_summaries_per_interval() -> None:
+    """
+    測試多個 worker 同一個間隔只有一個去重算彙總 (其他的看到 Redis 節流 key 就跳過)
+    """
+    with (
+        patch("apps.worker.main.redis_client", fakeredis.FakeRedis()),
+        patch("apps.worker.main.refresh_changed_summaries", return_value=[]) as refresh,
+    ):
+        refresh_summaries_once()
+        refresh_summaries_once()
+    assert refresh.call_count == 1
+
+
+def test_partition_consumer_keeps_each_order_in_sequence() -> None:
+    """
+    測試 partition 模式併發處理時，同一筆訂單的事件在同一個 thread 上
+    照收到的順序處理，不同訂單還是分散到不同 lane
+    """
+    deliveries: List[Any] = []
+    for step in range(3):
+        for order_id in ("ORDER_A", "ORDER_B", "ORDER_C", "ORDER_D"):
+            method = MagicMock(delivery_tag=len(deliveries) + 1)
+            properties = MagicMock(headers={}, content_type="application/json")
+            body = json.dumps(
+                {"order_id": order_id, "amount": 100 + step, "status": "PENDING"}
+            ).encode()
+            deliveries.append((method, properties, body))
+    channel = MagicMock()
+    channel.consume.return_value = iter(deliveries)
+
+    seen: Dict[str, List[Tuple[int, str]]] = {}
+    lock = threading.Lock()
+
+    def record(ch: Any, method: Any, properties: Any, body: bytes) -> None:
+        payload = json.loads(body)
+        # 先到的那筆慢一點，沒有照順序的話後面那筆會插隊
+        time.sleep(0.02 if payload["amount"] == 100 else 0)
+        with lock:
+            seen.setdefault(payload["order_id"], []).append(
+                (payload["amount"], threading.current_thread().name)
+            )
+
+    with patch("apps.worker.main.process_message", side_effect=record):
+        consume_concurrently(MagicMock(), channel, "payment_events.p0", 4, ordered=True)
 
-        print("\n✅ Test Passed: Worker correctly NACKed the failed message.")
+    for events in seen.values():
+        assert [amount for amount, _ in events] == [100, 101, 102]
+        assert len({thread for _, thread in events}) == 1
+    lanes = {order_lane(body, p, 4) for _, p, body in deliveries}
+    assert len(lanes) > 1